@@ -1,19 +1,175 @@
 """Main script, uses other modules to generate sentences."""
-from flask import Flask, render_template, request, redirect
+import time
+
+# Timed from the very first import, so the startup report includes importing Flask and the other modules
+_import_started = time.perf_counter()
+
+from flask import Flask, Response, jsonify, render_template, request, redirect
 import twitter
-import markov_chain_second as markov
-import random
+import markov_array as markov
+import metrics
+import novelty
+import profiling
+from sampling import make_rng, numpy
+from sentence_pool import SentencePool
+from tweet_queue import TweetQueue
+from worker_memory import resident_memory
+from contextlib import contextmanager
 import json
+import os
+import random
 import re
+import threading
 
 app = Flask(__name__)
+if profiling.ENABLED:
+    # Let ?profile=pstats or ?profile=collapsed on any page return the profile of that request
+    app.wsgi_app = profiling.ProfilerMiddleware(app.wsgi_app)
+
+# Most sentences one /stream request can ask for
+MAX_STREAM_SENTENCES = 10000
+
+# Pre-processed tokens, and the binary snapshot of the chain of each order built from them
+CORPUS_PATH = 'cleaned_tokens.json'
+SNAPSHOT_PATH = 'cleaned_tokens.order{}.chain'
+
+# Chain orders /api/sentences can use, and its limits
+API_ORDERS = (1, 2, 3, 4)
+MAX_API_SENTENCES = 1000
+MAX_API_STREAM_SENTENCES = 1000000
+MAX_API_LENGTH = 100
+# Sentences generated together by the streaming API before they are sent
+API_BATCH_SIZE = 1000
+
+# Longest run of corpus words a tweet may repeat verbatim, and how many sentences to try for one
+MAX_TWEET_OVERLAP = 8
+TWEET_ATTEMPTS = 20
+
+# Most tweets waiting to be posted, and how many times to retry each one
+TWEET_QUEUE_SIZE = int(os.environ.get('TWEET_QUEUE_SIZE', '100'))
+TWEET_RETRIES = int(os.environ.get('TWEET_RETRIES', '5'))
+
+# Sentences kept ready for the home page, and the most the background thread makes per second (0 for no limit)
+SENTENCE_POOL_DEPTH = int(os.environ.get('SENTENCE_POOL_DEPTH', '64'))
+SENTENCE_POOL_RATE = float(os.environ.get('SENTENCE_POOL_RATE', '0')) or None
+
+# Load the chain on first use or in warmup, instead of while importing this module. Set LAZY_INIT=0
+# to load it at import as before.
+LAZY_INIT = os.environ.get('LAZY_INIT', '1') == '1'
+
+# Seconds spent in each startup phase, in the order they first ran
+startup_timings = {}
+
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the with block to the phase's entry in startup_timings."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[phase] = startup_timings.get(phase, 0.0) + time.perf_counter() - started
+
+
+def startup_report() -> str:
+    """Return startup_timings as one line per phase, slowest first."""
+    phases = sorted(startup_timings.items(), key=lambda item: item[1], reverse=True)
+    return '\n'.join('{:<28} {:8.1f} ms'.format(phase, seconds * 1000) for phase, seconds in phases)
+
+
+def load_markov_chain(order=2):
+    """Load the chain of the given order from its snapshot if it matches the corpus, otherwise build and save it."""
+    snapshot_path = SNAPSHOT_PATH.format(order)
+    with timed('load snapshot (order {})'.format(order)):
+        fingerprint = markov.corpus_fingerprint(CORPUS_PATH)
+        try:
+            return markov.load_markov_chain(snapshot_path, fingerprint)
+        except (OSError, ValueError):
+            pass  # Missing or stale snapshot, so rebuild it below
+
+    # Load the pre-processed tokens
+    with timed('read corpus'):
+        with open(CORPUS_PATH, 'r', encoding='utf-8') as f:
+            cleaned_tokens = json.load(f)
+
+    # Build a Markov chain from the cleaned tokens
+    with timed('build chain (order {})'.format(order)):
+        markov_chain = markov.build_markov_chain(cleaned_tokens, order=order)
+    with timed('save snapshot (order {})'.format(order)):
+        try:
+            markov.save_markov_chain(markov_chain, snapshot_path, fingerprint)
+        except OSError:
+            pass  # A read-only deploy still works, it just rebuilds on every start
+    return markov_chain
+
+
+# Time spent in each phase of generating a sentence: choosing the start state, walking the chain and
+# capitalizing it. Unseeded pages take their sentence from the pool, so most of these are timed on the
+# sentence pool's background thread, not in a request.
+generation_latency = metrics.Histogram('markov_generation_seconds',
+                                       'Time spent generating a sentence, by phase, mostly on the sentence pool thread.')
+
+# Time spent in each phase of a home page request: taking a sentence from the pool, or generating a
+# seeded one, and rendering the template
+request_latency = metrics.Histogram('markov_request_seconds', 'Time spent handling a home page request, by phase.')
+
+# Chain of each order, each loaded by warmup or the first request for it
+_chains = {}
+_chains_lock = threading.Lock()
+
+# Suffix array of the corpus, built by warmup or, failing that, the first tweet the queue makes
+_novelty_index = None
+_novelty_lock = threading.Lock()
+
+# Each thread keeps its own generator, so threaded workers never share random state
+_thread_state = threading.local()
+
+
+def get_rng():
+    """Return this thread's random generator. Forked workers start from a copy of the master's
+    generator, so a generator made in another process is replaced with a freshly seeded one."""
+    pid, rng = getattr(_thread_state, 'rng', (None, None))
+    if pid != os.getpid():
+        rng = random.Random()
+        _thread_state.rng = (os.getpid(), rng)
+    return rng
+
+
+def request_seed():
+    """Return the ?seed= argument as an integer, or None if there is none, raising ValueError if it is
+    not an integer. type=int would treat such a seed as no seed, and return unseeded output."""
+    seed = request.args.get('seed')
+    if seed is None:
+        return None
+    try:
+        return int(seed)
+    except ValueError:
+        raise ValueError('seed must be an integer') from None
+
+
+def request_rng():
+    """Return a generator seeded with the ?seed= argument, which replays the same output for the same
+    seed, or this thread's generator when there is no seed. Raises ValueError if the seed is not an integer."""
+    seed = request_seed()
+    if seed is None:
+        return get_rng()
+    return random.Random(seed)
+
+
+def text_error(error):
+    """Return a 400 response with the error message as plain text."""
+    return Response(str(error) + '\n', status=400, mimetype='text/plain')
 
-# Load the pre-processed tokens
-with open('cleaned_tokens.json', 'r', encoding='utf-8') as f:
-    cleaned_tokens = json.load(f)
 
-# Build a Markov chain from the cleaned tokens
-markov_chain = markov.build_second_order_markov_chain(cleaned_tokens)
+def get_chain(order=2):
+    """Return the chain of the given order, loading it on first use."""
+    markov_chain = _chains.get(order)
+    if markov_chain is None:
+        with _chains_lock:
+            markov_chain = _chains.get(order)
+            if markov_chain is None:
+                markov_chain = _chains[order] = load_markov_chain(order)
+    return markov_chain
 
 
 def capitalize_sentences(text):
@@ -31,30 +187,212 @@ def capitalize_sentences(text):
     return ''.join(capitalized_sentences)
 
 
-def generate_sentence():
+def generate_sentence(rng=None):
+    if rng is None:
+        rng = get_rng()
+    markov_chain = get_chain()
     if markov_chain:
-        start_pair = random.choice(list(markov_chain.keys()))
-        raw_sentence = markov.random_walk(markov_chain, start_pair, 30)
-        return capitalize_sentences(raw_sentence)
+        started = time.perf_counter()
+        start_pair = markov_chain.sample_start(rng)
+        chosen = time.perf_counter()
+        raw_sentence = markov.random_walk(markov_chain, start_pair, 30, rng)
+        walked = time.perf_counter()
+        sentence = capitalize_sentences(raw_sentence)
+        capitalized = time.perf_counter()
+        generation_latency.observe('start', chosen - started)
+        generation_latency.observe('walk', walked - chosen)
+        generation_latency.observe('capitalize', capitalized - walked)
+        return sentence
     else:
         return "No sentences generated."
 
 
+def get_novelty_index():
+    """Return the suffix array index of the corpus, building it on first use if warmup has not."""
+    global _novelty_index
+    if _novelty_index is None:
+        with _novelty_lock:
+            if _novelty_index is None:
+                with timed('build novelty index'):
+                    with open(CORPUS_PATH, 'r', encoding='utf-8') as f:
+                        _novelty_index = novelty.SuffixArrayIndex(json.load(f))
+    return _novelty_index
+
+
+def generate_novel_sentence(rng=None):
+    """Return a sentence that copies at most MAX_TWEET_OVERLAP words in a row from the corpus,
+    or None if none of TWEET_ATTEMPTS sentences is novel enough."""
+    if rng is None:
+        rng = get_rng()
+    markov_chain = get_chain()
+    if not markov_chain:
+        return None
+    index = get_novelty_index()
+    for _ in range(TWEET_ATTEMPTS):
+        words = markov_chain.walk(markov_chain.sample_start(rng), 30, rng)
+        if index.is_novel(words, MAX_TWEET_OVERLAP):
+            return capitalize_sentences(markov.format_sentence(words))
+    return None
+
+
+# Filled by a background thread in each worker, started by the first request that takes a sentence
+sentence_pool = SentencePool(generate_sentence, SENTENCE_POOL_DEPTH, SENTENCE_POOL_RATE)
+
+
 @app.route("/")
 def home():
-    sentence = generate_sentence()
-    return render_template('index.html', sentence=sentence)
+    if 'seed' in request.args:
+        try:
+            rng = request_rng()
+        except ValueError as error:
+            return text_error(error)
+        # A seeded sentence has to be generated from its own generator to replay exactly
+        with request_latency.time('generate'):
+            sentence = generate_sentence(rng)
+    else:
+        with request_latency.time('pool'):
+            sentence = sentence_pool.get()
+    with request_latency.time('render'):
+        return render_template('index.html', sentence=sentence)
+
+
+@app.route("/pool")
+def pool():
+    """Return the sentence pool's depth, size and hit and miss counts as JSON."""
+    return jsonify(sentence_pool.stats())
+
+
+@app.route("/stream")
+def stream():
+    """Stream ?sentences= sentences as plain text, sending each one as soon as it is generated.
+    The same ?seed= streams the same sentences."""
+    count = min(request.args.get('sentences', default=10, type=int), MAX_STREAM_SENTENCES)
+    try:
+        rng = request_rng()
+    except ValueError as error:
+        return text_error(error)
+    sentences = markov.stream_sentences(get_chain(), max_sentences=max(count, 0), rng=rng)
+    return Response((capitalize_sentences(sentence) + '\n' for sentence in sentences),
+                    mimetype='text/plain')
+
+
+def api_arguments(max_sentences):
+    """Read n, length, order and seed from the query string, raising ValueError if one is out of range.
+    Returns the number of sentences, their length, the chain and the generator to walk it with."""
+    count = request.args.get('n', default=10, type=int)
+    length = request.args.get('length', default=30, type=int)
+    order = request.args.get('order', default=2, type=int)
+    seed = request_seed()
+    if not 1 <= count <= max_sentences:
+        raise ValueError('n must be between 1 and {}'.format(max_sentences))
+    if order not in API_ORDERS:
+        raise ValueError('order must be one of {}'.format(', '.join(map(str, API_ORDERS))))
+    if not order < length <= MAX_API_LENGTH:
+        raise ValueError('length must be more than order and at most {}'.format(MAX_API_LENGTH))
+    # Every request gets its own generator, so the same seed gives the same sentences
+    rng = make_rng(seed, counter_based=numpy is not None)
+    return count, length, get_chain(order), rng
+
+
+def api_error(error):
+    """Return a 400 response with the error message as JSON."""
+    return Response(json.dumps({'error': str(error)}), status=400, mimetype='application/json')
+
+
+
+@app.route('/api/sentences')
+def api_sentences():
+    """Return ?n= sentences of at most ?length= words from the chain of ?order= as a JSON list.
+    The same ?seed= returns the same sentences."""
+    try:
+        count, length, markov_chain, rng = api_arguments(MAX_API_SENTENCES)
+    except ValueError as error:
+        return api_error(error)
+    sentences = markov.random_walk_many(markov_chain, count, length, rng)
+    body = json.dumps({'order': markov_chain.order, 'sentences': sentences}, separators=(',', ':'))
+    return Response(body, mimetype='application/json')
+
+
+@app.route('/api/sentences/stream')
+def api_sentences_stream():
+    """Stream sentences like /api/sentences as newline-delimited JSON, one string per line, generating
+    API_BATCH_SIZE at a time so a large ?n= never has to fit in memory."""
+    try:
+        count, length, markov_chain, rng = api_arguments(MAX_API_STREAM_SENTENCES)
+    except ValueError as error:
+        return api_error(error)
+
+    def lines():
+        for first in range(0, count, API_BATCH_SIZE):
+            batch = markov.random_walk_many(markov_chain, min(API_BATCH_SIZE, count - first), length, rng)
+            yield ''.join(json.dumps(sentence) + '\n' for sentence in batch)
+
+    return Response(lines(), mimetype='application/x-ndjson')
+
+
+# Posts tweets from a background thread in each worker, so /tweet never waits on the API
+tweet_queue = TweetQueue(twitter.publish, TWEET_QUEUE_SIZE, max_retries=TWEET_RETRIES)
 
 
 @app.route('/tweet', methods=['POST'])
 def tweet():
-    status = generate_sentence()  # Generate a new sentence for tweeting
-    twitter.tweet(status)
+    # The queue's thread generates a new sentence for tweeting, skipping any that plagiarize the corpus,
+    # so the request returns without walking the chain or checking the corpus
+    tweet_queue.submit(generate_novel_sentence)
     return redirect('/')
 
 
+@app.route('/tweet/queue')
+def tweet_queue_stats():
+    """Return the tweet queue's depth, counts and latency as JSON."""
+    return jsonify(tweet_queue.stats())
+
+
+@app.route('/metrics')
+def metrics_page():
+    """Return this worker's generation and request latency, chain sizes, memory, sentence pool, tweet queue and
+    startup timings in the Prometheus text format. Each worker counts its own requests, so a scrape sees one worker."""
+    lines = [generation_latency.lines(), request_latency.lines(), metrics.chain_metrics(dict(_chains))]
+    try:
+        lines.append(metrics.gauge('process_resident_memory_bytes', 'Resident memory of this worker in bytes.',
+                                   resident_memory()['rss'] * 1024))
+    except OSError:
+        pass  # /proc is only there on Linux
+    lines.append(metrics.stats_metrics('sentence_pool', sentence_pool.stats(), ('hits', 'misses', 'generated')))
+    lines.append(metrics.stats_metrics('tweet_queue', tweet_queue.stats(),
+                                       ('submitted', 'dropped', 'published', 'failed', 'skipped', 'retries')))
+    if profiling.ENABLED:
+        function_counters = sorted(profiling.counters().items())
+        lines.append(metrics.gauge('profiled_calls_total', 'Calls of each profiled function.',
+                                   {(('function', key),): calls for key, (calls, _) in function_counters},
+                                   'counter'))
+        lines.append(metrics.gauge('profiled_seconds_total', 'Cumulative time in each profiled function.',
+                                   {(('function', key),): seconds for key, (_, seconds) in function_counters},
+                                   'counter'))
+    lines.append(metrics.gauge('app_startup_seconds', 'Time spent in each startup phase.',
+                               {(('phase', phase),): seconds for phase, seconds in startup_timings.items()}))
+    return Response(metrics.render(*lines), mimetype='text/plain; version=0.0.4')
+
+
+def warmup(orders=(2,)):
+    """Load the chains of the given orders and the novelty index now rather than on the first request, and
+    log the startup report. Called by gunicorn before it forks the workers, or by each worker when the app
+    is not preloaded."""
+    for order in orders:
+        get_chain(order)
+    get_novelty_index()
+    app.logger.info('Startup timings:\n%s', startup_report())
+
+
+startup_timings['import app'] = time.perf_counter() - _import_started
+
+if not LAZY_INIT:
+    warmup()
+
+
 if __name__ == "__main__":
     """To run the Flask server, execute `python app.py` in your terminal.
        To learn more about Flask's DEBUG mode, visit
        https://flask.palletsprojects.com/en/2.0.x/server/#in-code"""
+    warmup()
     app.run(debug=True)
@@ -0,0 +1,115 @@
+#!python
+
+from unittest import mock
+import importlib.util
+import json
+import unittest
+
+if importlib.util.find_spec('flask') is not None:
+    import app
+    import markov_array
+
+
+@unittest.skipIf(importlib.util.find_spec('flask') is None, 'Flask is not installed')
+class AppTest(unittest.TestCase):
+
+    # Test fixtures: a tiny corpus with a few repeated word pairs
+    words = ('one fish two fish red fish blue fish one fish two fish '
+             'red fish. blue fish? one fish').split()
+
+    def setUp(self):
+        # Serve chains of the tiny corpus instead of loading the real one
+        self.chains = dict(app._chains)
+        for order in app.API_ORDERS:
+            app._chains[order] = markov_array.build_markov_chain(self.words * 3, order=order)
+        self.client = app.app.test_client()
+
+    def tearDown(self):
+        app._chains.clear()
+        app._chains.update(self.chains)
+
+    def get_sentences(self, query):
+        response = self.client.get('/api/sentences?' + query)
+        assert response.status_code == 200
+        assert response.mimetype == 'application/json'
+        return response.get_json()
+
+    def test_sentences(self):
+        body = self.get_sentences('n=5&length=8&order=3')
+        assert body['order'] == 3
+        assert len(body['sentences']) == 5
+        for sentence in body['sentences']:
+            assert 1 <= len(sentence.split()) <= 8
+        # The defaults
+        body = self.get_sentences('')
+        assert body['order'] == 2
+        assert len(body['sentences']) == 10
+
+    def test_seed_replays(self):
+        first = self.get_sentences('n=20&seed=7')
+        assert self.get_sentences('n=20&seed=7') == first
+        assert self.get_sentences('n=20&seed=8') != first
+
+    def test_bad_arguments(self):
+        for query in ('n=0', 'order=5', 'length=2', 'length=101', 'seed=abc', 'seed=1.5'):
+            for path in ('/api/sentences', '/api/sentences/stream'):
+                response = self.client.get('{}?{}'.format(path, query))
+                assert response.status_code == 400, query
+                assert 'error' in response.get_json()
+        response = self.client.get('/api/sentences?seed=abc')
+        assert response.get_json() == {'error': 'seed must be an integer'}
+        # The streaming API allows many more sentences
+        assert self.client.get('/api/sentences?n=1001').status_code == 400
+        assert self.client.get('/api/sentences/stream?n=1001').status_code == 200
+        assert self.client.get('/api/sentences/stream?n=1000001').status_code == 400
+
+    def test_metrics(self):
+        assert self.client.get('/?seed=5').status_code == 200
+        body = self.client.get('/metrics').get_data(as_text=True)
+        # The request's own phases are apart from the generation phases
+        assert 'markov_request_seconds_count{phase="generate"}' in body
+        assert 'markov_request_seconds_count{phase="render"}' in body
+        assert 'markov_generation_seconds_count{phase="walk"}' in body
+        assert 'markov_chain_states{order="2"}' in body
+
+    def test_seed_must_be_an_integer(self):
+        # The same rule as the API's for the home page and /stream
+        for path in ('/?seed=abc', '/stream?seed=abc', '/stream?seed=1.5'):
+            response = self.client.get(path)
+            assert response.status_code == 400, path
+            assert response.get_data(as_text=True) == 'seed must be an integer\n'
+        assert self.client.get('/?seed=7').get_data() == self.client.get('/?seed=7').get_data()
+        first = self.client.get('/stream?seed=7&sentences=5').get_data(as_text=True)
+        assert len(first.splitlines()) == 5
+        assert self.client.get('/stream?seed=7&sentences=5').get_data(as_text=True) == first
+
+    def test_tweet_returns_at_once(self):
+        with mock.patch.object(app, 'get_novelty_index') as get_novelty_index, \
+                mock.patch.object(app.tweet_queue, 'submit') as submit:
+            response = self.client.post('/tweet')
+        assert response.status_code == 302
+        # The sentence is generated and checked on the queue's thread, not in the request
+        submit.assert_called_once_with(app.generate_novel_sentence)
+        get_novelty_index.assert_not_called()
+
+    def test_warmup_builds_novelty_index(self):
+        with mock.patch.object(app, 'get_novelty_index') as get_novelty_index:
+            app.warmup(orders=(2, 3))
+        get_novelty_index.assert_called_once_with()
+
+    def test_stream(self):
+        count = app.API_BATCH_SIZE * 2 + 5  # More than one batch, and a partial one
+        response = self.client.get('/api/sentences/stream?n={}&length=6&seed=3'.format(count))
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        lines = response.get_data(as_text=True).splitlines()
+        assert len(lines) == count
+        sentences = [json.loads(line) for line in lines]
+        assert all(isinstance(sentence, str) and 1 <= len(sentence.split()) <= 6 for sentence in sentences)
+        # The same seed streams the same sentences
+        replay = self.client.get('/api/sentences/stream?n={}&length=6&seed=3'.format(count))
+        assert replay.get_data(as_text=True).splitlines() == lines
+
+
+if __name__ == '__main__':
+    unittest.main()
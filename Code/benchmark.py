@@ -0,0 +1,239 @@
+"""Benchmarks building, walking and sampling every Markov chain engine on synthetic Zipfian corpora."""
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from dictogram import Dictogram
+import markov_array
+import markov_backoff
+import markov_chain_second
+import markov_trie
+from sampling import WeightedChoice
+
+# Builder of each engine, called with (word_list, order)
+ENGINES = {
+    'dict': markov_chain_second.build_markov_chain,
+    'array': markov_array.build_markov_chain,
+    'trie': markov_trie.build_trie_markov_chain,
+    'backoff': markov_backoff.build_backoff_markov_chain,
+}
+
+# Fields that identify one measurement, so runs can be compared with a baseline
+RESULT_KEY = ('benchmark', 'engine', 'order', 'tokens')
+
+# Results of a run with the default arguments, committed to compare new runs with
+BASELINE_PATH = 'benchmark_baseline.json'
+
+
+def zipf_corpus(tokens: int, vocab_size=50000, exponent=1.1, sentence_every=12, seed=0, chunk_size=100000):
+    """
+    Generate a synthetic corpus whose word frequencies follow Zipf's law, like natural text.
+
+    Args:
+        tokens (int): Number of words to generate.
+        vocab_size (int, optional): Number of distinct words. Defaults to 50,000.
+        exponent (float, optional): Zipf exponent, the word of rank r has weight 1 / r ** exponent. Defaults to 1.1.
+        sentence_every (int, optional): Every word whose rank is a multiple of this ends with a period,
+            so the corpus has sentence starts. Defaults to 12.
+        seed (optional): Seed of the generator, the same seed gives the same corpus. Defaults to 0.
+        chunk_size (int, optional): Number of words drawn at once. Defaults to 100,000.
+
+    Yields:
+        str: Each word of the corpus, in order.
+    """
+    vocab = ['w{}{}'.format(rank, '.' if rank % sentence_every == 0 else '')
+             for rank in range(1, vocab_size + 1)]
+    # Integer weights, so the running totals stay exact
+    weights = [max(1, round(10 ** 9 / rank ** exponent)) for rank in range(1, vocab_size + 1)]
+    choice = WeightedChoice(vocab, weights)
+    rng = random.Random(seed)
+    remaining = tokens
+    while remaining > 0:
+        yield from choice.sample_many(min(chunk_size, remaining), rng)
+        remaining -= chunk_size
+
+
+def best_time(function, repeat=3) -> float:
+    """Return the fastest of repeat calls of function, in seconds, with the garbage collector off."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return min(times)
+
+
+def retained_memory(function) -> tuple:
+    """Return the result of function and the bytes it still holds once it returns."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = function()
+        memory, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, memory
+
+
+def benchmark_build(word_list: list, engine: str, order: int, repeat=3) -> tuple:
+    """Return the result of building one engine's chain and the chain itself."""
+    builder = ENGINES[engine]
+    seconds = best_time(lambda: builder(word_list, order), repeat)
+    markov_chain, memory = retained_memory(lambda: builder(word_list, order))
+    result = {'benchmark': 'build', 'engine': engine, 'order': order, 'tokens': len(word_list),
+              'seconds': seconds, 'tokens_per_second': len(word_list) / seconds,
+              'memory_bytes': memory, 'states': len(markov_chain)}
+    return result, markov_chain
+
+
+def benchmark_walk(markov_chain, engine: str, tokens: int, walks=1000, length=30, repeat=3) -> dict:
+    """Return the result of walking from walks start states drawn from a chain, up to length words each."""
+    rng = random.Random(0)
+    starts = [markov_chain.sample_start(rng) for _ in range(walks)]
+    words = sum(len(markov_chain.walk(start_words, length, rng=rng)) for start_words in starts)
+
+    def walk_all():
+        for start_words in starts:
+            markov_chain.walk(start_words, length, rng=rng)
+
+    seconds = best_time(walk_all, repeat)
+    return {'benchmark': 'walk', 'engine': engine, 'order': markov_chain.order, 'tokens': tokens,
+            'seconds': seconds, 'tokens_per_second': words / seconds, 'walks': walks}
+
+
+def benchmark_sample(word_list: list, draws=100000, repeat=3) -> list:
+    """Return the results of drawing words from the histogram of a corpus one at a time and in one batch."""
+    histogram = Dictogram(word_list)
+    rng = random.Random(0)
+
+    def sample_one_at_a_time():
+        for _ in range(draws):
+            histogram.sample(rng)
+
+    results = []
+    for benchmark, function in (('sample', sample_one_at_a_time),
+                                ('sample_many', lambda: histogram.sample_many(draws))):
+        function()  # Build the sampling tables before timing
+        seconds = best_time(function, repeat)
+        results.append({'benchmark': benchmark, 'engine': 'dictogram', 'order': 0,
+                        'tokens': len(word_list), 'seconds': seconds,
+                        'tokens_per_second': draws / seconds, 'types': histogram.types})
+    return results
+
+
+def run_benchmarks(sizes, orders=(2, 3, 4), engines=tuple(ENGINES), repeat=3, log=None) -> list:
+    """
+    Benchmark every engine and order on a Zipfian corpus of each size.
+
+    Args:
+        sizes (iterable): Numbers of tokens of the corpora to benchmark on.
+        orders (iterable, optional): Chain orders to benchmark. Defaults to (2, 3, 4).
+        engines (iterable, optional): Names of the ENGINES to benchmark. Defaults to all of them.
+        repeat (int, optional): Each time is the fastest of this many runs. Defaults to 3.
+        log (func, optional): Called with each result as soon as it is measured.
+
+    Returns:
+        list: One dict per measurement, with the RESULT_KEY fields, seconds and tokens_per_second,
+            and memory_bytes for builds.
+    """
+    results = []
+
+    def record(result):
+        results.append(result)
+        if log is not None:
+            log(result)
+
+    for tokens in sizes:
+        word_list = list(zipf_corpus(tokens))
+        for result in benchmark_sample(word_list, repeat=repeat):
+            record(result)
+        for order in orders:
+            for engine in engines:
+                result, markov_chain = benchmark_build(word_list, engine, order, repeat)
+                record(result)
+                record(benchmark_walk(markov_chain, engine, tokens, repeat=repeat))
+                del markov_chain
+    return results
+
+
+def compare_results(results: list, baseline: list, tolerance=0.2) -> list:
+    """
+    Find the measurements that got slower or bigger than the baseline by more than tolerance.
+
+    Args:
+        results (list): Results of run_benchmarks.
+        baseline (list): Results of an earlier run. Measurements missing from it are skipped.
+        tolerance (float, optional): Allowed growth, as a fraction of the baseline. Defaults to 0.2.
+
+    Returns:
+        list: (result, field, baseline value, new value) for each regression.
+    """
+    baseline_by_key = {tuple(result[field] for field in RESULT_KEY): result for result in baseline}
+    regressions = []
+    for result in results:
+        previous = baseline_by_key.get(tuple(result[field] for field in RESULT_KEY))
+        if previous is None:
+            continue
+        for field in ('seconds', 'memory_bytes'):
+            if field in result and field in previous and result[field] > previous[field] * (1 + tolerance):
+                regressions.append((result, field, previous[field], result[field]))
+    return regressions
+
+
+def format_result(result: dict) -> str:
+    """Return one result as a line of text."""
+    line = (f'{result["benchmark"]:<11} {result["engine"]:<9} order {result["order"]} '
+            f'{result["tokens"]:>11,} tokens  {result["seconds"] * 1000:10.2f} ms  '
+            f'{result["tokens_per_second"]:>13,.0f} tokens/s')
+    if 'memory_bytes' in result:
+        line += f'  {result["memory_bytes"] / 1024 / 1024:8.1f} MiB'
+    return line
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='corpus sizes in tokens (default: 10k 100k 1M; 100M needs tens of GB for the dict engine)')
+    parser.add_argument('--orders', type=int, nargs='+', default=[2, 3, 4])
+    parser.add_argument('--engines', nargs='+', choices=sorted(ENGINES), default=sorted(ENGINES))
+    parser.add_argument('--repeat', type=int, default=3, help='report the fastest of this many runs')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', nargs='?', const=BASELINE_PATH,
+                        help='compare with the results in this JSON file (default: {})'.format(BASELINE_PATH))
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='slowdown or growth over the baseline that counts as a regression (default: 0.2)')
+    args = parser.parse_args(arguments)
+
+    results = run_benchmarks(args.sizes, args.orders, args.engines, args.repeat,
+                             log=lambda result: print(format_result(result), flush=True))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'results': results}, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)['results']
+        regressions = compare_results(results, baseline, args.tolerance)
+        for result, field, previous, current in regressions:
+            print(f'REGRESSION {result["benchmark"]} {result["engine"]} order {result["order"]} '
+                  f'{result["tokens"]:,} tokens: {field} {previous:.4g} -> {current:.4g} '
+                  f'({current / previous - 1:+.0%})')
+        if regressions:
+            return 1
+        print('No regressions against', args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+#!python
+
+from benchmark import BASELINE_PATH, ENGINES, RESULT_KEY, compare_results, run_benchmarks, zipf_corpus
+from collections import Counter
+import json
+import os
+import unittest
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def test_zipf_corpus(self):
+        words = list(zipf_corpus(20000, vocab_size=1000))
+        assert len(words) == 20000
+        # The same seed gives the same corpus
+        assert words == list(zipf_corpus(20000, vocab_size=1000))
+        # The most common word is the one of rank 1, far ahead of rank 10
+        counts = Counter(words)
+        assert counts.most_common(1)[0][0] == 'w1'
+        assert counts['w1'] > 5 * counts['w10']
+        assert any(word.endswith('.') for word in counts)
+
+    def test_run_benchmarks(self):
+        results = run_benchmarks([2000], orders=[2], repeat=1)
+        engines = {result['engine'] for result in results if result['benchmark'] == 'build'}
+        assert engines == set(ENGINES)
+        for result in results:
+            assert result['tokens'] == 2000
+            assert result['seconds'] > 0
+            if result['benchmark'] == 'build':
+                assert result['memory_bytes'] > 0
+
+    def test_baseline(self):
+        # The committed baseline covers every engine, so --baseline compares all of them
+        with open(os.path.join(os.path.dirname(__file__), BASELINE_PATH), 'r', encoding='utf-8') as file:
+            baseline = json.load(file)['results']
+        assert {result['engine'] for result in baseline if result['benchmark'] == 'build'} == set(ENGINES)
+        assert all(field in result for result in baseline for field in RESULT_KEY)
+
+    def test_compare_results(self):
+        baseline = [{'benchmark': 'build', 'engine': 'dict', 'order': 2, 'tokens': 10,
+                     'seconds': 1.0, 'memory_bytes': 100}]
+        faster = [dict(baseline[0], seconds=0.5)]
+        slower = [dict(baseline[0], seconds=1.5)]
+        bigger = [dict(baseline[0], memory_bytes=130)]
+        other = [dict(baseline[0], tokens=20, seconds=9.0)]
+        assert compare_results(faster, baseline) == []
+        assert compare_results(slower, baseline) == [(slower[0], 'seconds', 1.0, 1.5)]
+        assert compare_results(bigger, baseline) == [(bigger[0], 'memory_bytes', 100, 130)]
+        assert compare_results(bigger, baseline, tolerance=0.5) == []
+        # Measurements the baseline does not have are not compared
+        assert compare_results(other, baseline) == []
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import re
+from profiling import profiled
 from proper_nouns import extract_proper_nouns, remove_unwanted_proper_nouns, words_to_remove
 from tokens import tokenize
 
@@ -29,6 +30,7 @@ def remove_some_punctuation(text):
     return text
 
 
+@profiled('cleanup.clean_text')
 def clean_text(text):
     text = remove_new_lines(text)
 
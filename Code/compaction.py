@@ -0,0 +1,199 @@
+"""Prunes and compacts a Markov chain so it holds fewer, smaller states, and reports what that cost."""
+from itertools import islice
+import json
+import random
+import sys
+
+from dictogram import Dictogram
+from markov_chain_second import MarkovChain, build_markov_chain, ends_sentence
+
+
+class SingleSuccessor(object):
+    """Stand-in for the Dictogram of a state that is only ever followed by one word."""
+
+    __slots__ = ('word', 'tokens')
+
+    # Count of distinct word types, always one
+    types = 1
+
+    def __init__(self, word, count=1):
+        """Initialize with the only word that follows the state and how often it does."""
+        self.word = word
+        self.tokens = count
+
+    def __len__(self):
+        """Return the number of distinct words, always one."""
+        return 1
+
+    def __iter__(self):
+        """Yield the only word."""
+        yield self.word
+
+    def __contains__(self, word):
+        """Return True if the given word is the only word."""
+        return word == self.word
+
+    def __eq__(self, other):
+        """Compare equal to a histogram with the same single word and count."""
+        return dict(self.items()) == other
+
+    def __repr__(self):
+        return 'SingleSuccessor({!r}, {})'.format(self.word, self.tokens)
+
+    def items(self):
+        """Return the only word and its count as a list of one pair."""
+        return [(self.word, self.tokens)]
+
+    def frequency(self, word):
+        """Return the count of the given word, or 0 if it is not the only word."""
+        return self.tokens if word == self.word else 0
+
+    def sample(self, rng=None):
+        """Return the only word, there is nothing to draw."""
+        return self.word
+
+
+def quantize_counts(counts: list, max_count=255) -> list:
+    """
+    Scale counts down so the largest one is max_count, keeping every count at least 1.
+
+    Args:
+        counts (list): Positive integer counts.
+        max_count (int, optional): Largest count to keep. Defaults to 255, so counts fit in one byte.
+
+    Returns:
+        list: The counts, unchanged if none is over max_count.
+    """
+    largest = max(counts)
+    if largest <= max_count:
+        return list(counts)
+    return [max(1, round(count * max_count / largest)) for count in counts]
+
+
+def compact_chain(markov_chain: MarkovChain, min_count=1, max_states=None, max_count=255) -> MarkovChain:
+    """
+    Build a smaller copy of a Markov chain by dropping weak evidence and storing what is left compactly.
+
+    Args:
+        markov_chain (MarkovChain): The chain to compact; it is not changed.
+        min_count (int, optional): Drop next words seen fewer times than this after a state, and the
+            states left with no next words. Defaults to 1, which drops nothing.
+        max_states (int, optional): Keep only this many states, those seen most often. Defaults to all.
+        max_count (int, optional): Scale the counts of each state down so none is over this. Defaults to 255.
+
+    Returns:
+        MarkovChain: The compacted chain. States with one next word hold a SingleSuccessor instead of
+            a Dictogram, and only starts whose state was kept are kept.
+    """
+    # Keep the next words with enough evidence, and drop states that are left without any
+    kept = []
+    for state, histogram in markov_chain.items():
+        successors = [(word, count) for word, count in histogram.items() if count >= min_count]
+        if successors:
+            kept.append((state, successors))
+
+    # Keep the most frequent states, in the order they were added
+    if max_states is not None and len(kept) > max_states:
+        ranked = sorted(range(len(kept)), key=lambda index: -sum(count for _, count in kept[index][1]))
+        kept = [kept[index] for index in sorted(ranked[:max_states])]
+
+    compacted = MarkovChain(markov_chain.order)
+    for state, successors in kept:
+        if len(successors) == 1:
+            # A state with one next word needs no histogram to sample from
+            word, count = successors[0]
+            compacted[state] = SingleSuccessor(word, min(count, max_count))
+        else:
+            words = [word for word, _ in successors]
+            counts = quantize_counts([count for _, count in successors], max_count)
+            histogram = compacted[state] = Dictogram()
+            for word, count in zip(words, counts):
+                histogram.add_count(word, count)
+
+    # Scale the start counts down together, like the counts of a state, so they keep their proportions
+    starts = [(state, count) for state, count in markov_chain.starts.items() if state in compacted]
+    if starts:
+        counts = quantize_counts([count for _, count in starts], max_count)
+        for (state, _), count in zip(starts, counts):
+            compacted.add_start(state, count)
+    return compacted
+
+
+def chain_nbytes(markov_chain: MarkovChain) -> int:
+    """Return the bytes held by a chain's dicts, state tuples and histograms, not counting the words."""
+    total = sys.getsizeof(markov_chain) + sys.getsizeof(markov_chain.starts)
+    for state, histogram in markov_chain.items():
+        total += sys.getsizeof(state) + sys.getsizeof(histogram)
+        if isinstance(histogram, Dictogram):
+            total += sys.getsizeof(histogram.__dict__)
+    return total
+
+
+def dead_end_rate(markov_chain: MarkovChain, walks=1000, length=30, rng=None) -> float:
+    """
+    Return the fraction of walks from sampled start states that stop at a state with no next words
+    before reaching a sentence ending or the length limit. A chain with no start states, such as one
+    compacted until none was left, cannot start a walk at all, so its rate is 1.0.
+    """
+    if not markov_chain.starts:
+        return 1.0
+    if rng is None:
+        rng = random
+    dead_ends = 0
+    for _ in range(walks):
+        start_words = markov_chain.sample_start(rng)
+        words = list(islice(markov_chain.generate_words(start_words, ends_sentence, rng), length))
+        if len(words) < length and not ends_sentence(words[-1]):
+            dead_ends += 1
+    return dead_ends / walks
+
+
+def compaction_report(markov_chain: MarkovChain, compacted: MarkovChain, walks=1000, rng=None) -> dict:
+    """
+    Compare a chain with its compacted copy.
+
+    Args:
+        markov_chain (MarkovChain): The original chain.
+        compacted (MarkovChain): The chain returned by compact_chain.
+        walks (int, optional): Number of walks used to measure the dead-end rates. Defaults to 1000.
+        rng (optional): A random.Random or numpy.random.Generator to walk with. Defaults to the random module.
+
+    Returns:
+        dict: States before and after, states removed and collapsed to one next word, bytes before,
+            after and saved, and the dead-end rate of each chain.
+    """
+    before = chain_nbytes(markov_chain)
+    after = chain_nbytes(compacted)
+    return {
+        'states_before': len(markov_chain),
+        'states_after': len(compacted),
+        'states_removed': len(markov_chain) - len(compacted),
+        'single_successor_states': sum(isinstance(histogram, SingleSuccessor)
+                                       for histogram in compacted.values()),
+        'bytes_before': before,
+        'bytes_after': after,
+        'bytes_saved': before - after,
+        'dead_end_rate_before': dead_end_rate(markov_chain, walks, rng=rng),
+        'dead_end_rate_after': dead_end_rate(compacted, walks, rng=rng),
+    }
+
+
+def print_report(name: str, report: dict):
+    """Prints a compaction report on one line."""
+    print(f'{name:<28} states {report["states_before"]:>7} -> {report["states_after"]:>7} '
+          f'({report["states_removed"]} removed, {report["single_successor_states"]} single)   '
+          f'{report["bytes_before"] / 1024 / 1024:5.1f} -> {report["bytes_after"] / 1024 / 1024:5.1f} MiB   '
+          f'dead ends {report["dead_end_rate_before"]:.1%} -> {report["dead_end_rate_after"]:.1%}')
+
+
+if __name__ == '__main__':
+    corpus_path = sys.argv[1] if len(sys.argv) > 1 else 'cleaned_tokens.json'
+    with open(corpus_path, 'r', encoding='utf-8') as file:
+        cleaned_tokens = json.load(file)
+
+    for order in (2, 4):
+        markov_chain = build_markov_chain(cleaned_tokens, order)
+        for min_count, max_states in ((1, None), (2, None), (1, len(markov_chain) // 2)):
+            compacted = compact_chain(markov_chain, min_count, max_states)
+            report = compaction_report(markov_chain, compacted, rng=random.Random(0))
+            print_report(f'order {order}, min {min_count}, max {max_states}', report)
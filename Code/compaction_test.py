@@ -0,0 +1,90 @@
+#!python
+
+from compaction import (SingleSuccessor, compact_chain, compaction_report, dead_end_rate,
+                        quantize_counts)
+from dictogram import Dictogram
+from markov_chain_second import build_markov_chain, walk
+import random
+import unittest
+
+
+class CompactionTest(unittest.TestCase):
+
+    # Test fixtures: a tiny corpus with a few repeated word pairs
+    words = ('one fish two fish red fish blue fish one fish two fish '
+             'red fish. blue fish? one fish').split()
+
+    def test_quantize_counts(self):
+        assert quantize_counts([1, 2, 3]) == [1, 2, 3]
+        assert quantize_counts([1000, 500, 1], max_count=10) == [10, 5, 1]
+
+    def test_collapses_single_successors(self):
+        markov_chain = build_markov_chain(self.words)
+        compacted = compact_chain(markov_chain)
+        # Nothing is dropped, so every state keeps the same counts
+        assert len(compacted) == len(markov_chain)
+        for state, histogram in markov_chain.items():
+            assert compacted[state] == histogram
+            if len(histogram) == 1:
+                assert isinstance(compacted[state], SingleSuccessor)
+            else:
+                assert isinstance(compacted[state], Dictogram)
+        assert compacted.starts == markov_chain.starts
+        # The compacted chain walks like the original
+        assert walk(compacted, ('one', 'fish'), 3) == ['one', 'fish', 'two']
+
+    def test_min_count(self):
+        markov_chain = build_markov_chain(self.words)
+        compacted = compact_chain(markov_chain, min_count=2)
+        # Only states followed by the same word at least twice are left
+        assert dict(compacted[('one', 'fish')].items()) == {'two': 2}
+        assert ('fish', 'red') not in compacted
+        for histogram in compacted.values():
+            for _, count in histogram.items():
+                assert count >= 2
+        # Starts of dropped states are dropped too
+        for state in compacted.starts:
+            assert state in compacted
+
+    def test_max_states(self):
+        markov_chain = build_markov_chain(self.words)
+        compacted = compact_chain(markov_chain, max_states=3)
+        assert len(compacted) == 3
+        # The most frequent state is kept
+        assert compacted[('one', 'fish')] == {'two': 2}
+
+    def test_max_count(self):
+        markov_chain = build_markov_chain(self.words)
+        markov_chain.add_start(('one', 'fish'), 999)
+        markov_chain.add_start(('blue', 'fish?'), 499)
+        compacted = compact_chain(markov_chain, max_count=10)
+        # The start counts are scaled down together rather than clipped, so they keep their proportions
+        assert dict(compacted.starts.items()) == {('one', 'fish'): 10, ('blue', 'fish?'): 5}
+        assert compacted.starts.tokens == 15
+
+    def test_report(self):
+        markov_chain = build_markov_chain(self.words)
+        compacted = compact_chain(markov_chain, min_count=2)
+        report = compaction_report(markov_chain, compacted, walks=50, rng=random.Random(1))
+        assert report['states_removed'] == len(markov_chain) - len(compacted)
+        assert report['bytes_saved'] == report['bytes_before'] - report['bytes_after'] > 0
+        assert 0 <= report['dead_end_rate_before'] <= report['dead_end_rate_after'] <= 1
+        # Every walk ends at a sentence ending or the length limit before compaction
+        assert dead_end_rate(markov_chain, 50, length=5, rng=random.Random(1)) == 0
+
+    def test_no_starts_left(self):
+        markov_chain = build_markov_chain('one fish two fish red fish blue fish'.split())
+        # No next word is seen 5 times, so every state and start is dropped
+        compacted = compact_chain(markov_chain, min_count=5)
+        assert len(compacted) == 0
+        assert not compacted.starts
+        assert dead_end_rate(compacted, 10) == 1.0
+        report = compaction_report(markov_chain, compacted, walks=10, rng=random.Random(1))
+        assert report['states_after'] == 0
+        assert report['dead_end_rate_after'] == 1.0
+        # An empty chain has no starts either
+        assert dead_end_rate(build_markov_chain([]), 10) == 1.0
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,22 +2,46 @@
 
 from __future__ import division, print_function  # Python 2 and 3 compatibility
 import random
+from profiling import profiled
+from sampling import WeightedChoice, build_alias_table
 
 
 class Dictogram(dict):
     """Dictogram is a histogram implemented as a subclass of the dict type."""
 
+    # No sampling tables until the first sample, see __init__
+    _alias_table = None
+    _cumulative = None
+
     def __init__(self, word_list=None):
         """Initialize this histogram as a new dict and count given words."""
         super(Dictogram, self).__init__()  # Initialize this as a new dict
         # Add properties to track useful word counts for this histogram
         self.types = 0  # Count of distinct word types in this histogram
         self.tokens = 0  # Total count of all word tokens in this histogram
+        # Alias table for sampling, built on first sample and reset by add_count
+        self._alias_table = None
+        # WeightedChoice for sample_many, built on first use
+        self._cumulative = None
         # Count words in given list, if any
         if word_list is not None:
             for word in word_list:
                 self.add_count(word)
 
+    @classmethod
+    def from_counts(cls, word_counts):
+        """Return a histogram of the given (word, count) pairs of distinct words,
+        in that order. It skips __init__ and add_count, so building many small
+        histograms at once costs little more than building plain dicts."""
+        histogram = cls.__new__(cls)
+        dict.update(histogram, word_counts)
+        # The same properties as __init__ sets, but the sampling tables, whose
+        # class defaults are None
+        histogram.types = len(histogram)
+        histogram.tokens = sum(histogram.values())
+        return histogram
+
+    @profiled('Dictogram.add_count')
     def add_count(self, word, count=1):
         """Increase frequency count of given word by given count amount."""
         # TODO: Increase word frequency by count
@@ -31,6 +55,9 @@ class Dictogram(dict):
             self.types += 1
         # Increase the total token count
         self.tokens += count
+        # Counts changed, so the cached sampling tables are stale
+        self._alias_table = None
+        self._cumulative = None
 
     def frequency(self, word):
         """Return frequency count of given word, or 0 if word is not found."""
@@ -42,20 +69,33 @@ class Dictogram(dict):
         # Find the given word (key) and then return the associated value
         return self.get(word, 0)
 
-    def sample(self):
+    def sample(self, rng=None):
         """Return a word from this histogram, randomly sampled by weighting
-        each word's probability of being chosen by its observed frequency."""
-        # TODO: Randomly choose a word based on its frequency in this histogram
-        #  Get all the words (keys)
-        words = list(self.keys())
-
-        # Get all the weights (values/frequencies)
-        frequencies = list(self.values())
-
-        # Use random.choices(), which allows weights
-        random_word = random.choices(words, weights=frequencies, k=1)[0]
-        # print(random_word)
-        return random_word
+        each word's probability of being chosen by its observed frequency.
+        Pass a random.Random or numpy.random.Generator as rng to draw from it
+        instead of the shared random module."""
+        # Build the alias table once, then reuse it until add_count changes a count
+        if self._alias_table is None:
+            words = list(self.keys())
+            probabilities, aliases = build_alias_table(list(self.values()))
+            self._alias_table = (words, probabilities, aliases)
+        words, probabilities, aliases = self._alias_table
+
+        # Pick a column uniformly, then keep it or take its alias
+        if rng is None:
+            rng = random
+        index = int(rng.random() * len(words))
+        if rng.random() >= probabilities[index]:
+            index = aliases[index]
+        return words[index]
+
+    def sample_many(self, k, rng=None, as_indices=False):
+        """Return k words from this histogram, sampled in one batch by weighting
+        each word's probability of being chosen by its observed frequency.
+        Pass as_indices=True to get indices into list(self.keys()) instead."""
+        if self._cumulative is None:
+            self._cumulative = WeightedChoice(list(self.keys()), list(self.values()))
+        return self._cumulative.sample_many(k, rng, as_indices)
 
 
 def print_histogram(word_list):
@@ -76,7 +116,7 @@ def print_histogram(word_list):
 def print_histogram_samples(histogram):
     print('Histogram samples:')
     # Sample the histogram 10,000 times and count frequency of results
-    samples_list = [histogram.sample() for _ in range(10000)]
+    samples_list = histogram.sample_many(10000)
     samples_hist = Dictogram(samples_list)
     print('samples: {}'.format(samples_hist))
     print()
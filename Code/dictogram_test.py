@@ -1,6 +1,7 @@
 #!python
 
 from dictogram import Dictogram
+import random
 import unittest
 # Python 2 and 3 compatibility: unittest module renamed this assertion method
 if not hasattr(unittest.TestCase, 'assertCountEqual'):
@@ -63,6 +64,17 @@ class DictogramTest(unittest.TestCase):
         # Verify total count of all word tokens
         assert histogram.tokens == 8 + 14
 
+    def test_from_counts(self):
+        histogram = Dictogram.from_counts(zip(['one', 'fish', 'two', 'red', 'blue'], [1, 4, 1, 1, 1]))
+        assert histogram == Dictogram(self.fish_words)
+        assert list(histogram) == list(Dictogram(self.fish_words))
+        assert histogram.types == 5
+        assert histogram.tokens == 8
+        # It counts and samples like any other histogram
+        histogram.add_count('fish')
+        assert histogram.frequency('fish') == 5
+        assert histogram.sample(random.Random(0)) in histogram
+
     def test_tokens(self):
         histogram = Dictogram(self.fish_words)
         # Verify total count of all word tokens
@@ -101,6 +113,49 @@ class DictogramTest(unittest.TestCase):
             upper_bound = observed_freq * 1.1  # 10% above = 110% = 1.1
             assert lower_bound <= sampled_freq <= upper_bound
 
+    def test_sample_after_add_count(self):
+        histogram = Dictogram(['one'])
+        # Sampling builds the alias table for the current counts
+        assert histogram.sample() == 'one'
+        # Adding a new word must invalidate the cached table
+        histogram.add_count('fish', 3)
+        samples_hist = Dictogram(histogram.sample() for _ in range(10000))
+        assert 'fish' in samples_hist
+        sampled_freq = samples_hist.frequency('fish') / samples_hist.tokens
+        assert 0.75 * 0.9 <= sampled_freq <= 0.75 * 1.1
+
+    def test_sample_many(self):
+        histogram = Dictogram(self.fish_words)
+        # Draw 10,000 word samples from histogram in one batch
+        samples_list = histogram.sample_many(10000)
+        assert len(samples_list) == 10000
+        samples_hist = Dictogram(samples_list)
+        # Check each word in original histogram
+        for word, count in histogram.items():
+            observed_freq = count / histogram.tokens
+            sampled_freq = samples_hist.frequency(word) / samples_hist.tokens
+            assert observed_freq * 0.9 <= sampled_freq <= observed_freq * 1.1
+
+    def test_sample_many_with_rng(self):
+        histogram = Dictogram(self.fish_words)
+        # The same seed must reproduce the same batch
+        first = histogram.sample_many(100, rng=random.Random(7))
+        second = histogram.sample_many(100, rng=random.Random(7))
+        assert first == second
+        # Indices point at entries of the histogram
+        indices = histogram.sample_many(100, rng=random.Random(7), as_indices=True)
+        assert all(0 <= index < len(histogram) for index in indices)
+
+    def test_sample_with_rng(self):
+        histogram = Dictogram(self.fish_words)
+        # The same seed must reproduce the same draws
+        first = [histogram.sample(random.Random(7)) for _ in range(20)]
+        second = [histogram.sample(random.Random(7)) for _ in range(20)]
+        assert first == second
+        rng = random.Random(7)
+        samples_hist = Dictogram(histogram.sample(rng) for _ in range(10000))
+        assert 0.5 * 0.9 <= samples_hist.frequency('fish') / samples_hist.tokens <= 0.5 * 1.1
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,24 @@
+"""Gunicorn settings: load app.py once in the master and share its memory with every worker."""
+import gc
+import os
+
+# Import app.py in the master before forking, so every worker shares the loaded chain.
+# Set GUNICORN_PRELOAD=0 to have each worker import the app itself instead.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def when_ready(server):
+    """Load the chain in the master, then freeze every object loaded so far, right before the workers
+    are forked. Frozen objects are never visited by the garbage collector, so collections in the
+    workers don't write to their memory and copy the pages shared with the master."""
+    if preload_app:
+        import app
+        app.warmup()
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    """Load the chain in each worker before it accepts requests, when the app is not preloaded."""
+    if not preload_app:
+        import app  # Already imported by the worker, so this only looks it up
+        app.warmup()
@@ -1,18 +1,28 @@
 #!python
 
 from __future__ import division, print_function  # Python 2 and 3 compatibility
-import random
+from sampling import WeightedChoice
+import timeit
 
 
 class Listogram(list):
     """Listogram is a histogram implemented as a subclass of the list type."""
 
-    def __init__(self, word_list=None):
-        """Initialize this histogram as a new list and count given words."""
+    def __init__(self, word_list=None, sort_by_count=False):
+        """Initialize this histogram as a new list and count given words.
+        With sort_by_count, entries are kept in descending order of count
+        instead of the order their words were first added. Entries with equal
+        counts are in no particular order, since moving an entry up swaps it
+        with the first entry of the run it passes."""
         super(Listogram, self).__init__()  # Initialize this as a new list
+        self.sort_by_count = sort_by_count
         # Add properties to track useful word counts for this histogram
         self.types = 0  # Count of distinct word types in this histogram
         self.tokens = 0  # Total count of all word tokens in this histogram
+        # Index of each word's entry, so finding an entry takes O(1) instead of a scan of the list
+        self._indices = {}
+        # WeightedChoice for sample and sample_many, built on first use
+        self._cumulative = None
         # Count words in given list, if any
         if word_list is not None:
             for word in word_list:
@@ -21,58 +31,94 @@ class Listogram(list):
     def add_count(self, word, count=1):
         """Increase frequency count of given word by given count amount."""
         # TODO: Increase word frequency by count
-        # self is a list
-        if word in self:
-            index = self.index_of(word)
+        # self is a list, and the index map finds the word's entry in it
+        index = self.index_of(word)
+        if index is not None:
             self[index][1] += count
         else:
+            index = self._indices[word] = len(self)
             self.append([word, count])
             self.types += 1
+        if self.sort_by_count:
+            self._move_up(index)
 
         self.tokens += count
+        # Counts changed, so the cached running totals are stale
+        self._cumulative = None
 
     def frequency(self, word):
         """Return frequency count of given word, or 0 if word is not found."""
         # TODO: Retrieve word frequency count
         # self = [['one', 1], ['fish', 4], ['two', 1], ['red', 1], ['blue', 1]]
-        for inner_list in self:
-            if inner_list[0] == word:
-                # Return the frequency (second element)
-                return inner_list[1]
+        index = self.index_of(word)
+        if index is not None:
+            # Return the frequency (second element)
+            return self[index][1]
         return 0
 
     def __contains__(self, word):
         """Return boolean indicating if given word is in this histogram."""
         # TODO: Check if word is in this histogram
-        for inner_list in self:
-            if inner_list[0] == word:
-                return True
-        return False
+        return self.index_of(word) is not None
 
     def index_of(self, target):
         """Return the index of entry containing given target word if found in
         this histogram, or None if target word is not found."""
-        # TODO: Implement linear search to find index of entry with target word
-        # Iterate over the list of first values and find the target
-        for index, inner_list in enumerate(self):
-            if inner_list[0] == target:
-                return index
-        return None
-
-    def sample(self):
-        """Return a word from this histogram, randomly sampled by weighting
-        each word's probability of being chosen by its observed frequency."""
-        # TODO: Randomly choose a word based on its frequency in this histogram
-        #  Get all the words (first value in inner list)
-        words = [inner_list[0] for inner_list in self]
+        # Look the target up in the index map instead of scanning the list
+        return self._index_map().get(target)
 
-        # Get all the weights (second value in inner list)
-        weights = [inner_list[1] for inner_list in self]
+    def _index_map(self):
+        """Return the map from each word to the index of its entry. Entries
+        added with list methods like append or extend are not in it, so it is
+        rebuilt from the list whenever their lengths differ."""
+        if len(self._indices) != len(self):
+            self._indices = {inner_list[0]: index for index, inner_list in enumerate(self)}
+        return self._indices
 
-        # Use random.choices(), which allows weights
-        random_word = random.choices(words, weights=weights, k=1)[0]
+    def _move_up(self, index):
+        """Move the entry at index ahead of the entries with lower counts,
+        after its count went up. Each step swaps it with the first entry of
+        the run of equal counts just ahead of it, found by binary search, so
+        one step passes the whole run and the rest stays sorted."""
+        entry = self[index]
+        while index > 0 and self[index - 1][1] < entry[1]:
+            run_count = self[index - 1][1]
+            # Binary search for the first entry with run_count, the list is sorted by descending count
+            low, high = 0, index - 1
+            while low < high:
+                middle = (low + high) // 2
+                if self[middle][1] > run_count:
+                    low = middle + 1
+                else:
+                    high = middle
+            # Swap the entries and their indices
+            self[index] = self[low]
+            self[low] = entry
+            self._indices[self[index][0]] = index
+            self._indices[entry[0]] = low
+            index = low
 
-        return random_word
+    def sample(self, rng=None):
+        """Return a word from this histogram, randomly sampled by weighting
+        each word's probability of being chosen by its observed frequency.
+        Pass a random.Random or numpy.random.Generator as rng to draw from it
+        instead of the shared random module."""
+        # TODO: Randomly choose a word based on its frequency in this histogram
+        # Get all the words (first value in inner list) and their running
+        # weight totals once, then binary search them until add_count
+        if self._cumulative is None:
+            self._cumulative = WeightedChoice([inner_list[0] for inner_list in self],
+                                              [inner_list[1] for inner_list in self])
+        return self._cumulative.sample(rng)
+
+    def sample_many(self, k, rng=None, as_indices=False):
+        """Return k words from this histogram, sampled in one batch by weighting
+        each word's probability of being chosen by its observed frequency.
+        Pass as_indices=True to get indices of entries instead."""
+        if self._cumulative is None:
+            self._cumulative = WeightedChoice([inner_list[0] for inner_list in self],
+                                              [inner_list[1] for inner_list in self])
+        return self._cumulative.sample_many(k, rng, as_indices)
 
 
 def print_histogram(word_list):
@@ -93,7 +139,7 @@ def print_histogram(word_list):
 def print_histogram_samples(histogram):
     print('Histogram samples:')
     # Sample the histogram 10,000 times and count frequency of results
-    samples_list = [histogram.sample() for _ in range(10000)]
+    samples_list = histogram.sample_many(10000)
     samples_hist = Listogram(samples_list)
     print('samples: {}'.format(samples_hist))
     print()
@@ -127,6 +173,30 @@ def print_histogram_samples(histogram):
     print()
 
 
+def benchmark_build(file_path='source_text.txt', repeat=3):
+    """Time counting every word of a text file with a Listogram and with
+    histogram.make_tuple_histogram, the linear search a Listogram used to do,
+    and print both times and the speedup."""
+    from histogram import make_tuple_histogram
+    with open(file_path, 'r', encoding='utf-8') as file:
+        words = file.read().split()
+    listogram_time = min(timeit.repeat(lambda: Listogram(words), number=1, repeat=repeat))
+    sorted_time = min(timeit.repeat(lambda: Listogram(words, sort_by_count=True), number=1, repeat=repeat))
+    tuple_time = min(timeit.repeat(lambda: make_tuple_histogram(words), number=1, repeat=repeat))
+    histogram = Listogram(words)
+    print('{}: {} tokens, {} types'.format(file_path, histogram.tokens, histogram.types))
+    print('Listogram with index map: {:.4f} s'.format(listogram_time))
+    print('Sorted by count:          {:.4f} s'.format(sorted_time))
+    print('Linear search histogram:  {:.4f} s'.format(tuple_time))
+    print('Speedup: {:.1f}x'.format(tuple_time / listogram_time))
+    # Time drawing words, with the prefix sums already built
+    draws = 100000
+    for name, histogram in (('first-seen order', histogram), ('sorted by count', Listogram(words, True))):
+        histogram.sample()
+        sample_time = min(timeit.repeat(histogram.sample, number=draws, repeat=repeat))
+        print('sample, {}: {:.2f} us per draw'.format(name, sample_time / draws * 1e6))
+
+
 def main():
     # print("#####################################################")
     # # Create an empty Listogram
@@ -165,7 +235,10 @@ def main():
 
     import sys
     arguments = sys.argv[1:]  # Exclude script name in first argument
-    if len(arguments) >= 1:
+    if arguments[:1] == ['--benchmark']:
+        # Time building a histogram of a text file, source_text.txt by default
+        benchmark_build(*arguments[1:2])
+    elif len(arguments) >= 1:
         # Test histogram on given arguments
         print_histogram(arguments)
     else:
@@ -1,6 +1,7 @@
 #!python
 
 from listogram import Listogram
+import random
 import unittest
 # Python 2 and 3 compatibility: unittest module renamed this assertion method
 if not hasattr(unittest.TestCase, 'assertCountEqual'):
@@ -67,6 +68,51 @@ class ListogramTest(unittest.TestCase):
         # Verify total count of all word tokens
         assert histogram.tokens == 8 + 14
 
+    def test_index_of(self):
+        histogram = Listogram(self.fish_words)
+        # Entries stay in the order their words were first added
+        assert histogram == self.fish_list
+        assert histogram.index_of('one') == 0
+        assert histogram.index_of('blue') == 4
+        assert histogram.index_of('food') is None
+        histogram.add_count('food')
+        assert histogram.index_of('food') == 5
+        # Entries added with list methods are found too
+        histogram.extend([['shark', 2]])
+        assert histogram.index_of('shark') == 6
+        assert histogram.frequency('shark') == 2
+        histogram.add_count('shark')
+        assert histogram.frequency('shark') == 3
+
+    def test_sort_by_count(self):
+        histogram = Listogram(self.fish_words, sort_by_count=True)
+        # 'fish' passes 'one' as soon as it is counted twice
+        assert histogram == [['fish', 4], ['one', 1], ['two', 1], ['red', 1], ['blue', 1]]
+        histogram.add_count('blue')
+        # 'blue' swaps places with 'one', the first of the run of ones, so ties are reordered
+        assert histogram == [['fish', 4], ['blue', 2], ['two', 1], ['red', 1], ['one', 1]]
+        histogram.add_count('food', 3)
+        assert histogram == [['fish', 4], ['food', 3], ['blue', 2], ['red', 1], ['one', 1], ['two', 1]]
+        # The index map follows every swap
+        for index, (word, count) in enumerate(histogram):
+            assert histogram.index_of(word) == index
+            assert histogram.frequency(word) == count
+
+    def test_sort_by_count_random(self):
+        rng = random.Random(3)
+        histogram = Listogram(sort_by_count=True)
+        expected = {}
+        for _ in range(2000):
+            word = 'word{}'.format(int(rng.paretovariate(1)))
+            count = rng.choice((1, 1, 1, 5))
+            histogram.add_count(word, count)
+            expected[word] = expected.get(word, 0) + count
+        counts = [count for _, count in histogram]
+        assert counts == sorted(counts, reverse=True)
+        assert dict(histogram) == expected
+        assert all(histogram.index_of(word) == index for index, (word, _) in enumerate(histogram))
+        assert histogram.tokens == sum(expected.values())
+
     def test_tokens(self):
         histogram = Listogram(self.fish_words)
         # Verify total count of all word tokens
@@ -105,6 +151,28 @@ class ListogramTest(unittest.TestCase):
             upper_bound = observed_freq * 1.1  # 10% above = 110% = 1.1
             assert lower_bound <= sampled_freq <= upper_bound
 
+    def test_sample_many(self):
+        histogram = Listogram(self.fish_words)
+        # Draw 10,000 word samples from histogram in one batch
+        samples_list = histogram.sample_many(10000)
+        assert len(samples_list) == 10000
+        samples_hist = Listogram(samples_list)
+        # Check each word in original histogram
+        for word, count in histogram:
+            observed_freq = count / histogram.tokens
+            sampled_freq = samples_hist.frequency(word) / samples_hist.tokens
+            assert observed_freq * 0.9 <= sampled_freq <= observed_freq * 1.1
+
+    def test_sample_many_with_rng(self):
+        histogram = Listogram(self.fish_words)
+        # The same seed must reproduce the same batch
+        first = histogram.sample_many(100, rng=random.Random(7))
+        second = histogram.sample_many(100, rng=random.Random(7))
+        assert first == second
+        # Indices point at entries of the histogram
+        indices = histogram.sample_many(100, rng=random.Random(7), as_indices=True)
+        assert all(0 <= index < len(histogram) for index in indices)
+
 
 if __name__ == '__main__':
     unittest.main()
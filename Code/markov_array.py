@@ -0,0 +1,558 @@
+"""Markov chain engine that stores interned word IDs in flat arrays instead of dicts of Dictograms."""
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import islice
+import hashlib
+import json
+import math
+import mmap
+import os
+import random
+import struct
+import sys
+import timeit
+import tracemalloc
+
+from markov_chain_second import (SENTENCE_ENDINGS, build_second_order_markov_chain, ends_sentence,
+                                 format_sentence, stream_sentences)
+from profiling import profiled
+from sampling import build_alias_table, default_generator, numpy
+
+# Snapshot file layout: header, vocabulary, then each array, every section padded to 8 bytes
+SNAPSHOT_MAGIC = b'MKVC'
+SNAPSHOT_VERSION = 2
+# Magic, version, order, vocabulary bytes, vocabulary size, states, edges, start states, corpus fingerprint
+SNAPSHOT_HEADER = struct.Struct('<4sIIQQQQQ32s')
+# Name and type code of each array, in the order they are stored
+SNAPSHOT_ARRAYS = (('state_keys', 'q'), ('offsets', 'i'), ('successors', 'i'), ('counts', 'i'),
+                   ('next_states', 'i'), ('probabilities', 'f'), ('aliases', 'i'),
+                   ('start_states', 'i'), ('start_counts', 'i'), ('start_probabilities', 'f'),
+                   ('start_aliases', 'i'))
+
+
+class ArrayMarkovChain(object):
+    """
+    Markov chain whose states, successors and counts live in flat arrays, laid out like a CSR matrix.
+
+    Every word is interned to an integer ID. A state is the tuple of the last `order` word IDs, packed
+    into one integer key, and the states are kept sorted by key so state i is found by binary search.
+    The successors of state i are the edges offsets[i] up to offsets[i + 1]. For each edge e,
+    successors[e] is the next word ID, counts[e] its frequency, and next_states[e] the state reached
+    after emitting it (or -1 if that state never occurs in the corpus), so a walk moves from state to
+    state without building tuples. probabilities[e] and aliases[e] form a per-state alias table.
+
+    start_states lists the states that begin a sentence and start_counts how many sentences begin
+    with each, with start_probabilities and start_aliases as their alias table.
+    """
+
+    def __init__(self, order, vocab, state_keys, offsets, successors, counts, next_states,
+                 probabilities, aliases, start_states, start_counts, start_probabilities,
+                 start_aliases):
+        """Initialize this chain from already built arrays; use build_markov_chain to build one."""
+        self.order = order  # Number of words in each state
+        self.vocab = vocab  # Word for each word ID
+        self.word_ids = {word: word_id for word_id, word in enumerate(vocab)}
+        self.state_keys = state_keys  # Packed word IDs of each state, sorted
+        self.offsets = offsets  # Index of the first edge of each state, plus the end
+        self.successors = successors  # Next word ID of each edge
+        self.counts = counts  # Frequency of each edge
+        self.next_states = next_states  # State reached by following each edge, or -1
+        self.probabilities = probabilities  # Alias table keep probability of each edge
+        self.aliases = aliases  # Alias table fallback edge of each edge
+        self.start_states = start_states  # Index of each state that begins a sentence
+        self.start_counts = start_counts  # Number of sentences that begin with each start state
+        self.start_probabilities = start_probabilities  # Alias table over the start states
+        self.start_aliases = start_aliases
+        self._ends_sentence = None  # Whether each word ID ends a sentence, made on first use
+        self._numpy_arrays = None  # NumPy views of the arrays above, made on first use
+        self._log_probabilities = None  # Log-probability of each edge, made on first use
+
+    def __len__(self):
+        """Return the number of states in this chain."""
+        return len(self.state_keys)
+
+    def __contains__(self, state):
+        """Return True if the given tuple of words is a state in this chain."""
+        return self.state_index(state) != -1
+
+    def __iter__(self):
+        """Iterate over the states of this chain as tuples of words."""
+        return self.keys()
+
+    def keys(self):
+        """Iterate over the states of this chain as tuples of words."""
+        for state_key in self.state_keys:
+            yield self._unpack(state_key)
+
+    def _unpack(self, state_key):
+        """Return the tuple of words packed into the given state key."""
+        size = len(self.vocab)
+        word_ids = []
+        for _ in range(self.order):
+            state_key, word_id = divmod(state_key, size)
+            word_ids.append(word_id)
+        return tuple(self.vocab[word_id] for word_id in reversed(word_ids))
+
+    def state_index(self, state):
+        """Return the index of the given tuple of words in this chain, or -1 if it is not a state."""
+        if len(state) != self.order:
+            return -1
+        size = len(self.vocab)
+        state_key = 0
+        for word in state:
+            word_id = self.word_ids.get(word)
+            if word_id is None:
+                return -1
+            state_key = state_key * size + word_id
+        index = bisect_left(self.state_keys, state_key)
+        if index < len(self.state_keys) and self.state_keys[index] == state_key:
+            return index
+        return -1
+
+    def find_edge(self, state, word_id):
+        """Return the edge from the given state index to the given word ID, or -1 if there is none."""
+        end = self.offsets[state + 1]
+        # The edges of each state are sorted by successor, so binary search them
+        edge = bisect_left(self.successors, word_id, self.offsets[state], end)
+        if edge < end and self.successors[edge] == word_id:
+            return edge
+        return -1
+
+    def sample_edge(self, state, rng=None):
+        """Return a random edge leaving the given state index, weighted by its count."""
+        if rng is None:
+            rng = random
+        start = self.offsets[state]
+        edge = start + int(rng.random() * (self.offsets[state + 1] - start))
+        if rng.random() >= self.probabilities[edge]:
+            edge = self.aliases[edge]
+        return edge
+
+    def sample_start(self, rng=None) -> tuple:
+        """Return a state that begins a sentence, weighted by how many sentences in the corpus begin with it."""
+        if rng is None:
+            rng = random
+        start = int(rng.random() * len(self.start_states))
+        if rng.random() >= self.start_probabilities[start]:
+            start = self.start_aliases[start]
+        return self._unpack(self.state_keys[self.start_states[start]])
+
+    def generate_words(self, start_words: tuple, stop=None, rng=None):
+        """Yield the start words and then each word of a random walk from them, like generate_words
+        in markov_chain_second, until a state with no next words or a word stop returns True for."""
+        yield from start_words
+        state = self.state_index(start_words)
+        while state != -1:
+            edge = self.sample_edge(state, rng)
+            next_word = self.vocab[self.successors[edge]]
+            yield next_word
+            if stop is not None and stop(next_word):
+                return
+            state = self.next_states[edge]
+
+    def walk(self, start_words: tuple, length=10, rng=None) -> list:
+        """Return the list of words visited by a random walk from the given state, like random_walk."""
+        words = self.generate_words(start_words, ends_sentence, rng)
+        return list(islice(words, max(length, len(start_words))))
+
+    def ends_sentence(self) -> list:
+        """Return a list that is True at each word ID whose word ends a sentence."""
+        if self._ends_sentence is None:
+            self._ends_sentence = [word.endswith(SENTENCE_ENDINGS) for word in self.vocab]
+        return self._ends_sentence
+
+    def log_probabilities(self) -> array:
+        """Return an array of the natural log of the probability of each edge given its state."""
+        if self._log_probabilities is None:
+            values = array('d')
+            for state in range(len(self.state_keys)):
+                start, end = self.offsets[state], self.offsets[state + 1]
+                log_total = math.log(sum(self.counts[start:end]))
+                values.extend(math.log(self.counts[edge]) - log_total for edge in range(start, end))
+            self._log_probabilities = values
+        return self._log_probabilities
+
+    def numpy_arrays(self) -> dict:
+        """Return NumPy views of this chain's arrays, by name, sharing memory with the arrays themselves."""
+        if self._numpy_arrays is None:
+            views = {name: numpy.frombuffer(getattr(self, name), dtype=numpy.dtype(type_code))
+                     for name, type_code in SNAPSHOT_ARRAYS}
+            views['ends_sentence'] = numpy.array(self.ends_sentence(), dtype=bool)
+            self._numpy_arrays = views
+        return self._numpy_arrays
+
+    def nbytes(self) -> int:
+        """Return the number of bytes held by this chain's arrays."""
+        arrays = (self.state_keys, self.offsets, self.successors, self.counts,
+                  self.next_states, self.probabilities, self.aliases, self.start_states,
+                  self.start_counts, self.start_probabilities, self.start_aliases)
+        return sum(len(values) * values.itemsize for values in arrays)
+
+
+@profiled('markov_array.build_markov_chain')
+def build_markov_chain(word_list, order=2) -> ArrayMarkovChain:
+    """
+    Takes an iterable of strings to build an array-backed Markov chain of the given order.
+
+    Args:
+        word_list (iterable): Words (strings) representing the corpus, in order.
+        order (int, optional): Number of words in each state. Defaults to 2.
+
+    Returns:
+        ArrayMarkovChain: The chain, holding the same transition counts as build_second_order_markov_chain.
+    """
+    # Intern every word to an ID in order of first appearance
+    word_ids = {}
+    ids = array('i', [word_ids.setdefault(word, len(word_ids)) for word in word_list])
+    vocab = list(word_ids)
+    size = max(len(vocab), 1)
+    if size ** order >= 2 ** 63:
+        raise ValueError('vocabulary of {} words is too large for order {}'.format(size, order))
+    modulus = size ** (order - 1)
+
+    # Count every (state, next word) edge, packed into one integer, in a single rolling pass
+    def packed_edges():
+        state_key = 0
+        for position, word_id in enumerate(ids):
+            if position >= order:
+                yield state_key * size + word_id
+            state_key = (state_key % modulus) * size + word_id
+    edges = Counter(packed_edges())
+
+    # Count the states that begin a sentence: the first one, and any after a sentence ending,
+    # as long as a word follows them
+    ends_sentence = [word.endswith(SENTENCE_ENDINGS) for word in vocab]
+    first_positions = [0] + [position + 1 for position, word_id in enumerate(ids)
+                             if ends_sentence[word_id]]
+    starts = Counter()
+    for first in first_positions:
+        if first + order < len(ids):
+            state_key = 0
+            for word_id in ids[first:first + order]:
+                state_key = state_key * size + word_id
+            starts[state_key] += 1
+
+    # Sorting the packed edges groups them by state and orders states by key
+    state_keys = array('q')
+    offsets = array('i')
+    successors = array('i')
+    counts = array('i')
+    previous_key = -1
+    for edge in sorted(edges):
+        state_key, successor = divmod(edge, size)
+        if state_key != previous_key:
+            offsets.append(len(successors))
+            state_keys.append(state_key)
+            previous_key = state_key
+        successors.append(successor)
+        counts.append(edges[edge])
+    offsets.append(len(successors))
+
+    # Link every edge to the state it leads to, and build each state's alias table
+    state_index = {state_key: index for index, state_key in enumerate(state_keys)}
+    next_states = array('i')
+    probabilities = array('f')
+    aliases = array('i')
+    for index, state_key in enumerate(state_keys):
+        start, end = offsets[index], offsets[index + 1]
+        shifted = (state_key % modulus) * size
+        for edge in range(start, end):
+            next_states.append(state_index.get(shifted + successors[edge], -1))
+        if end - start == 1:
+            probabilities.append(1.0)
+            aliases.append(start)
+        else:
+            state_probabilities, state_aliases = build_alias_table(counts[start:end])
+            probabilities.extend(state_probabilities)
+            aliases.extend(start + alias for alias in state_aliases)
+
+    # Index the start states, in state order, with an alias table weighted by their counts
+    start_states = array('i', sorted(state_index[state_key] for state_key in starts))
+    start_counts = array('i', [starts[state_keys[state]] for state in start_states])
+    start_probabilities = array('f')
+    start_aliases = array('i')
+    if start_states:
+        table_probabilities, table_aliases = build_alias_table(start_counts)
+        start_probabilities.extend(table_probabilities)
+        start_aliases.extend(table_aliases)
+
+    return ArrayMarkovChain(order, vocab, state_keys, offsets, successors, counts, next_states,
+                            probabilities, aliases, start_states, start_counts,
+                            start_probabilities, start_aliases)
+
+
+def corpus_fingerprint(file_path: str) -> bytes:
+    """
+    Returns the SHA-256 digest of the given corpus file, used to tell if a snapshot is stale.
+
+    Args:
+        file_path (str): Path to the corpus the chain is built from.
+
+    Returns:
+        bytes: The 32 byte digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.digest()
+
+
+def _padding(size: int) -> bytes:
+    """Return the zero bytes needed to pad a section of the given size to a multiple of 8."""
+    return bytes(-size % 8)
+
+
+def save_markov_chain(markov_chain: ArrayMarkovChain, file_path: str, fingerprint=b''):
+    """
+    Writes the chain to a compact binary snapshot file that load_markov_chain can map into memory.
+
+    Args:
+        markov_chain (ArrayMarkovChain): The chain to save.
+        file_path (str): Path of the snapshot file. It is replaced atomically if it exists.
+        fingerprint (bytes, optional): Up to 32 bytes identifying the corpus, see corpus_fingerprint.
+    """
+    if sys.byteorder != 'little':
+        raise ValueError('snapshots can only be written on little-endian machines')
+    vocab_bytes = '\0'.join(markov_chain.vocab).encode('utf-8')
+    # NUL separates the words, so a word containing one would split in two and shift every word ID after it
+    if markov_chain.vocab and vocab_bytes.count(b'\0') != len(markov_chain.vocab) - 1:
+        raise ValueError('words containing a NUL character cannot be saved in a snapshot')
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, markov_chain.order,
+                                  len(vocab_bytes), len(markov_chain.vocab), len(markov_chain),
+                                  len(markov_chain.successors), len(markov_chain.start_states),
+                                  fingerprint)
+
+    # Write to a private temporary file first so readers never see a partial snapshot
+    temporary_path = '{}.{}.tmp'.format(file_path, os.getpid())
+    with open(temporary_path, 'wb') as file:
+        file.write(header + _padding(len(header)))
+        file.write(vocab_bytes + _padding(len(vocab_bytes)))
+        for name, _ in SNAPSHOT_ARRAYS:
+            data = getattr(markov_chain, name).tobytes()
+            file.write(data + _padding(len(data)))
+    os.replace(temporary_path, file_path)
+
+
+def load_markov_chain(file_path: str, fingerprint=None, use_mmap=True) -> ArrayMarkovChain:
+    """
+    Reads a chain written by save_markov_chain. With use_mmap, the arrays are read-only views of
+    the memory-mapped file, so loading costs about the same no matter how large the chain is.
+
+    Args:
+        file_path (str): Path of the snapshot file.
+        fingerprint (bytes, optional): If given, the snapshot must have been saved with this fingerprint.
+        use_mmap (bool, optional): Map the file instead of reading it into memory. Defaults to True.
+
+    Returns:
+        ArrayMarkovChain: The loaded chain.
+
+    Raises:
+        ValueError: If the file is not a snapshot of this version, its size or number of words does not
+            match its header, or its fingerprint does not match.
+    """
+    if sys.byteorder != 'little':
+        raise ValueError('snapshots can only be read on little-endian machines')
+    with open(file_path, 'rb') as file:
+        if use_mmap:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = file.read()
+    if len(data) < SNAPSHOT_HEADER.size:
+        raise ValueError('{} is not a Markov chain snapshot'.format(file_path))
+    (magic, version, order, vocab_length, vocab_size, states, edges, starts,
+     saved_fingerprint) = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError('{} is not a version {} Markov chain snapshot'.format(
+            file_path, SNAPSHOT_VERSION))
+    if fingerprint is not None and saved_fingerprint != fingerprint.ljust(32, b'\0'):
+        raise ValueError('{} was built from a different corpus'.format(file_path))
+
+    # Size in bytes of each array, from the counts in the header
+    sizes = []
+    for name, type_code in SNAPSHOT_ARRAYS:
+        if name.startswith('start_'):
+            length = starts
+        elif name == 'state_keys':
+            length = states
+        elif name == 'offsets':
+            length = states + 1
+        else:
+            length = edges
+        sizes.append(length * struct.calcsize(type_code))
+    # A truncated or padded file would otherwise load with short or empty arrays
+    expected_size = sum(size + len(_padding(size)) for size in [SNAPSHOT_HEADER.size, vocab_length] + sizes)
+    if len(data) != expected_size:
+        raise ValueError('{} is {} bytes, but its header describes {} bytes'.format(
+            file_path, len(data), expected_size))
+
+    view = memoryview(data)
+    position = SNAPSHOT_HEADER.size + len(_padding(SNAPSHOT_HEADER.size))
+    vocab_bytes = bytes(view[position:position + vocab_length])
+    vocab = vocab_bytes.decode('utf-8').split('\0') if vocab_size else []
+    if len(vocab) != vocab_size:
+        raise ValueError('{} has {} words, but its header describes {}'.format(file_path, len(vocab), vocab_size))
+    position += vocab_length + len(_padding(vocab_length))
+
+    arrays = []
+    for (name, type_code), size in zip(SNAPSHOT_ARRAYS, sizes):
+        arrays.append(view[position:position + size].cast(type_code))
+        position += size + len(_padding(size))
+
+    markov_chain = ArrayMarkovChain(order, vocab, *arrays)
+    markov_chain.buffer = data  # Keep the mapping open as long as the chain is alive
+    return markov_chain
+
+
+@profiled('markov_array.random_walk')
+def random_walk(markov_chain: ArrayMarkovChain, start_words: tuple, length=10, rng=None) -> str:
+    """
+    Generate a random sentence using the array-backed Markov chain.
+
+    Args:
+        markov_chain (ArrayMarkovChain): The chain built by build_markov_chain.
+        start_words (tuple): The words to start the sentence, from the corpus.
+        length (int, optional): The number of words in the generated sentence. Defaults to 10.
+        rng (optional): A random.Random or numpy.random.Generator to sample with, so a seeded one
+            replays the same sentence. Defaults to the random module.
+
+    Returns:
+        str: The randomly generated sentence.
+    """
+    return format_sentence(markov_chain.walk(start_words, length, rng))
+
+
+def random_walk_many(markov_chain: ArrayMarkovChain, n: int, length=10, rng=None) -> list:
+    """
+    Generate n random sentences at once, each from a start state drawn with sample_start. All the walks
+    advance together one word per step, and each stops on its own at a sentence ending or a dead end.
+
+    Args:
+        markov_chain (ArrayMarkovChain): The chain built by build_markov_chain.
+        n (int): The number of sentences to generate.
+        length (int, optional): The most words in each generated sentence. Defaults to 10.
+        rng (optional): A numpy.random.Generator or random.Random to draw with. Defaults to a shared
+            NumPy generator, or the random module without NumPy.
+
+    Returns:
+        list: The n randomly generated sentences.
+    """
+    if numpy is not None and not isinstance(rng, random.Random):
+        rows = _walk_many_numpy(markov_chain, n, length, rng or default_generator())
+    else:
+        rows = _walk_many_python(markov_chain, n, length, rng or random)
+    vocab = markov_chain.vocab
+    return [format_sentence([vocab[word_id] for word_id in row]) for row in rows]
+
+
+def _walk_many_numpy(markov_chain: ArrayMarkovChain, n: int, length: int, rng) -> list:
+    """Return the word IDs of n walks, advanced together with vectorized NumPy operations."""
+    arrays = markov_chain.numpy_arrays()
+    order = markov_chain.order
+    size = len(markov_chain.vocab)
+
+    # Draw every start state at once from the start index's alias table
+    starts = (rng.random(n) * len(arrays['start_states'])).astype(numpy.int64)
+    starts = numpy.where(rng.random(n) < arrays['start_probabilities'][starts],
+                         starts, arrays['start_aliases'][starts])
+    states = arrays['start_states'][starts].astype(numpy.int64)
+
+    # Unpack the start states into the first `order` words of each walk, -1 marks unused words
+    word_ids = numpy.full((n, max(length, order)), -1, dtype=numpy.int64)
+    state_keys = arrays['state_keys'][states]
+    for column in range(order - 1, -1, -1):
+        state_keys, word_ids[:, column] = numpy.divmod(state_keys, size)
+
+    walking = numpy.arange(n)
+    for column in range(order, length):
+        if walking.size == 0:
+            break
+        current = states[walking]
+        # Pick a column of each state's alias table, then keep it or take its alias
+        first = arrays['offsets'][current]
+        degree = arrays['offsets'][current + 1] - first
+        edges = first + (rng.random(walking.size) * degree).astype(numpy.int64)
+        edges = numpy.where(rng.random(walking.size) < arrays['probabilities'][edges],
+                            edges, arrays['aliases'][edges])
+
+        next_words = arrays['successors'][edges]
+        word_ids[walking, column] = next_words
+        next_states = arrays['next_states'][edges]
+        states[walking] = next_states
+        # Walks that reach a sentence ending or a state with no successors are finished
+        walking = walking[~(arrays['ends_sentence'][next_words] | (next_states == -1))]
+
+    return [row[row >= 0].tolist() for row in word_ids]
+
+
+def _walk_many_python(markov_chain: ArrayMarkovChain, n: int, length: int, rng) -> list:
+    """Return the word IDs of n walks, advanced together one word per step in plain Python."""
+    offsets = markov_chain.offsets
+    probabilities = markov_chain.probabilities
+    aliases = markov_chain.aliases
+    successors = markov_chain.successors
+    next_states = markov_chain.next_states
+    ends_sentence = markov_chain.ends_sentence()
+    random_value = rng.random
+
+    rows = []
+    states = []
+    for _ in range(n):
+        start_words = markov_chain.sample_start(rng)
+        rows.append([markov_chain.word_ids[word] for word in start_words])
+        states.append(markov_chain.state_index(start_words))
+
+    walking = list(range(n))
+    for _ in range(markov_chain.order, length):
+        if not walking:
+            break
+        still_walking = []
+        for walk in walking:
+            state = states[walk]
+            first = offsets[state]
+            edge = first + int(random_value() * (offsets[state + 1] - first))
+            if random_value() >= probabilities[edge]:
+                edge = aliases[edge]
+            rows[walk].append(successors[edge])
+            states[walk] = next_states[edge]
+            if states[walk] != -1 and not ends_sentence[successors[edge]]:
+                still_walking.append(walk)
+        walking = still_walking
+    return rows
+
+
+def compare_engines(word_list: list, order=2):
+    """
+    Prints the build time and memory of the dict-based and array-based second-order Markov chains.
+
+    Args:
+        word_list (list): List of words (strings) representing the corpus.
+        order (int, optional): Order of the array-based chain. Defaults to 2.
+    """
+    builders = [('dict', build_second_order_markov_chain),
+                ('array', lambda words: build_markov_chain(words, order))]
+    for name, builder in builders:
+        build_time = min(timeit.repeat(lambda: builder(word_list), number=1, repeat=3))
+
+        # Measure the memory still held by the chain once it is built
+        tracemalloc.start()
+        markov_chain = builder(word_list)
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f'{name:>5} chain: {len(markov_chain)} states, '
+              f'build time {build_time:.3f} s, memory {memory / 1024 / 1024:.1f} MiB')
+
+
+if __name__ == '__main__':
+    with open('cleaned_tokens.json', 'r', encoding='utf-8') as file:
+        cleaned_tokens = json.load(file)
+
+    markov_chain = build_markov_chain(cleaned_tokens)
+    start_words = markov_chain.sample_start()
+    print(random_walk(markov_chain, start_words, 30))
+
+    print("\n")
+    print("################### Benchmark #########################")
+    compare_engines(cleaned_tokens)
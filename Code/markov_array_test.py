@@ -0,0 +1,163 @@
+#!python
+
+from markov_array import (SNAPSHOT_HEADER, build_markov_chain, load_markov_chain, random_walk, random_walk_many,
+                          save_markov_chain, _padding, _walk_many_numpy, _walk_many_python)
+from markov_chain_second import build_second_order_markov_chain
+import os
+import random
+import sampling
+import tempfile
+import unittest
+
+
+class ArrayMarkovChainTest(unittest.TestCase):
+
+    # Test fixtures: a tiny corpus with a few repeated word pairs
+    words = ('one fish two fish red fish blue fish one fish two fish '
+             'red fish. blue fish? one fish').split()
+
+    def successor_counts(self, markov_chain, state):
+        index = markov_chain.state_index(state)
+        start, end = markov_chain.offsets[index], markov_chain.offsets[index + 1]
+        return {markov_chain.vocab[markov_chain.successors[edge]]: markov_chain.counts[edge]
+                for edge in range(start, end)}
+
+    def test_matches_dict_chain(self):
+        markov_chain = build_markov_chain(self.words)
+        dict_chain = build_second_order_markov_chain(self.words)
+        # Same states, and every state has the same successor counts
+        assert len(markov_chain) == len(dict_chain)
+        self.assertCountEqual(markov_chain.keys(), dict_chain.keys())
+        for state, histogram in dict_chain.items():
+            assert state in markov_chain
+            assert self.successor_counts(markov_chain, state) == dict(histogram)
+
+    def test_accepts_generator(self):
+        markov_chain = build_markov_chain(word for word in self.words)
+        assert self.successor_counts(markov_chain, ('one', 'fish')) == {'two': 2}
+
+    def test_contains(self):
+        markov_chain = build_markov_chain(self.words)
+        assert ('fish', 'red') in markov_chain
+        assert ('blue', 'fish?') in markov_chain
+        assert ('fish', 'food') not in markov_chain
+        assert ('fish',) not in markov_chain
+
+    def test_start_states(self):
+        markov_chain = build_markov_chain(self.words)
+        starts = {markov_chain._unpack(markov_chain.state_keys[state]): count
+                  for state, count in zip(markov_chain.start_states, markov_chain.start_counts)}
+        assert starts == build_second_order_markov_chain(self.words).starts
+        for _ in range(100):
+            assert markov_chain.sample_start() in starts
+
+    def test_walk(self):
+        markov_chain = build_markov_chain(self.words)
+        for _ in range(100):
+            sentence = markov_chain.walk(('one', 'fish'), 10)
+            assert sentence[:2] == ['one', 'fish']
+            assert len(sentence) <= 10
+            # Every step must follow a pair seen in the corpus
+            for i in range(len(sentence) - 2):
+                state = (sentence[i], sentence[i + 1])
+                assert sentence[i + 2] in self.successor_counts(markov_chain, state)
+
+    def test_seeded_rng_replays(self):
+        markov_chain = build_markov_chain(self.words)
+        # The same seed must replay the same start and walk
+        first = markov_chain.walk(markov_chain.sample_start(random.Random(5)), 20, random.Random(5))
+        second = markov_chain.walk(markov_chain.sample_start(random.Random(5)), 20, random.Random(5))
+        assert first == second
+        assert random_walk_many(markov_chain, 20, 8, random.Random(5)) == \
+            random_walk_many(markov_chain, 20, 8, random.Random(5))
+
+    def check_walk_rows(self, markov_chain, rows, length):
+        words = [[markov_chain.vocab[word_id] for word_id in row] for row in rows]
+        for sentence in words:
+            assert tuple(sentence[:2]) in markov_chain
+            assert len(sentence) <= length
+            # Every step must follow a pair seen in the corpus
+            for i in range(len(sentence) - 2):
+                assert sentence[i + 2] in self.successor_counts(markov_chain, tuple(sentence[i:i + 2]))
+            # Walks only stop early at a sentence ending or a dead end
+            if len(sentence) < length:
+                assert sentence[-1].endswith(('.', '!', '?')) or \
+                    tuple(sentence[-2:]) not in markov_chain
+
+    def test_walk_many_python(self):
+        markov_chain = build_markov_chain(self.words)
+        rows = _walk_many_python(markov_chain, 200, 8, random.Random(3))
+        assert len(rows) == 200
+        self.check_walk_rows(markov_chain, rows, 8)
+
+    @unittest.skipIf(sampling.numpy is None, 'NumPy is not installed')
+    def test_walk_many_numpy(self):
+        markov_chain = build_markov_chain(self.words)
+        rows = _walk_many_numpy(markov_chain, 200, 8, sampling.numpy.random.default_rng(3))
+        assert len(rows) == 200
+        self.check_walk_rows(markov_chain, rows, 8)
+
+    def test_random_walk_many(self):
+        markov_chain = build_markov_chain(self.words)
+        sentences = random_walk_many(markov_chain, 50, 8)
+        assert len(sentences) == 50
+        for sentence in sentences:
+            assert sentence[0].isupper()
+            assert sentence.endswith(('.', '!', '?'))
+
+    def test_random_walk_unknown_start(self):
+        markov_chain = build_markov_chain(self.words)
+        assert random_walk(markov_chain, ('croissant', 'nope'), 10) == 'Croissant nope.'
+
+    def test_snapshot_round_trip(self):
+        markov_chain = build_markov_chain(self.words)
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'fish.chain')
+            save_markov_chain(markov_chain, file_path, fingerprint=b'fish')
+            for use_mmap in (True, False):
+                loaded = load_markov_chain(file_path, fingerprint=b'fish', use_mmap=use_mmap)
+                assert loaded.order == markov_chain.order
+                assert loaded.vocab == markov_chain.vocab
+                assert list(loaded.keys()) == list(markov_chain.keys())
+                for name in ('offsets', 'successors', 'counts', 'next_states', 'aliases',
+                             'start_states', 'start_counts', 'start_aliases'):
+                    assert list(getattr(loaded, name)) == list(getattr(markov_chain, name))
+                assert loaded.walk(('one', 'fish'), 3) == ['one', 'fish', 'two']
+
+    def test_snapshot_rejects_other_corpus(self):
+        markov_chain = build_markov_chain(self.words)
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'fish.chain')
+            save_markov_chain(markov_chain, file_path, fingerprint=b'fish')
+            with self.assertRaises(ValueError):
+                load_markov_chain(file_path, fingerprint=b'chips')
+            # A truncated snapshot is rejected, whether the cut lands inside an array or drops whole ones
+            with open(file_path, 'rb') as file:
+                data = file.read()
+            for cut in (3, 40):
+                with open(file_path, 'wb') as file:
+                    file.write(data[:-cut])
+                for use_mmap in (True, False):
+                    with self.assertRaises(ValueError):
+                        load_markov_chain(file_path, use_mmap=use_mmap)
+            # A vocabulary that splits into a different number of words than the header says is rejected
+            save_markov_chain(markov_chain, file_path)
+            with open(file_path, 'rb') as file:
+                data = bytearray(file.read())
+            separator = data.index(b'\0', SNAPSHOT_HEADER.size + len(_padding(SNAPSHOT_HEADER.size)))
+            data[separator] = ord('_')
+            with open(file_path, 'wb') as file:
+                file.write(data)
+            with self.assertRaises(ValueError):
+                load_markov_chain(file_path)
+            with open(file_path, 'wb') as file:
+                file.write(b'not a snapshot')
+            with self.assertRaises(ValueError):
+                load_markov_chain(file_path)
+            # A word containing NUL would shift every word ID after it, so it cannot be saved
+            with self.assertRaises(ValueError):
+                save_markov_chain(build_markov_chain(['one', 'fi\0sh', 'two', 'fish']), file_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
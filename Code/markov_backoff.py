@@ -0,0 +1,165 @@
+"""Markov chain that holds every order from 1 up to N and backs off to lower orders while walking."""
+from collections import deque
+import json
+import timeit
+
+from dictogram import Dictogram
+from markov_chain_second import SENTENCE_ENDINGS, build_second_order_markov_chain, ends_sentence, format_sentence
+
+
+class ContextNode(Dictogram):
+    """
+    Dictogram of the words that follow one context, plus the longer contexts that extend it.
+
+    The node for context (w2, w3) is the child of the node for (w3,) under the key w2, so
+    contexts of every order that end with the same words share their path from the root.
+    """
+
+    # Dict of earlier word to longer context node, set on the instance when the first one is added
+    children = None
+
+
+class BackoffMarkovChain(object):
+    """Markov chain of orders 1 to `order`, stored as a tree of contexts read from the newest word back."""
+
+    def __init__(self, order=3):
+        """Initialize this chain with no words; use build_backoff_markov_chain to build one."""
+        self.order = order  # Highest number of words in a context
+        self.root = ContextNode()  # Empty context, its children are the order 1 contexts
+        self.contexts = 0  # Number of contexts of every order
+        # Dictogram of the `order` word states that begin a sentence, weighted by how often they do
+        self.starts = Dictogram()
+
+    def __len__(self):
+        """Return the number of contexts of every order."""
+        return self.contexts
+
+    def add_words(self, word_list):
+        """Count every context of orders 1 to `order` that precedes each word, in one pass."""
+        history = deque(maxlen=self.order)
+        # The first state of the words begins a sentence
+        starts_sentence = True
+        for next_word in word_list:
+            node = self.root
+            # Extend the context one word further into the past at each level
+            for word in reversed(history):
+                if node.children is None:
+                    node.children = {}
+                child = node.children.get(word)
+                if child is None:
+                    child = node.children[word] = ContextNode()
+                    self.contexts += 1
+                child.add_count(next_word)
+                node = child
+            if len(history) == self.order:
+                if starts_sentence:
+                    self.starts.add_count(tuple(history))
+                # The next state begins a sentence if the word dropping out of the history ends one
+                starts_sentence = history[0].endswith(SENTENCE_ENDINGS)
+            history.append(next_word)
+
+    def sample_start(self, rng=None) -> tuple:
+        """Return a state of `order` words that begins a sentence, weighted by how many sentences in the
+        corpus begin with it."""
+        return self.starts.sample(rng)
+
+    def context(self, history, min_successors=2):
+        """
+        Return the histogram of the highest order context ending history that has at least min_successors
+        distinct next words. If no context has that many, return the highest order context found, or None
+        if even the last word was never followed by anything.
+        """
+        node = self.root
+        deepest = None
+        best = None
+        for depth in range(1, min(self.order, len(history)) + 1):
+            if node.children is None:
+                break
+            node = node.children.get(history[-depth])
+            if node is None:
+                break
+            deepest = node
+            if node.types >= min_successors:
+                best = node
+        return best if best is not None else deepest
+
+    def walk(self, start_words, length=10, min_successors=2, rng=None) -> list:
+        """Return the list of words visited by a random walk from the given words, like random_walk."""
+        sentence = list(start_words)
+        while len(sentence) < length:
+            histogram = self.context(sentence, min_successors)
+            if histogram is None:
+                break
+            next_word = histogram.sample(rng)
+            sentence.append(next_word)
+
+            # End the sentence if we encounter a period, exclamation mark, or question mark
+            if ends_sentence(next_word):
+                break
+        return sentence
+
+
+def build_backoff_markov_chain(word_list, order=3) -> BackoffMarkovChain:
+    """
+    Takes an iterable of strings to build a Markov chain of every order from 1 up to `order`.
+
+    Args:
+        word_list (iterable): Words (strings) representing the corpus, in order.
+        order (int, optional): Highest number of words in a context. Defaults to 3.
+
+    Returns:
+        BackoffMarkovChain: The chain, where each order holds the same counts as build_markov_chain.
+    """
+    markov_chain = BackoffMarkovChain(order)
+    markov_chain.add_words(word_list)
+    return markov_chain
+
+
+def random_walk(markov_chain: BackoffMarkovChain, start_words: tuple, length=10, min_successors=2,
+                rng=None) -> str:
+    """
+    Generate a random sentence, backing off to a lower order whenever the current context is missing
+    or has fewer than min_successors distinct next words.
+
+    Args:
+        markov_chain (BackoffMarkovChain): The chain built by build_backoff_markov_chain.
+        start_words (tuple): The words to start the sentence, from the corpus. Any number of words works.
+        length (int, optional): The number of words in the generated sentence. Defaults to 10.
+        min_successors (int, optional): Fewest distinct next words a context needs to be used. Defaults to 2.
+        rng (optional): A random.Random or numpy.random.Generator to sample with. Defaults to the random module.
+
+    Returns:
+        str: The randomly generated sentence.
+    """
+    return format_sentence(markov_chain.walk(start_words, length, min_successors, rng))
+
+
+def benchmark_build(word_list: list, order=3):
+    """
+    Prints the build time of the backoff chain next to the second-order Markov chain.
+
+    Args:
+        word_list (list): List of words (strings) representing the corpus.
+        order (int, optional): Highest order of the backoff chain. Defaults to 3.
+    """
+    second_order_time = min(timeit.repeat(
+        lambda: build_second_order_markov_chain(word_list), number=1, repeat=3))
+    backoff_time = min(timeit.repeat(
+        lambda: build_backoff_markov_chain(word_list, order), number=1, repeat=3))
+    print(f'Second-order Markov chain build time: {second_order_time:.3f} s')
+    print(f'Backoff chain of orders 1-{order} build time: {backoff_time:.3f} s '
+          f'({backoff_time / second_order_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    with open('cleaned_tokens.json', 'r', encoding='utf-8') as file:
+        cleaned_tokens = json.load(file)
+
+    markov_chain = build_backoff_markov_chain(cleaned_tokens, order=4)
+    print(random_walk(markov_chain, ('gregor', 'was'), 30))
+    print(random_walk(markov_chain, ('Anne',), 30))
+
+    print("\n")
+    print("################### Benchmark #########################")
+    benchmark_build(cleaned_tokens, order=3)
+    benchmark_build(cleaned_tokens, order=4)
@@ -0,0 +1,61 @@
+#!python
+
+from markov_backoff import build_backoff_markov_chain
+from markov_chain_second import build_markov_chain
+import unittest
+
+
+class BackoffMarkovChainTest(unittest.TestCase):
+
+    # Test fixtures: a tiny corpus with a few repeated word pairs
+    words = ('one fish two fish red fish blue fish one fish two fish '
+             'red fish. blue fish? one fish').split()
+
+    def test_every_order_matches_single_order_chain(self):
+        markov_chain = build_backoff_markov_chain(self.words, order=3)
+        for order in (1, 2, 3):
+            for state, histogram in build_markov_chain(self.words, order).items():
+                # Every order-n state is the context n words deep in the tree
+                node = markov_chain.root
+                for word in reversed(state):
+                    node = node.children[word]
+                assert node == histogram
+                assert node.tokens == histogram.tokens
+
+    def test_starts_match_single_order_chain(self):
+        for order in (1, 2, 3):
+            markov_chain = build_backoff_markov_chain(self.words, order)
+            single_order_chain = build_markov_chain(self.words, order)
+            assert markov_chain.starts == single_order_chain.starts
+            assert markov_chain.sample_start() in single_order_chain.starts
+        # Every context of every order is counted
+        markov_chain = build_backoff_markov_chain(self.words, order=3)
+        assert len(markov_chain) == sum(len(build_markov_chain(self.words, order)) for order in (1, 2, 3))
+
+    def test_context_backs_off(self):
+        markov_chain = build_backoff_markov_chain(self.words, order=3)
+        # ('two', 'fish', 'red') is always followed by 'fish' or 'fish.'
+        assert markov_chain.context(['two', 'fish', 'red']) == {'fish': 1, 'fish.': 1}
+        # ('one', 'fish') is only ever followed by 'two', so back off to ('fish',)
+        assert markov_chain.context(['one', 'fish']) is markov_chain.root.children['fish']
+        # Without a minimum, the highest order context is used
+        assert markov_chain.context(['one', 'fish'], min_successors=1) == {'two': 2}
+        # Unseen older words fall back to the context of the newer ones
+        assert markov_chain.context(['croissant', 'fish', 'red'], min_successors=1) == \
+            {'fish': 1, 'fish.': 1}
+        # A word that is never followed by anything has no context at all
+        assert markov_chain.context(['croissant']) is None
+
+    def test_walk(self):
+        markov_chain = build_backoff_markov_chain(self.words, order=3)
+        for _ in range(100):
+            sentence = markov_chain.walk(['one'], 12)
+            assert sentence[0] == 'one'
+            assert len(sentence) <= 12
+            # Every step must at least follow its previous word somewhere in the corpus
+            for previous, word in zip(sentence, sentence[1:]):
+                assert word in markov_chain.root.children[previous]
+
+
+if __name__ == '__main__':
+    unittest.main()
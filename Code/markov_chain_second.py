@@ -1,9 +1,290 @@
 # Import Dictogram from the dictogram module.
 from dictogram import Dictogram
-import random
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import gc
+import os
 import timeit
+from profiling import profiled
 
 
+# Words ending with one of these end a sentence, so the state after them starts one
+SENTENCE_ENDINGS = ('.', '!', '?')
+
+
+class MarkovChain(dict):
+    """MarkovChain is a subclass of the dict type that maps each state (a tuple of words) to a Dictogram
+    of the words that follow it, and keeps an index of the states that begin sentences."""
+
+    def __init__(self, order=2):
+        """Initialize this chain as a new empty dict of states with the given number of words each."""
+        super(MarkovChain, self).__init__()  # Initialize this as a new dict
+        self.order = order  # Number of words in each state
+        # Dictogram of the states that begin a sentence, weighted by how often they do. Its alias
+        # table is rebuilt on the next sample after any add_start, so drawing a start stays O(1).
+        self.starts = Dictogram()
+
+    def add_count(self, state, next_word, count=1):
+        """Increase the count of next_word following the given state by count."""
+        histogram = self.get(state)
+        if histogram is None:
+            histogram = self[state] = Dictogram()
+        histogram.add_count(next_word, count)
+
+    def add_start(self, state, count=1):
+        """Increase the number of sentences that begin with the given state by count."""
+        self.starts.add_count(state, count)
+
+    def sample_start(self, rng=None):
+        """Return a state that begins a sentence, weighted by how many sentences in the corpus begin with it."""
+        return self.starts.sample(rng)
+
+    def generate_words(self, start_words, stop=None, rng=None):
+        """Yield the start words and then each word of a random walk from them, see generate_words."""
+        return generate_words(self, start_words, stop, rng)
+
+    def walk(self, start_words, length=10, rng=None):
+        """Return the list of words visited by a random walk from the given state, see walk."""
+        return walk(self, start_words, length, rng=rng)
+
+
+def build_markov_chain(word_list, order=2) -> MarkovChain:
+    """
+    Takes an iterable of strings to build a Markov chain where each tuple of `order` words points to a Dictogram of the words that follow it.
+
+    Args:
+        word_list (iterable): Words (strings) representing the corpus, in order. Any iterable works, including generators.
+        order (int, optional): Number of words in each state. Defaults to 2.
+
+    Returns:
+        MarkovChain: A dictionary where each key is a tuple of `order` words and each value is a Dictogram of the words that follow it and their frequency.
+    """
+    #  Initialize dictionary
+    markov_chain = MarkovChain(order)
+
+    # Fill a rolling window with the first state, then slide it one word at a time
+    words = iter(word_list)
+    window = deque(islice(words, order), maxlen=order)
+    if len(window) < order:
+        return markov_chain
+
+    # The first state of the corpus begins a sentence
+    starts_sentence = True
+    for next_word in words:
+        state = tuple(window)
+
+        # If the state is not in the chain, add it with an empty Dictogram
+        histogram = markov_chain.get(state)
+        if histogram is None:
+            histogram = markov_chain[state] = Dictogram()
+
+        # Add the next word to the Dictogram for this state
+        histogram.add_count(next_word)
+        if starts_sentence:
+            markov_chain.add_start(state)
+
+        # The next state begins a sentence if the word dropping out of the window ends one
+        starts_sentence = window[0].endswith(SENTENCE_ENDINGS)
+        window.append(next_word)
+
+    return markov_chain
+
+
+# Words interned at a time while building the array of word IDs, so a generator is never read into a list
+INTERN_CHUNK_SIZE = 65536
+
+# Fewest transitions worth counting in a worker process; a smaller shard takes less time to count than
+# to start and feed the process
+MIN_SHARD_TRANSITIONS = 100000
+
+
+def count_shard(ids, ends_sentence, order, offset, follows_sentence_end, partitions) -> list:
+    """
+    Count the transitions in one contiguous shard of a corpus of word IDs, bucketed into partitions of
+    their states. A state belongs to partition hash(state) % partitions, so each partition can be merged
+    on its own in any process; integer tuples hash the same in every process.
+
+    Args:
+        ids (array): Word IDs of the shard, followed by the `order` words after it, so the shard's last
+            states have their next words.
+        ends_sentence (bytes): Whether each word ID ends a sentence.
+        order (int): Number of words in each state.
+        offset (int): Position of the shard's first word in the corpus.
+        follows_sentence_end (bool): Whether the word before the shard ends a sentence, or it starts the corpus.
+        partitions (int): Number of partitions.
+
+    Returns:
+        list: The counts of each partition, as pack_counts returns them, with positions in the corpus.
+    """
+    buckets = [({}, {}) for _ in range(partitions)]
+    transitions = zip(*[ids[i:] for i in range(order + 1)])
+    for position, transition in enumerate(transitions):
+        state = transition[:-1]
+        successors_of, starts = buckets[hash(state) % partitions]
+        successors = successors_of.get(state)
+        if successors is None:
+            successors = successors_of[state] = {}
+        next_id = transition[-1]
+        successors[next_id] = successors.get(next_id, 0) + 1
+        # The state begins a sentence if it starts the corpus or follows a sentence ending
+        if ends_sentence[ids[position - 1]] if position else follows_sentence_end:
+            start = starts.get(state)
+            if start is None:
+                starts[state] = [offset + position, 1]
+            else:
+                start[1] += 1
+    return [pack_counts(successors_of, starts) for successors_of, starts in buckets]
+
+
+def merge_partition(shards, order) -> tuple:
+    """
+    Add up the counts of one partition from every shard.
+
+    Args:
+        shards (list): The partition's counts from each shard, in corpus order, as pack_counts returns them.
+        order (int): Number of words in each state.
+
+    Returns:
+        tuple: The partition's counts, as pack_counts returns them.
+    """
+    if len(shards) == 1:
+        return shards[0]
+    successors_of = {}
+    starts = {}
+    for state_ids, lengths, successor_ids, counts, start_positions, start_ids, start_counts in shards:
+        successor_counts = zip(successor_ids, counts)
+        for state, length in zip(zip(*[iter(state_ids)] * order), lengths):
+            successors = successors_of.get(state)
+            if successors is None:
+                successors_of[state] = dict(islice(successor_counts, length))
+            else:
+                for next_id, count in islice(successor_counts, length):
+                    successors[next_id] = successors.get(next_id, 0) + count
+        for position, state, count in zip(start_positions, zip(*[iter(start_ids)] * order), start_counts):
+            start = starts.get(state)
+            if start is None:
+                # Shards come in corpus order, so the first one to have a state has its first position
+                starts[state] = [position, count]
+            else:
+                start[1] += count
+    return pack_counts(successors_of, starts)
+
+
+def pack_counts(successors_of, starts) -> tuple:
+    """
+    Pack counts into flat arrays, which pickle as a few memory copies, unlike millions of small objects.
+
+    Args:
+        successors_of (dict): Count of each next word ID of each state, a tuple of word IDs.
+        starts (dict): [first position, count] of each state that begins a sentence.
+
+    Returns:
+        tuple: Arrays, in the order of the dicts: the word IDs of each state, one after another; its
+            number of distinct next words; the IDs of those words; their counts; then the first position,
+            word IDs and count of each state that begins a sentence.
+    """
+    state_ids, lengths, successor_ids, counts = array('i'), array('i'), array('i'), array('i')
+    for state, successors in successors_of.items():
+        state_ids.extend(state)
+        lengths.append(len(successors))
+        successor_ids.extend(successors.keys())
+        counts.extend(successors.values())
+    start_positions, start_ids, start_counts = array('q'), array('i'), array('i')
+    for state, (position, count) in starts.items():
+        start_positions.append(position)
+        start_ids.extend(state)
+        start_counts.append(count)
+    return state_ids, lengths, successor_ids, counts, start_positions, start_ids, start_counts
+
+
+def build_markov_chain_parallel(word_list, order=2, workers=None) -> MarkovChain:
+    """
+    Build the same Markov chain as build_markov_chain in a pool of processes, in two rounds.
+
+    The corpus is interned to an array of word IDs, 4 bytes a word, and cut into one contiguous shard per
+    worker. Each worker counts the transitions of its shard only, bucketed by partition of their states.
+    Then each partition's buckets from every shard are added up in a worker, so both rounds divide their
+    work across the workers. The parent only turns the merged arrays into Dictograms. That part is
+    serial, and takes about a third of the time of a serial build, so it is the floor of the build time.
+
+    Args:
+        word_list (iterable): Words (strings) representing the corpus, in order. Any iterable works, including generators.
+        order (int, optional): Number of words in each state. Defaults to 2.
+        workers (int, optional): Most worker processes, shards and partitions. Defaults to the number of
+            CPUs. Each shard gets at least MIN_SHARD_TRANSITIONS transitions, and with one shard the chain
+            is built in this process by build_markov_chain.
+
+    Returns:
+        MarkovChain: A dictionary where each key is a tuple of `order` words and each value is a Dictogram
+            of the words that follow it and their frequency. Each Dictogram and the start states are in
+            the same order as in build_markov_chain, but the states are grouped by partition.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Intern the words a chunk at a time, so the workers get a compact array and the chain shares one
+    # string per word
+    word_ids = {}
+    ids = array('i')
+    words = iter(word_list)
+    while True:
+        size = len(ids)
+        ids.extend(word_ids.setdefault(word, len(word_ids)) for word in islice(words, INTERN_CHUNK_SIZE))
+        if len(ids) == size:
+            break
+    vocab = list(word_ids)
+
+    transitions = len(ids) - order
+    workers = max(1, min(workers, transitions // MIN_SHARD_TRANSITIONS))
+    if workers == 1:
+        # Nothing to split, so build it here from the interned words
+        return build_markov_chain(map(vocab.__getitem__, ids), order)
+    ends_sentence = bytes(word.endswith(SENTENCE_ENDINGS) for word in vocab)
+    # Each shard holds its transitions' states and next words, overlapping the next shard by `order` words
+    bounds = [transitions * shard // workers for shard in range(workers + 1)]
+    shards = [(ids[first:last + order], ends_sentence, order, first,
+               first == 0 or bool(ends_sentence[ids[first - 1]]), workers)
+              for first, last in zip(bounds, bounds[1:])]
+    del ids
+
+    def merged_partitions():
+        """Yield the merged counts of each partition, as soon as it is ready."""
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            counted = list(executor.map(count_shard, *zip(*shards)))
+            futures = [executor.submit(merge_partition, [buckets[partition] for buckets in counted], order)
+                       for partition in range(workers)]
+            del counted
+            for future in futures:
+                yield future.result()
+
+    markov_chain = MarkovChain(order)
+    starts = []
+    # Nothing built below can form a reference cycle, so the garbage collector would only rescan the
+    # growing chain over and over, which takes about a third of the merge time
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for state_ids, lengths, successor_ids, counts, start_positions, start_ids, start_counts in \
+                merged_partitions():
+            # Look up every word at once, then take each state's next words and counts in turn
+            state_words = iter(list(map(vocab.__getitem__, state_ids)))
+            successor_counts = zip(map(vocab.__getitem__, successor_ids), counts.tolist())
+            for state, length in zip(zip(*[state_words] * order), lengths):
+                markov_chain[state] = Dictogram.from_counts(islice(successor_counts, length))
+            start_words = iter(list(map(vocab.__getitem__, start_ids)))
+            starts.extend(zip(start_positions, zip(*[start_words] * order), start_counts))
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    # Add the start states in the order they first appear in the corpus, as build_markov_chain does
+    starts.sort()
+    for _, state, count in starts:
+        markov_chain.add_start(state, count)
+    return markov_chain
+
+
+@profiled('markov_chain_second.build_second_order_markov_chain')
 def build_second_order_markov_chain(word_list: list) -> dict:
     """
     Takes a list of strings to build a Markov chain where each word pair points to a Dictogram of the words that follow it. 
@@ -14,56 +295,123 @@ def build_second_order_markov_chain(word_list: list) -> dict:
     Returns:
         dict: A dictionary where each key is a word pair (tuple) and each value is a Dictogram of the words that follow it and their frequency.
     """
-    #  Initialize dictionary
-    markov_chain = {}
+    return build_markov_chain(word_list, order=2)
 
-    # Iterate over word_list to build the chain
-    for i in range(len(word_list) - 2):
-        word_pair = (word_list[i], word_list[i + 1])
-        next_word = word_list[i + 2]
 
-        # If the word pair is not in the chain, add it with an empty Dictogram
-        if word_pair not in markov_chain:
-            markov_chain[word_pair] = Dictogram()
+def ends_sentence(word: str) -> bool:
+    """Return True if the given word ends a sentence, that is it ends in a period, exclamation mark, or question mark."""
+    return word.endswith(SENTENCE_ENDINGS)
 
-        # Add the next word to the Dictogram for this word pair
-        markov_chain[word_pair].add_count(next_word)
 
-    return markov_chain
+def generate_words(markov_chain: dict, start_words: tuple, stop=None, rng=None):
+    """
+    Walk the Markov chain from the given state one word at a time, for a chain of any order.
+    Only the current state is kept, so the walk can go on for any number of words in constant memory.
 
+    Args:
+        markov_chain (dict): A dictionary where each key is a tuple of words and each value is a Dictogram of the words that follow it and their frequency.
+        start_words (tuple): The words to start the walk, as many as the order of the chain.
+        stop (func, optional): Called with each sampled word, the walk ends after a word it returns True for.
+        rng (optional): A random.Random or numpy.random.Generator to sample with. Defaults to the random module.
 
-def random_walk(markov_chain: dict, start_words: tuple, length=10) -> str:
+    Yields:
+        str: The start words, then each sampled word, until the walk reaches a state with no next words or stop returns True.
+    """
+    state = tuple(start_words)
+    yield from state
+
+    while True:
+        histogram = markov_chain.get(state)
+        if histogram is None:
+            return
+        next_word = histogram.sample(rng)
+        yield next_word
+        if stop is not None and stop(next_word):
+            return
+        # Drop the oldest word and add the new one to get the next state
+        state = state[1:] + (next_word,)
+
+
+def walk(markov_chain: dict, start_words: tuple, length=10, stop_at_end=True, rng=None) -> list:
+    """
+    Walk the Markov chain from the given state, for a chain of any order.
+
+    Args:
+        markov_chain (dict): A dictionary where each key is a tuple of words and each value is a Dictogram of the words that follow it and their frequency.
+        start_words (tuple): The words to start the walk, as many as the order of the chain.
+        length (int, optional): The maximum number of words to return, including the start words. Defaults to 10.
+        stop_at_end (bool, optional): Stop after a word ending in a period, exclamation mark, or question mark. Defaults to True.
+        rng (optional): A random.Random or numpy.random.Generator to sample with. Defaults to the random module.
+
+    Returns:
+        list: The start words followed by each sampled word.
+    """
+    words = generate_words(markov_chain, start_words, ends_sentence if stop_at_end else None, rng)
+    return list(islice(words, max(length, len(start_words))))
+
+
+def stream_sentences(markov_chain, max_sentences=None, max_words=None, sentence_length=30, rng=None):
+    """
+    Generate formatted sentences one after another, each from a new start state drawn with sample_start.
+    Works with any chain that has sample_start and generate_words methods, like MarkovChain and ArrayMarkovChain.
+
+    Args:
+        markov_chain (MarkovChain): The chain to generate from.
+        max_sentences (int, optional): Stop after this many sentences. Defaults to no limit.
+        max_words (int, optional): Stop once this many words have been generated in total. Defaults to no limit.
+        sentence_length (int, optional): The most words in one sentence. Defaults to 30.
+        rng (optional): A random.Random or numpy.random.Generator to sample with. Defaults to the random module.
+
+    Yields:
+        str: Each randomly generated sentence, as soon as it ends.
+    """
+    sentences = 0
+    words = 0
+    while max_sentences is None or sentences < max_sentences:
+        limit = sentence_length if max_words is None else min(sentence_length, max_words - words)
+        if limit <= 0:
+            return
+        start_words = markov_chain.sample_start(rng)
+        sentence = list(islice(markov_chain.generate_words(start_words, ends_sentence, rng), limit))
+        sentences += 1
+        words += len(sentence)
+        yield format_sentence(sentence)
+
+
+@profiled('markov_chain_second.random_walk')
+def random_walk(markov_chain: dict, start_words: tuple, length=10, rng=None) -> str:
     """
     Generate a random sentence using the Markov chain.
 
     Args:
-        markov_chain (dict): A dictionary where each key is a word pair (tuple) and each value is a Dictogram of the words that follow it and their frequency.
-        start_words (tuple): The word pair to start the sentence, from the corpus. 
+        markov_chain (dict): A dictionary where each key is a tuple of words and each value is a Dictogram of the words that follow it and their frequency.
+        start_words (tuple): The words to start the sentence, from the corpus, as many as the order of the chain.
         length (int, optional): The number of words in the generated sentence. Defaults to 10.
+        rng (optional): A random.Random or numpy.random.Generator to sample with, so a seeded one
+            replays the same sentence. Defaults to the random module.
 
     Returns:
         str: The randomly generated sentence.
     """
-    current_pair = start_words
-    sentence = list(start_words)
+    return format_sentence(walk(markov_chain, start_words, length, rng=rng))
 
-    while len(sentence) < length:
-        if current_pair in markov_chain:
-            next_word = markov_chain[current_pair].sample()
-            sentence.append(next_word)
-            current_pair = (current_pair[1], next_word)
 
-            # End the sentence if we encounter a period, exclamation mark, or question mark
-            if next_word.endswith(('.', '!', '?')):
-                break
-        else:
-            break
+def format_sentence(words: list) -> str:
+    """
+    Join the words of a generated sentence, capitalizing the first word and ending it with punctuation.
 
+    Args:
+        words (list): The words of the sentence, in order.
+
+    Returns:
+        str: The formatted sentence.
+    """
+    sentence = list(words)
     # Capitalize the first word of the sentence
     sentence[0] = sentence[0].capitalize()
     if sentence[-1].endswith(','):
         sentence[-1] = sentence[-1].replace(',', '') + '.'
-    elif not sentence[-1].endswith(('.', '!', '?')):
+    elif not sentence[-1].endswith(SENTENCE_ENDINGS):
         sentence[-1] += '.'
 
     return ' '.join(sentence)
@@ -79,26 +427,10 @@ def build_fourth_order_markov_chain(word_list: list) -> dict:
     Returns:
         dict: A dictionary where each key is a word quadruple (tuple) and each value is a Dictogram of the words that follow it and their frequency.
     """
-    # Initialize dictionary
-    markov_chain = {}
-
-    # Iterate over word_list to build the chain
-    for i in range(len(word_list) - 4):
-        word_quadruple = (word_list[i], word_list[i + 1],
-                          word_list[i + 2], word_list[i + 3])
-        next_word = word_list[i + 4]
-
-        # If the word quadruple is not in the chain, add it with an empty Dictogram
-        if word_quadruple not in markov_chain:
-            markov_chain[word_quadruple] = Dictogram()
-
-        # Add the next word to the Dictogram for this word quadruple
-        markov_chain[word_quadruple].add_count(next_word)
-
-    return markov_chain
+    return build_markov_chain(word_list, order=4)
 
 
-def random_walk_fourth(markov_chain: dict, start_words: tuple, length=10) -> str:
+def random_walk_fourth(markov_chain: dict, start_words: tuple, length=10, rng=None) -> str:
     """
     Generate a random sentence using the Markov chain.
 
@@ -106,23 +438,12 @@ def random_walk_fourth(markov_chain: dict, start_words: tuple, length=10) -> str
         markov_chain (dict): A dictionary where each key is a word quadruple (tuple) and each value is a Dictogram of the words that follow it and their frequency.
         start_words (tuple): The word quadruple to start the sentence, from the corpus. 
         length (int, optional): The number of words in the generated sentence. Defaults to 10.
+        rng (optional): A random.Random or numpy.random.Generator to sample with. Defaults to the random module.
 
     Returns:
         str: The randomly generated sentence.
     """
-    current_quadruple = start_words
-    sentence = list(start_words)
-
-    for _ in range(length - 4):
-        if current_quadruple in markov_chain:
-            next_word = markov_chain[current_quadruple].sample()
-            sentence.append(next_word)
-            current_quadruple = (
-                current_quadruple[1], current_quadruple[2], current_quadruple[3], next_word)
-        else:
-            break
-
-    return ' '.join(sentence)
+    return ' '.join(walk(markov_chain, start_words, length, stop_at_end=False, rng=rng))
 
 
 def benchmark_markov_chain(chain_function, markov_chain, start_words, length):
@@ -138,17 +459,12 @@ def benchmark_markov_chain(chain_function, markov_chain, start_words, length):
     Returns:
         float: The time taken in seconds.
     """
-    setup_code = f"""
-from __main__ import {chain_function.__name__}
-markov_chain = {repr(markov_chain)}
-start_words = {repr(start_words)}
-length = {length}
-"""
-
-    stmt = f"{chain_function.__name__}(markov_chain, start_words, length)"
+    # Time a call on the chain object itself, instead of rebuilding it from its repr in the setup code
+    def stmt():
+        chain_function(markov_chain, start_words, length)
 
     # Using timeit to run 1000 iterations and return the average time
-    timer = timeit.Timer(stmt, setup=setup_code)
+    timer = timeit.Timer(stmt)
     result = timer.timeit(number=1000) / 1000  # Average over 1000 runs
 
     return result
@@ -0,0 +1,158 @@
+#!python
+
+from markov_chain_second import (build_markov_chain, build_markov_chain_parallel,
+                                 build_second_order_markov_chain, build_fourth_order_markov_chain,
+                                 count_shard, generate_words, merge_partition, random_walk, random_walk_fourth,
+                                 stream_sentences, walk)
+from array import array
+from itertools import islice
+from unittest import mock
+import markov_chain_second
+import random
+import unittest
+
+
+class MarkovChainTest(unittest.TestCase):
+
+    # Test fixtures: a tiny corpus with a few repeated word pairs
+    words = ('one fish two fish red fish blue fish one fish two fish '
+             'red fish. blue fish? one fish').split()
+
+    def test_build_second_order(self):
+        markov_chain = build_markov_chain(self.words, order=2)
+        assert markov_chain == build_second_order_markov_chain(self.words)
+        assert markov_chain[('one', 'fish')] == {'two': 2}
+        assert markov_chain[('fish', 'red')] == {'fish': 1, 'fish.': 1}
+        # One state per word pair that has a next word
+        assert len(markov_chain) == len(set(zip(self.words, self.words[1:-1])))
+
+    def test_build_any_order(self):
+        for order in range(1, 6):
+            markov_chain = build_markov_chain(self.words, order)
+            # Every transition in the corpus is counted exactly once
+            assert sum(histogram.tokens for histogram in markov_chain.values()) == \
+                len(self.words) - order
+            assert all(len(state) == order for state in markov_chain)
+        assert build_markov_chain(self.words, 4) == build_fourth_order_markov_chain(self.words)
+
+    def test_build_from_generator(self):
+        markov_chain = build_markov_chain(word for word in self.words)
+        assert markov_chain == build_markov_chain(self.words)
+        # A corpus shorter than the order has no states
+        assert build_markov_chain(iter(['one', 'fish']), order=3) == {}
+
+    def test_count_shards(self):
+        word_ids = {}
+        ids = array('i', [word_ids.setdefault(word, len(word_ids)) for word in self.words])
+        ends_sentence = bytes(word.endswith(('.', '!', '?')) for word in word_ids)
+        for order in (1, 2, 3):
+            whole = count_shard(ids, ends_sentence, order, 0, True, 3)
+            # Cut the corpus into two shards that overlap by `order` words
+            middle = 7
+            counted = [count_shard(ids[:middle + order], ends_sentence, order, 0, True, 3),
+                       count_shard(ids[middle:], ends_sentence, order, middle, ends_sentence[ids[middle - 1]], 3)]
+            states = {}
+            for partition in range(3):
+                merged = merge_partition([buckets[partition] for buckets in counted], order)
+                # Merging the shards' counts gives the counts of the whole corpus
+                assert merged == whole[partition]
+                state_ids, lengths, successor_ids, counts, _, _, _ = merged
+                assert len(state_ids) == order * len(lengths)
+                assert len(successor_ids) == len(counts) == sum(lengths)
+                for index in range(len(lengths)):
+                    state = tuple(state_ids[index * order:(index + 1) * order])
+                    # Each state is in exactly one partition
+                    assert state not in states
+                    states[state] = lengths[index]
+            assert len(states) == len(build_markov_chain(self.words, order))
+
+    def test_build_parallel(self):
+        # Split even the tiny corpus into shards
+        with mock.patch.object(markov_chain_second, 'MIN_SHARD_TRANSITIONS', 1):
+            for order in (1, 2, 3):
+                for workers in (1, 2, 3):
+                    markov_chain = build_markov_chain_parallel(iter(self.words), order, workers)
+                    serial = build_markov_chain(self.words, order)
+                    assert markov_chain == serial
+                    # Same successor order and totals, and start states in the same order
+                    for state, histogram in serial.items():
+                        assert list(markov_chain[state].items()) == list(histogram.items())
+                        assert markov_chain[state].tokens == histogram.tokens
+                        assert markov_chain[state].types == histogram.types
+                    assert list(markov_chain.starts.items()) == list(serial.starts.items())
+                    # So the same seed walks the same sentence
+                    start = serial.sample_start(random.Random(1))
+                    assert markov_chain.sample_start(random.Random(1)) == start
+                    assert random_walk(markov_chain, start, 20, random.Random(2)) == \
+                        random_walk(serial, start, 20, random.Random(2))
+            assert build_markov_chain_parallel(iter(['one']), order=2, workers=2) == {}
+            # More workers than transitions
+            assert build_markov_chain_parallel(iter(self.words[:4]), order=2, workers=4) == \
+                build_markov_chain(self.words[:4], order=2)
+        # A corpus too small to split is built in this process
+        assert build_markov_chain_parallel(iter(self.words), 2, workers=4) == build_markov_chain(self.words)
+
+    def test_start_states(self):
+        markov_chain = build_markov_chain(self.words)
+        # The first state, and the states after 'fish.' and 'fish?' that have a next word
+        assert markov_chain.starts == {('one', 'fish'): 1, ('blue', 'fish?'): 1}
+        for _ in range(100):
+            assert markov_chain.sample_start() in markov_chain.starts
+        # Adding a start must show up in the next sample
+        markov_chain.starts.clear()
+        markov_chain.add_start(('fish', 'red'))
+        assert markov_chain.sample_start() == ('fish', 'red')
+
+    def test_walk(self):
+        markov_chain = build_markov_chain(self.words, order=3)
+        for _ in range(100):
+            sentence = walk(markov_chain, ('one', 'fish', 'two'), 12, stop_at_end=False)
+            assert sentence[:3] == ['one', 'fish', 'two']
+            assert len(sentence) <= 12
+            # Every step must follow a state seen in the corpus
+            for i in range(len(sentence) - 3):
+                assert sentence[i + 3] in markov_chain[tuple(sentence[i:i + 3])]
+
+    def test_generate_words(self):
+        markov_chain = build_markov_chain(self.words)
+        # Without a stop condition the walk only ends at a state with no next words
+        words = list(islice(generate_words(markov_chain, ('one', 'fish')), 1000))
+        assert words[:3] == ['one', 'fish', 'two']
+        assert len(words) == 1000 or tuple(words[-2:]) not in markov_chain
+        # The walk ends right after the word the stop condition returns True for
+        words = list(generate_words(markov_chain, ('fish', 'red'), stop=lambda word: True))
+        assert len(words) == 3
+        assert list(generate_words(markov_chain, ('croissant', 'nope'))) == ['croissant', 'nope']
+
+    def test_stream_sentences(self):
+        markov_chain = build_markov_chain(self.words)
+        sentences = list(stream_sentences(markov_chain, max_sentences=20, sentence_length=6))
+        assert len(sentences) == 20
+        for sentence in sentences:
+            assert 2 <= len(sentence.split()) <= 6
+            assert sentence.endswith(('.', '!', '?'))
+        # The word limit counts every word generated so far
+        sentences = list(stream_sentences(markov_chain, max_words=15, sentence_length=6))
+        assert sum(len(sentence.split()) for sentence in sentences) == 15
+
+    def test_seeded_rng_replays(self):
+        markov_chain = build_markov_chain(self.words)
+        # The same seed must replay the same sentences, whatever the global random state
+        first = list(stream_sentences(markov_chain, max_sentences=10, rng=random.Random('fish')))
+        random.random()
+        second = list(stream_sentences(markov_chain, max_sentences=10, rng=random.Random('fish')))
+        assert first == second
+        assert random_walk(markov_chain, ('one', 'fish'), 20, rng=random.Random(3)) == \
+            random_walk(markov_chain, ('one', 'fish'), 20, rng=random.Random(3))
+        markov_chain = build_fourth_order_markov_chain(self.words * 3)
+        start_words = ('one', 'fish', 'two', 'fish')
+        assert random_walk_fourth(markov_chain, start_words, 20, rng=random.Random(3)) == \
+            random_walk_fourth(markov_chain, start_words, 20, rng=random.Random(3))
+
+    def test_random_walk_unknown_start(self):
+        markov_chain = build_markov_chain(self.words)
+        assert random_walk(markov_chain, ('croissant', 'nope'), 10) == 'Croissant nope.'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,295 @@
+"""Markov chain that stores its states in a prefix trie, so states sharing their first words share storage."""
+from collections import deque
+from itertools import islice
+import sys
+import timeit
+import tracemalloc
+
+from dictogram import Dictogram
+from markov_chain_second import SENTENCE_ENDINGS, build_markov_chain, ends_sentence, format_sentence
+
+
+class TrieNode(object):
+    """Inner node of the trie, one per distinct prefix shorter than a full state."""
+
+    __slots__ = ('word', 'children')
+
+    def __init__(self):
+        """Initialize this node with no children."""
+        # While there is only one child, word is the word that reaches it and children is the child
+        # itself, which saves a dict for the many prefixes that are only ever followed by one word.
+        # After that, word is None and children is a dict of word to child.
+        self.word = None
+        self.children = None
+
+    def child(self, word):
+        """Return the child reached by the given word, or None if there is none."""
+        if self.word is not None:
+            return self.children if self.word == word else None
+        if self.children is None:
+            return None
+        return self.children.get(word)
+
+    def add_child(self, word, node):
+        """Add the given node as the child reached by word and return it."""
+        if self.children is None:
+            self.word = word
+            self.children = node
+        else:
+            if self.word is not None:
+                self.children = {self.word: self.children}
+                self.word = None
+            self.children[word] = node
+        return node
+
+    def items(self):
+        """Return a list of (word, child) pairs."""
+        if self.word is not None:
+            return [(self.word, self.children)]
+        if self.children is None:
+            return []
+        return list(self.children.items())
+
+
+class TrieLeaf(object):
+    """Leaf of the trie for one full state, holding the words that follow it."""
+
+    __slots__ = ('successors', 'suffix')
+
+    def __init__(self):
+        """Initialize this leaf with no next words."""
+        # The next word itself while it has been seen only once, then a Dictogram of next words
+        self.successors = None
+        # Inner node for this state without its first word, whose children are the states a walk
+        # moves to from here. Set while building, and left None if no state follows this one.
+        self.suffix = None
+
+    def add_count(self, next_word, count=1):
+        """Increase the count of next_word following this state by count."""
+        successors = self.successors
+        if successors is None and count == 1:
+            self.successors = next_word
+            return
+        if successors is None:
+            successors = self.successors = Dictogram()
+        elif successors.__class__ is str:
+            successors = self.successors = Dictogram([successors])
+        successors.add_count(next_word, count)
+
+    def histogram(self) -> Dictogram:
+        """Return a Dictogram of the words that follow this state and their frequency."""
+        if self.successors.__class__ is str:
+            return Dictogram([self.successors])
+        return self.successors
+
+    def sample(self, rng=None) -> str:
+        """Return a word that follows this state, weighted by its frequency."""
+        successors = self.successors
+        if successors.__class__ is str:
+            return successors
+        return successors.sample(rng)
+
+
+class TrieMarkovChain(object):
+    """
+    Markov chain of states of `order` words, stored as a trie of their words from the first to the last.
+
+    A state is found by following one child per word from the root, so lookup takes `order` steps and
+    never hashes a tuple. Each leaf keeps a suffix link to the inner node for its last `order` - 1
+    words, so a walk reaches its next state with a single child lookup on the sampled word.
+    """
+
+    def __init__(self, order=3):
+        """Initialize this chain with no states; use build_trie_markov_chain to build one."""
+        self.order = order  # Number of words in each state
+        self.root = TrieNode()  # Empty prefix
+        self.states = 0  # Number of leaves
+        # Dictogram of the states that begin a sentence, weighted by how often they do
+        self.starts = Dictogram()
+
+    def __len__(self):
+        """Return the number of states."""
+        return self.states
+
+    def __contains__(self, state):
+        """Return True if the given tuple of words is a state of this chain."""
+        return self.find(state) is not None
+
+    def __iter__(self):
+        """Yield every state as a tuple of words."""
+        stack = [((), self.root)]
+        while stack:
+            prefix, node = stack.pop()
+            if node.__class__ is TrieLeaf:
+                yield prefix
+            else:
+                stack.extend((prefix + (word,), child) for word, child in node.items())
+
+    def keys(self):
+        """Yield every state as a tuple of words."""
+        return iter(self)
+
+    def find(self, state):
+        """Return the leaf of the given state, or None if the state is not in this chain."""
+        if len(state) != self.order:
+            return None
+        node = self.root
+        for word in state:
+            node = node.child(word)
+            if node is None:
+                return None
+        return node
+
+    def prefix(self, state, create=False):
+        """Return the inner node for all but the last word of the given state. If it is missing, add
+        it when create is True, otherwise return None."""
+        node = self.root
+        for index in range(self.order - 1):
+            child = node.child(state[index])
+            if child is None:
+                if not create:
+                    return None
+                child = node.add_child(state[index], TrieNode())
+            node = child
+        return node
+
+    def get(self, state, default=None):
+        """Return a Dictogram of the words that follow the given state, or default if it is not in this chain."""
+        leaf = self.find(state)
+        return default if leaf is None else leaf.histogram()
+
+    def add_count(self, state, next_word, count=1):
+        """Increase the count of next_word following the given state by count, and return the state's
+        prefix node, the parent of its leaf."""
+        node = self.prefix(state, create=True)
+        leaf = node.child(state[-1])
+        if leaf is None:
+            leaf = node.add_child(state[-1], TrieLeaf())
+            self.states += 1
+        leaf.add_count(next_word, count)
+        return node
+
+    def add_start(self, state, count=1):
+        """Increase the number of sentences that begin with the given state by count."""
+        self.starts.add_count(tuple(state), count)
+
+    def sample_start(self, rng=None) -> tuple:
+        """Return a state that begins a sentence, weighted by how many sentences in the corpus begin with it."""
+        return self.starts.sample(rng)
+
+    def generate_words(self, start_words, stop=None, rng=None):
+        """Yield the start words and then each word of a random walk from them, like generate_words
+        in markov_chain_second, until a state with no next words or a word stop returns True for."""
+        yield from start_words
+        leaf = self.find(tuple(start_words))
+        while leaf is not None:
+            next_word = leaf.sample(rng)
+            yield next_word
+            if stop is not None and stop(next_word):
+                return
+            # Follow the suffix link, then step down by the new word
+            suffix = leaf.suffix
+            leaf = None if suffix is None else suffix.child(next_word)
+
+    def walk(self, start_words, length=10, rng=None) -> list:
+        """Return the list of words visited by a random walk from the given state, like random_walk."""
+        words = self.generate_words(start_words, ends_sentence, rng)
+        return list(islice(words, max(length, len(start_words))))
+
+
+def build_trie_markov_chain(word_list, order=3) -> TrieMarkovChain:
+    """
+    Takes an iterable of strings to build a Markov chain of `order`-word states stored in a prefix trie.
+
+    Args:
+        word_list (iterable): Words (strings) representing the corpus, in order. Any iterable works, including generators.
+        order (int, optional): Number of words in each state. Defaults to 3.
+
+    Returns:
+        TrieMarkovChain: The chain, holding the same counts as build_markov_chain.
+    """
+    markov_chain = TrieMarkovChain(order)
+
+    # Fill a rolling window with the first state, then slide it one word at a time
+    words = iter(word_list)
+    window = deque(islice(words, order), maxlen=order)
+    if len(window) < order:
+        return markov_chain
+
+    # The first state of the corpus begins a sentence
+    starts_sentence = True
+    previous_leaf = None
+    for next_word in words:
+        node = markov_chain.add_count(window, next_word)
+
+        # The prefix of this state is the suffix of the state before it
+        if previous_leaf is not None:
+            previous_leaf.suffix = node
+        previous_leaf = node.child(window[-1])
+
+        if starts_sentence:
+            markov_chain.add_start(tuple(window))
+        # The next state begins a sentence if the word dropping out of the window ends one
+        starts_sentence = window[0].endswith(SENTENCE_ENDINGS)
+        window.append(next_word)
+
+    # No state follows the last one in the corpus, but its next state may appear earlier
+    if previous_leaf is not None:
+        previous_leaf.suffix = markov_chain.prefix(window)
+    return markov_chain
+
+
+def random_walk(markov_chain: TrieMarkovChain, start_words: tuple, length=10, rng=None) -> str:
+    """
+    Generate a random sentence using the trie-backed Markov chain.
+
+    Args:
+        markov_chain (TrieMarkovChain): The chain built by build_trie_markov_chain.
+        start_words (tuple): The words to start the sentence, from the corpus, as many as the order of the chain.
+        length (int, optional): The number of words in the generated sentence. Defaults to 10.
+        rng (optional): A random.Random or numpy.random.Generator to sample with. Defaults to the random module.
+
+    Returns:
+        str: The randomly generated sentence.
+    """
+    return format_sentence(markov_chain.walk(start_words, length, rng))
+
+
+def compare_memory(word_list: list, orders=(2, 3, 4)):
+    """
+    Prints the build time and memory of the dict-based and trie-based Markov chains of each order.
+
+    Args:
+        word_list (list): List of words (strings) representing the corpus.
+        orders (tuple, optional): Orders to compare. Defaults to (2, 3, 4).
+    """
+    for order in orders:
+        builders = [('dict', build_markov_chain), ('trie', build_trie_markov_chain)]
+        memories = []
+        for name, builder in builders:
+            build_time = min(timeit.repeat(lambda: builder(word_list, order), number=1, repeat=3))
+
+            # Measure the memory still held by the chain once it is built
+            tracemalloc.start()
+            markov_chain = builder(word_list, order)
+            memory, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            memories.append(memory)
+
+            print(f'order {order} {name:>4} chain: {len(markov_chain)} states, '
+                  f'build time {build_time:.3f} s, memory {memory / 1024 / 1024:.1f} MiB')
+        print(f'order {order} trie saves {1 - memories[1] / memories[0]:.0%} '
+              f'({memories[0] / memories[1]:.1f}x smaller)')
+
+
+if __name__ == '__main__':
+    file_path = sys.argv[1] if len(sys.argv) > 1 else 'second_source.txt'
+    with open(file_path, 'r', encoding='utf-8') as file:
+        word_list = file.read().split()
+
+    markov_chain = build_trie_markov_chain(word_list, order=3)
+    print(random_walk(markov_chain, markov_chain.sample_start(), 30))
+
+    print("\n")
+    print("################### Benchmark #########################")
+    compare_memory(word_list)
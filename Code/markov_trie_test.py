@@ -0,0 +1,82 @@
+#!python
+
+from markov_trie import build_trie_markov_chain, random_walk
+from markov_chain_second import build_markov_chain
+import random
+import unittest
+
+
+class TrieMarkovChainTest(unittest.TestCase):
+
+    # Test fixtures: a tiny corpus with a few repeated word pairs
+    words = ('one fish two fish red fish blue fish one fish two fish '
+             'red fish. blue fish? one fish').split()
+
+    def test_matches_dict_chain(self):
+        for order in (1, 2, 3, 4):
+            markov_chain = build_trie_markov_chain(self.words, order)
+            dict_chain = build_markov_chain(self.words, order)
+            # Same states, and every state has the same successor counts
+            assert len(markov_chain) == len(dict_chain)
+            self.assertCountEqual(markov_chain.keys(), dict_chain.keys())
+            for state, histogram in dict_chain.items():
+                assert state in markov_chain
+                assert markov_chain.get(state) == histogram
+            assert markov_chain.starts == dict_chain.starts
+
+    def test_shares_prefixes(self):
+        markov_chain = build_trie_markov_chain(self.words, order=3)
+        # Both states starting with ('one', 'fish') hang off the same prefix node
+        node = markov_chain.prefix(('one', 'fish', 'two'))
+        assert node is markov_chain.root.child('one').child('fish')
+        assert node.child('two') is markov_chain.find(('one', 'fish', 'two'))
+        # A prefix with one child stores it without a dict
+        assert node.word == 'two'
+
+    def test_contains(self):
+        markov_chain = build_trie_markov_chain(self.words, order=3)
+        assert ('fish', 'red', 'fish') in markov_chain
+        assert ('fish', 'red', 'fish?') not in markov_chain
+        assert ('fish', 'red') not in markov_chain
+        assert markov_chain.get(('croissant', 'nope', 'fish')) is None
+
+    def test_suffix_links(self):
+        # The second corpus ends with a state that also appears earlier
+        for words, order in ((self.words, 3), ('a b c a b'.split(), 2), ('a b c a b'.split(), 1)):
+            markov_chain = build_trie_markov_chain(words, order)
+            for state in markov_chain.keys():
+                suffix = markov_chain.find(state).suffix
+                # Every next state is one child lookup away from the suffix
+                for next_word in markov_chain.get(state):
+                    next_state = state[1:] + (next_word,)
+                    assert (None if suffix is None else suffix.child(next_word)) is markov_chain.find(next_state)
+
+    def test_walks_on_from_last_state(self):
+        words = 'a b c a b'.split()
+        # ('c', 'a') is the last state of the corpus, and ('a', 'b') follows it as it does earlier
+        sentence = build_trie_markov_chain(words, 2).walk(('c', 'a'), 10)
+        assert sentence == build_markov_chain(words, 2).walk(('c', 'a'), 10)
+        assert sentence == 'c a b c a b c a b c'.split()
+
+    def test_walk(self):
+        markov_chain = build_trie_markov_chain(self.words, order=2)
+        for _ in range(100):
+            sentence = markov_chain.walk(markov_chain.sample_start(), 10)
+            assert len(sentence) <= 10
+            # Every step must follow a pair seen in the corpus
+            for i in range(len(sentence) - 2):
+                state = (sentence[i], sentence[i + 1])
+                assert sentence[i + 2] in markov_chain.get(state)
+
+    def test_seeded_rng_replays(self):
+        markov_chain = build_trie_markov_chain(self.words, order=2)
+        assert random_walk(markov_chain, ('one', 'fish'), 20, rng=random.Random(3)) == \
+            random_walk(markov_chain, ('one', 'fish'), 20, rng=random.Random(3))
+
+    def test_random_walk_unknown_start(self):
+        markov_chain = build_trie_markov_chain(self.words, order=2)
+        assert random_walk(markov_chain, ('croissant', 'nope'), 10) == 'Croissant nope.'
+
+
+if __name__ == '__main__':
+    unittest.main()
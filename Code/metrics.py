@@ -0,0 +1,238 @@
+"""Latency histograms and gauges, written out in the Prometheus text exposition format."""
+from bisect import bisect_left
+import threading
+import time
+
+# Upper bounds of the latency buckets in seconds, from 10 microseconds to a quarter of a second
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+
+class Histogram(object):
+    """
+    Cumulative latency histogram with one series per label value, such as the phases of a request.
+
+    Observing a value is a bisect and two additions to counts that only the calling thread writes, a
+    few hundred nanoseconds, so it can be called on every request. The threads' counts are only added
+    up, and the buckets made cumulative, when the histogram is written out.
+    """
+
+    def __init__(self, name, help_text, label='phase', buckets=LATENCY_BUCKETS):
+        """
+        Initialize an empty histogram.
+
+        Args:
+            name (str): Metric name, ending in the unit, such as 'markov_generation_seconds'.
+            help_text (str): One-line description for the HELP line.
+            label (str, optional): Name of the label that tells the series apart. Defaults to 'phase'.
+            buckets (tuple, optional): Sorted upper bounds of the buckets. Defaults to LATENCY_BUCKETS.
+        """
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        # Each thread counts into its own dict of [count of each bucket plus the overflow, sum] of each
+        # label value, so observing never waits on a lock. They are added up when written out, and the
+        # series of threads that have ended are folded into _retired, so a server that starts a thread
+        # per request does not keep one series per request it ever served.
+        self._local = threading.local()
+        self._thread_series = []  # (thread, series) of each live thread that has observed a value
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _series(self) -> dict:
+        """Return this thread's series, adding them to the histogram on first use."""
+        try:
+            return self._local.series
+        except AttributeError:
+            series = self._local.series = {}
+            with self._lock:
+                self._retire_ended_threads()
+                self._thread_series.append((threading.current_thread(), series))
+            return series
+
+    def _retire_ended_threads(self):
+        """Add the series of threads that have ended to _retired and stop tracking them. Needs the lock."""
+        live = []
+        for thread, series in self._thread_series:
+            if thread.is_alive():
+                live.append((thread, series))
+            else:
+                _add_series(self._retired, series)
+        self._thread_series = live
+
+    def observe(self, value, seconds):
+        """Record one observation of the given number of seconds for a label value."""
+        try:
+            series = self._local.series[value]
+        except (AttributeError, KeyError):
+            series = self._series()[value] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, seconds)] += 1
+        series[1] += seconds
+
+    def totals(self) -> dict:
+        """Return the (bucket counts, sum) of each label value, added up over every thread."""
+        totals = {}
+        with self._lock:
+            self._retire_ended_threads()
+            _add_series(totals, self._retired)
+            thread_series = [series for _, series in self._thread_series]
+        for series in thread_series:
+            _add_series(totals, series)
+        return {value: tuple(counts_and_total) for value, counts_and_total in totals.items()}
+
+    def time(self, value):
+        """Return a context manager that observes the time spent in its with block."""
+        return _Timer(self, value)
+
+    def count(self, value) -> int:
+        """Return the number of observations of a label value."""
+        counts, _ = self.totals().get(value, ((), 0.0))
+        return sum(counts)
+
+    def lines(self) -> list:
+        """Return the histogram in the Prometheus text format, one line per item."""
+        lines = ['# HELP {} {}'.format(self.name, self.help_text), '# TYPE {} histogram'.format(self.name)]
+        for value, (counts, total) in self.totals().items():
+            label = '{}="{}"'.format(self.label, escape(value))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(self.name, label, format_value(bound), cumulative))
+            lines.append('{}_sum{{{}}} {}'.format(self.name, label, format_value(total)))
+            lines.append('{}_count{{{}}} {}'.format(self.name, label, cumulative))
+        return lines
+
+
+def _add_series(totals, series):
+    """Add the [bucket counts, sum] of each label value in series to those in totals."""
+    for value, (counts, total) in list(series.items()):
+        totals_of_value = totals.get(value)
+        if totals_of_value is None:
+            totals[value] = [list(counts), total]
+        else:
+            totals_of_value[0] = [a + b for a, b in zip(totals_of_value[0], counts)]
+            totals_of_value[1] += total
+
+
+class _Timer(object):
+    """Context manager returned by Histogram.time."""
+    __slots__ = ('histogram', 'value', 'started')
+
+    def __init__(self, histogram, value):
+        self.histogram = histogram
+        self.value = value
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(self.value, time.perf_counter() - self.started)
+
+
+def escape(value) -> str:
+    """Escape a label value for the Prometheus text format."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value) -> str:
+    """Format a sample value the way Prometheus writes it, with +Inf for infinity and no trailing .0 on integers."""
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def gauge(name, help_text, samples, metric_type='gauge') -> list:
+    """
+    Return a gauge or counter in the Prometheus text format.
+
+    Args:
+        name (str): Metric name.
+        help_text (str): One-line description for the HELP line.
+        samples: A single value, or a dict from a tuple of (label, label value) pairs to the value
+            with those labels.
+        metric_type (str, optional): 'gauge' or 'counter'. Defaults to 'gauge'.
+
+    Returns:
+        list: One line per item.
+    """
+    lines = ['# HELP {} {}'.format(name, help_text), '# TYPE {} {}'.format(name, metric_type)]
+    if not isinstance(samples, dict):
+        samples = {(): samples}
+    for labels, value in samples.items():
+        label_text = ','.join('{}="{}"'.format(label, escape(label_value)) for label, label_value in labels)
+        lines.append('{}{} {}'.format(name, '{' + label_text + '}' if label_text else '', format_value(value)))
+    return lines
+
+
+def chain_metrics(chains) -> list:
+    """
+    Return the size of each ArrayMarkovChain in the Prometheus text format.
+
+    Args:
+        chains (dict): Chain of each order that has been loaded.
+
+    Returns:
+        list: Gauges of the states, vocabulary, successor edges and bytes of each chain, labelled by order.
+    """
+    chains = sorted(chains.items())
+    lines = []
+    lines += gauge('markov_chain_states', 'Number of states in the chain.',
+                   {(('order', order),): len(markov_chain) for order, markov_chain in chains})
+    lines += gauge('markov_chain_vocabulary_words', 'Number of distinct words in the chain.',
+                   {(('order', order),): len(markov_chain.vocab) for order, markov_chain in chains})
+    lines += gauge('markov_chain_successors', 'Number of edges from a state to a next word.',
+                   {(('order', order),): len(markov_chain.successors) for order, markov_chain in chains})
+    lines += gauge('markov_chain_bytes', 'Bytes taken by the arrays of the chain.',
+                   {(('order', order),): markov_chain.nbytes() for order, markov_chain in chains})
+    return lines
+
+
+def stats_metrics(prefix, stats, counters=()) -> list:
+    """
+    Return the numbers in a stats() dict, such as SentencePool's or TweetQueue's, in the Prometheus text format.
+
+    Args:
+        prefix (str): Added before each key to make its metric name.
+        stats (dict): Values to write out; None values are left out.
+        counters (tuple, optional): Keys that only ever go up, written out as counters ending in _total.
+
+    Returns:
+        list: One metric per key.
+    """
+    lines = []
+    for key, value in stats.items():
+        if value is None:
+            continue
+        if key in counters:
+            lines += gauge('{}_{}_total'.format(prefix, key), 'Value of {} in stats().'.format(key), value, 'counter')
+        else:
+            lines += gauge('{}_{}'.format(prefix, key), 'Value of {} in stats().'.format(key), value)
+    return lines
+
+
+def render(*groups) -> str:
+    """Join lists of lines into one Prometheus text format response body."""
+    return ''.join(line + '\n' for lines in groups for line in lines)
+
+
+if __name__ == '__main__':
+    import timeit
+
+    histogram = Histogram('benchmark_seconds', 'Benchmark.')
+    number = 1000000
+    observe_time = timeit.timeit(lambda: histogram.observe('walk', 0.0003), number=number)
+    print(f'observe: {observe_time / number * 1e9:.0f} ns per call')
+
+    def timed_block():
+        with histogram.time('walk'):
+            pass
+    time_time = timeit.timeit(timed_block, number=number)
+    print(f'with time(): {time_time / number * 1e9:.0f} ns per block')
+    render_time = timeit.timeit(lambda: render(histogram.lines()), number=1000)
+    print(f'render: {render_time / 1000 * 1e6:.0f} us')
@@ -0,0 +1,91 @@
+#!python
+
+from metrics import Histogram, chain_metrics, gauge, render, stats_metrics
+import markov_array
+import threading
+import unittest
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_histogram(self):
+        histogram = Histogram('test_seconds', 'Test latency.', buckets=(0.001, 0.01))
+        histogram.observe('walk', 0.0005)
+        histogram.observe('walk', 0.001)  # A bound is in its own bucket
+        histogram.observe('walk', 0.5)
+        histogram.observe('start', 0.002)
+        assert histogram.count('walk') == 3
+        assert histogram.count('render') == 0
+        lines = histogram.lines()
+        assert lines[:2] == ['# HELP test_seconds Test latency.', '# TYPE test_seconds histogram']
+        # Buckets count every observation up to their bound
+        assert lines[2:7] == [
+            'test_seconds_bucket{phase="walk",le="0.001"} 2',
+            'test_seconds_bucket{phase="walk",le="0.01"} 2',
+            'test_seconds_bucket{phase="walk",le="+Inf"} 3',
+            'test_seconds_sum{phase="walk"} 0.5015',
+            'test_seconds_count{phase="walk"} 3',
+        ]
+        assert 'test_seconds_bucket{phase="start",le="0.01"} 1' in lines
+
+    def test_histogram_threads(self):
+        histogram = Histogram('test_seconds', 'Test latency.')
+
+        def observe():
+            for _ in range(1000):
+                histogram.observe('walk', 0.0001)
+        threads = [threading.Thread(target=observe) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Every thread's counts are added up
+        assert histogram.count('walk') == 4000
+
+    def test_histogram_retires_ended_threads(self):
+        histogram = Histogram('test_seconds', 'Test latency.')
+
+        def observe():
+            histogram.observe('walk', 0.0001)
+        # One thread per request, like the Flask development server
+        for _ in range(50):
+            thread = threading.Thread(target=observe)
+            thread.start()
+            thread.join()
+        histogram.observe('walk', 0.0001)
+        assert histogram.count('walk') == 51
+        # Only this thread's series is still kept apart, the ended threads' are added up
+        assert len(histogram._thread_series) == 1
+        assert abs(histogram.totals()['walk'][1] - 51 * 0.0001) < 1e-9
+
+    def test_histogram_time(self):
+        histogram = Histogram('test_seconds', 'Test latency.')
+        with histogram.time('render'):
+            pass
+        assert histogram.count('render') == 1
+
+    def test_gauge(self):
+        assert gauge('up', 'Whether it is up.', 1) == ['# HELP up Whether it is up.', '# TYPE up gauge', 'up 1']
+        lines = gauge('seconds', 'Seconds.', {(('phase', 'read "corpus"'),): 0.25}, 'counter')
+        assert lines[1:] == ['# TYPE seconds counter', 'seconds{phase="read \\"corpus\\""} 0.25']
+
+    def test_chain_metrics(self):
+        words = 'one fish two fish red fish blue fish'.split()
+        markov_chain = markov_array.build_markov_chain(words, order=2)
+        lines = chain_metrics({2: markov_chain})
+        assert 'markov_chain_states{order="2"} 6' in lines
+        assert 'markov_chain_vocabulary_words{order="2"} 5' in lines
+        assert 'markov_chain_successors{order="2"} 6' in lines
+
+    def test_stats_metrics(self):
+        lines = stats_metrics('pool', {'size': 3, 'hits': 10, 'rate': None, 'running': True}, ('hits',))
+        assert 'pool_size 3' in lines
+        assert '# TYPE pool_hits_total counter' in lines
+        assert 'pool_hits_total 10' in lines
+        assert 'pool_running 1' in lines
+        assert not any(line.startswith('pool_rate') for line in lines)
+        assert render(lines, ['end 0']).endswith('pool_running 1\nend 0\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
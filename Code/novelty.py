@@ -0,0 +1,182 @@
+"""Finds how much of a sentence is copied verbatim from the corpus, using a suffix array over its words."""
+from array import array
+import json
+import random
+import sys
+import timeit
+
+from sampling import numpy
+
+
+def build_suffix_array(ids) -> array:
+    """
+    Sort the suffixes of a sequence of word IDs by prefix doubling: rank the suffixes by their first word,
+    then by their first 2, 4, 8, ... words, until every suffix has its own rank.
+
+    Args:
+        ids (array): Word IDs of the corpus, all zero or more.
+
+    Returns:
+        array: The start position of each suffix, in sorted order. A suffix that is a prefix of another
+            sorts before it.
+    """
+    n = len(ids)
+    if n == 0:
+        return array('i')
+    if numpy is not None:
+        return array('i', _build_suffix_array_numpy(ids).tolist())
+
+    rank = list(ids)
+    suffixes = list(range(n))
+    width = 1
+    while True:
+        # Sort by the rank of the first `width` words, then the rank of the next `width` words
+        def key(position):
+            return rank[position], rank[position + width] if position + width < n else -1
+        suffixes.sort(key=key)
+        new_rank = [0] * n
+        for index in range(1, n):
+            new_rank[suffixes[index]] = new_rank[suffixes[index - 1]] + \
+                (key(suffixes[index]) != key(suffixes[index - 1]))
+        rank = new_rank
+        if rank[suffixes[-1]] == n - 1 or width >= n:
+            return array('i', suffixes)
+        width *= 2
+
+
+def _build_suffix_array_numpy(ids):
+    """Return the suffix array of ids as a NumPy array, doubling the prefix length with vectorized sorts."""
+    n = len(ids)
+    rank = numpy.frombuffer(ids, dtype=numpy.int32).astype(numpy.int64)
+    width = 1
+    while True:
+        second = numpy.full(n, -1, dtype=numpy.int64)
+        second[:n - width] = rank[width:]
+        suffixes = numpy.lexsort((second, rank))
+        # A suffix gets a new rank wherever its pair of ranks differs from the one before it
+        changed = numpy.empty(n, dtype=numpy.int64)
+        changed[0] = 0
+        changed[1:] = (rank[suffixes[1:]] != rank[suffixes[:-1]]) | (second[suffixes[1:]] != second[suffixes[:-1]])
+        rank = numpy.empty(n, dtype=numpy.int64)
+        rank[suffixes] = numpy.cumsum(changed)
+        if rank[suffixes[-1]] == n - 1 or width >= n:
+            return suffixes
+        width *= 2
+
+
+class SuffixArrayIndex(object):
+    """
+    Index of every run of words in a corpus. The words are interned to integer IDs and every suffix of the
+    corpus is sorted, so the suffixes that begin with any run of words are next to each other and can be
+    found by binary search, one word at a time.
+    """
+
+    def __init__(self, word_list):
+        """Initialize this index with the words of the given corpus, in order."""
+        self.word_ids = {}  # Word ID of each distinct word
+        self.ids = array('i', [self.word_ids.setdefault(word, len(self.word_ids)) for word in word_list])
+        self.suffixes = build_suffix_array(self.ids)  # Start of each suffix, sorted
+
+    def __len__(self):
+        """Return the number of words in the corpus."""
+        return len(self.ids)
+
+    def narrow(self, low, high, depth, word_id) -> tuple:
+        """
+        Given the range of suffixes that share their first `depth` words, return the range of those whose
+        next word is word_id, which is empty (low == high) if there is none.
+        """
+        ids = self.ids
+        suffixes = self.suffixes
+        n = len(ids)
+
+        # Within the range, the word at `depth` is sorted, with -1 past the end of the corpus
+        def word_at(index):
+            position = suffixes[index] + depth
+            return ids[position] if position < n else -1
+
+        # First suffix whose word is word_id or greater
+        start, end = low, high
+        while start < end:
+            middle = (start + end) // 2
+            if word_at(middle) < word_id:
+                start = middle + 1
+            else:
+                end = middle
+        low = start
+        # First suffix whose word is greater than word_id
+        end = high
+        while start < end:
+            middle = (start + end) // 2
+            if word_at(middle) <= word_id:
+                start = middle + 1
+            else:
+                end = middle
+        return low, start
+
+    def count(self, tokens) -> int:
+        """Return the number of times the given run of words appears in the corpus."""
+        low, high = 0, len(self.suffixes)
+        for depth, word in enumerate(tokens):
+            word_id = self.word_ids.get(word)
+            if word_id is None:
+                return 0
+            low, high = self.narrow(low, high, depth, word_id)
+            if low == high:
+                return 0
+        return high - low
+
+    def longest_overlap(self, tokens) -> tuple:
+        """
+        Find the longest run of consecutive words of a sentence that also appears in the corpus.
+
+        Each word matched costs one O(log n) search, and each start position matches at most L words,
+        where L is the longest run in the corpus that starts there, so a sentence of m words takes
+        O(m * L * log n). Runs copied from the corpus are short, so L is usually a few words. Starts
+        too close to the end to beat the longest run found so far are skipped.
+
+        Args:
+            tokens (list): The words of the sentence.
+
+        Returns:
+            tuple: (length, start) of the longest run, where start is its position in tokens.
+        """
+        ids = [self.word_ids.get(word, -1) for word in tokens]
+        best_length, best_start = 0, 0
+        for start in range(len(ids)):
+            if len(ids) - start <= best_length:
+                break
+            low, high = 0, len(self.suffixes)
+            depth = 0
+            while start + depth < len(ids) and ids[start + depth] != -1:
+                low, high = self.narrow(low, high, depth, ids[start + depth])
+                if low == high:
+                    break
+                depth += 1
+            if depth > best_length:
+                best_length, best_start = depth, start
+        return best_length, best_start
+
+    def is_novel(self, tokens, max_overlap=8) -> bool:
+        """Return True if no more than max_overlap consecutive words of a sentence are copied from the corpus."""
+        return self.longest_overlap(tokens)[0] <= max_overlap
+
+
+if __name__ == '__main__':
+    corpus_path = sys.argv[1] if len(sys.argv) > 1 else 'cleaned_tokens.json'
+    with open(corpus_path, 'r', encoding='utf-8') as file:
+        cleaned_tokens = json.load(file)
+
+    build_time = min(timeit.repeat(lambda: SuffixArrayIndex(cleaned_tokens), number=1, repeat=3))
+    index = SuffixArrayIndex(cleaned_tokens)
+    print(f'Suffix array of {len(index)} words built in {build_time:.3f} s')
+
+    from markov_array import build_markov_chain
+    markov_chain = build_markov_chain(cleaned_tokens, order=2)
+    rng = random.Random(0)
+    sentences = [markov_chain.walk(markov_chain.sample_start(rng), 30, rng) for _ in range(1000)]
+    query_time = min(timeit.repeat(lambda: [index.longest_overlap(words) for words in sentences],
+                                   number=1, repeat=3))
+    copied = sum(not index.is_novel(words) for words in sentences)
+    print(f'longest_overlap: {query_time / len(sentences) * 1e6:.0f} us per sentence, '
+          f'{copied} of {len(sentences)} sentences copy more than 8 words')
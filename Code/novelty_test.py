@@ -0,0 +1,57 @@
+#!python
+
+from novelty import SuffixArrayIndex, build_suffix_array
+from array import array
+import novelty
+import unittest
+
+
+class SuffixArrayIndexTest(unittest.TestCase):
+
+    # Test fixtures: a tiny corpus with a few repeated word pairs
+    words = ('one fish two fish red fish blue fish one fish two fish '
+             'red fish. blue fish? one fish').split()
+
+    def sorted_suffixes(self, ids):
+        return sorted(range(len(ids)), key=lambda position: list(ids[position:]))
+
+    def test_build_suffix_array(self):
+        for text in ('banana', 'mississippi', 'aaaa', 'a', ''):
+            ids = array('i', [ord(letter) for letter in text])
+            assert list(build_suffix_array(ids)) == self.sorted_suffixes(ids)
+        index = SuffixArrayIndex(self.words)
+        assert list(index.suffixes) == self.sorted_suffixes(index.ids)
+
+    def test_build_suffix_array_without_numpy(self):
+        saved, novelty.numpy = novelty.numpy, None
+        try:
+            ids = array('i', [ord(letter) for letter in 'mississippi'])
+            assert list(build_suffix_array(ids)) == self.sorted_suffixes(ids)
+        finally:
+            novelty.numpy = saved
+
+    def test_count(self):
+        index = SuffixArrayIndex(self.words)
+        assert len(index) == len(self.words)
+        assert index.count(['fish']) == 7
+        assert index.count(['one', 'fish', 'two']) == 2
+        assert index.count(['fish', 'one', 'fish']) == 1
+        assert index.count(['fish', 'fish']) == 0
+        assert index.count(['croissant']) == 0
+
+    def test_longest_overlap(self):
+        index = SuffixArrayIndex(self.words)
+        assert index.longest_overlap('blue fish one fish two'.split()) == (5, 0)
+        assert index.longest_overlap('two fish red fish. blue'.split()) == (5, 0)
+        assert index.longest_overlap('croissant red fish blue fish nope'.split()) == (4, 1)
+        assert index.longest_overlap(['croissant']) == (0, 0)
+        assert index.longest_overlap([]) == (0, 0)
+
+    def test_is_novel(self):
+        index = SuffixArrayIndex(self.words)
+        assert index.is_novel('one fish two fish'.split(), max_overlap=3) is False
+        assert index.is_novel('one fish red fish'.split(), max_overlap=3) is True
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,277 @@
+"""
+Opt-in instrumentation of the hot paths. Set MARKOV_PROFILE=1 before importing the modules to count the
+calls and cumulative time of every function decorated with profiled, and to let a request ask for a
+cProfile or collapsed-stack profile of itself with ?profile=pstats or ?profile=collapsed.
+Without it, profiled returns each function unchanged, so the hot loops run exactly as before.
+"""
+from contextlib import contextmanager
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from urllib.parse import parse_qs
+
+# Whether to instrument the functions decorated with profiled, read once at import
+ENABLED = os.environ.get('MARKOV_PROFILE', '0') not in ('', '0')
+
+# Each thread counts into its own dict of [calls, cumulative seconds, calls in progress] of each
+# function, so counting takes no lock. They are added up by counters(), and the counters of threads
+# that have ended are folded into _retired, so a thread per request does not pile up dicts.
+_local = threading.local()
+_thread_counters = []  # (thread, counters) of each live thread that has called a profiled function
+_retired = {}
+_lock = threading.Lock()
+
+
+def _counters() -> dict:
+    """Return this thread's counters, adding them to _thread_counters on first use."""
+    try:
+        return _local.counters
+    except AttributeError:
+        counters = _local.counters = {}
+        with _lock:
+            _retire_ended_threads()
+            _thread_counters.append((threading.current_thread(), counters))
+        return counters
+
+
+def _retire_ended_threads():
+    """Add the counters of threads that have ended to _retired and stop tracking them. Needs _lock."""
+    live = []
+    for thread, counters_of_thread in _thread_counters:
+        if thread.is_alive():
+            live.append((thread, counters_of_thread))
+        else:
+            for key, (calls, seconds, _) in list(counters_of_thread.items()):
+                counter = _retired.setdefault(key, [0, 0.0, 0])
+                counter[0] += calls
+                counter[1] += seconds
+    _thread_counters[:] = live
+
+
+def profiled(name=None, enabled=None):
+    """
+    Decorator that counts the calls of a function and the time spent in them, when profiling is enabled.
+
+    Args:
+        name (str, optional): Name to count the calls under. Defaults to module.qualified_name.
+        enabled (bool, optional): Whether to instrument the function. Defaults to ENABLED.
+
+    Returns:
+        func: A decorator that returns the function itself when profiling is disabled.
+    """
+    def decorator(func):
+        if not (ENABLED if enabled is None else enabled):
+            return func
+        key = name or '{}.{}'.format(func.__module__, func.__qualname__)
+
+        def wrapper(*args, **kwargs):
+            counters = _counters()
+            counter = counters.get(key)
+            if counter is None:
+                counter = counters[key] = [0, 0.0, 0]
+            counter[0] += 1
+            counter[2] += 1
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                counter[2] -= 1
+                # Only the outermost of recursive calls adds its time, so none is counted twice
+                if not counter[2]:
+                    counter[1] += time.perf_counter() - started
+        wrapper.__name__ = func.__name__
+        wrapper.__qualname__ = func.__qualname__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func
+        return wrapper
+    return decorator
+
+
+# Code object of the wrapper that profiled puts around each function
+_WRAPPER_CODE = profiled(enabled=True)(lambda: None).__code__
+
+
+def counters() -> dict:
+    """Return the (calls, cumulative seconds) of each profiled function, added up over every thread."""
+    with _lock:
+        _retire_ended_threads()
+        thread_counters = [_retired] + [counters_of_thread for _, counters_of_thread in _thread_counters]
+        totals = {}
+        for counters_of_thread in thread_counters:
+            for key, (calls, seconds, _) in list(counters_of_thread.items()):
+                calls_so_far, seconds_so_far = totals.get(key, (0, 0.0))
+                totals[key] = (calls_so_far + calls, seconds_so_far + seconds)
+    return totals
+
+
+def reset():
+    """Set every counter back to zero."""
+    with _lock:
+        for counters_of_thread in [_retired] + [counters_of_thread for _, counters_of_thread in _thread_counters]:
+            for counter in counters_of_thread.values():
+                counter[0] = 0
+                counter[1] = 0.0
+
+
+def report() -> str:
+    """Return the counters as one line per function, most cumulative time first."""
+    rows = sorted(counters().items(), key=lambda item: item[1][1], reverse=True)
+    lines = ['{:>10} {:>12} {:>10}  {}'.format('calls', 'cumtime (s)', 'per call', 'function')]
+    for key, (calls, seconds) in rows:
+        per_call = '{:.2f} us'.format(seconds / calls * 1e6) if calls else '-'
+        lines.append('{:>10} {:>12.4f} {:>10}  {}'.format(calls, seconds, per_call, key))
+    return '\n'.join(lines)
+
+
+@contextmanager
+def profile(output_path=None):
+    """
+    Run the with block under cProfile.
+
+    Args:
+        output_path (str, optional): File to dump the stats to, for pstats or snakeviz. Defaults to none.
+
+    Yields:
+        cProfile.Profile: The profiler, whose stats are complete once the block ends.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if output_path is not None:
+            profiler.dump_stats(output_path)
+
+
+def format_stats(profiler, sort='cumulative', limit=40) -> str:
+    """Return the slowest limit functions of a cProfile profiler as pstats prints them."""
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+
+class StackRecorder(object):
+    """
+    Records the time spent in each call stack of one thread, using sys.setprofile, in the collapsed
+    format flamegraph.pl and speedscope read: the stack's frames joined by ';', then its microseconds.
+    Every call and return is traced, so expect the code to run several times slower while it records.
+    """
+
+    def __init__(self):
+        """Initialize an empty recording."""
+        self.stacks = {}  # Seconds spent in each stack itself, not in the calls it made
+        self._frames = []  # [label, time entered, seconds in calls] of each frame on the stack
+
+    def _trace(self, frame, event, arg):
+        """Push a frame on each call and add its own time to its stack on each return."""
+        now = time.perf_counter()
+        if event == 'call' or event == 'c_call':
+            if event == 'call':
+                code = frame.f_code
+                # The wrappers of profiled functions are left out, so the stacks look the same either way
+                label = None if code is _WRAPPER_CODE else '{}:{}'.format(
+                    os.path.basename(code.co_filename), code.co_name)
+            else:
+                label = getattr(arg, '__qualname__', getattr(arg, '__name__', repr(arg)))
+            self._frames.append([label, now, 0.0])
+        elif self._frames:
+            # A return or exception from a call made before recording started has no frame to pop
+            stack = ';'.join(entry[0] for entry in self._frames if entry[0] is not None)
+            label, entered, in_calls = self._frames.pop()
+            elapsed = now - entered
+            self.stacks[stack] = self.stacks.get(stack, 0.0) + elapsed - in_calls
+            if self._frames:
+                self._frames[-1][2] += elapsed
+
+    def __enter__(self):
+        sys.setprofile(self._trace)
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.setprofile(None)
+        self._frames = []
+
+    def collapsed(self) -> str:
+        """Return the recording in the collapsed-stack format, one stack per line."""
+        return ''.join('{} {}\n'.format(stack, round(seconds * 1e6))
+                       for stack, seconds in sorted(self.stacks.items()) if seconds >= 0.5e-6)
+
+
+class ProfilerMiddleware(object):
+    """
+    WSGI middleware that answers a request with ?profile=pstats or ?profile=collapsed with the profile
+    of handling it, as plain text, instead of its usual response. Other requests are passed through.
+    """
+
+    def __init__(self, wsgi_app):
+        """Wrap the given WSGI application."""
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        mode = parse_qs(environ.get('QUERY_STRING', '')).get('profile', [None])[0]
+        if mode not in ('pstats', 'collapsed'):
+            return self.wsgi_app(environ, start_response)
+
+        def ignore_response(status, headers, exc_info=None):
+            return lambda data: None
+
+        # The whole response is consumed under the profiler, so streamed bodies are profiled too
+        if mode == 'pstats':
+            with profile() as profiler:
+                self._consume(environ, ignore_response)
+            body = format_stats(profiler)
+        else:
+            with StackRecorder() as recorder:
+                self._consume(environ, ignore_response)
+            body = recorder.collapsed()
+        start_response('200 OK', [('Content-Type', 'text/plain; charset=utf-8')])
+        return [body.encode('utf-8')]
+
+    def _consume(self, environ, start_response):
+        """Run the wrapped application and read its whole response."""
+        response = self.wsgi_app(environ, start_response)
+        try:
+            for _ in response:
+                pass
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Profile building a chain from the corpus and walking it.')
+    parser.add_argument('corpus', nargs='?', default='cleaned_tokens.json')
+    parser.add_argument('--collapsed', metavar='PATH', help='write collapsed stacks of the build to PATH')
+    parser.add_argument('--pstats', metavar='PATH', help='dump cProfile stats of the build to PATH')
+    args = parser.parse_args()
+
+    # Turn the counters on, and have the modules imported below decorate their functions with this
+    # module's profiled rather than import a second copy of it under its own name
+    ENABLED = True
+    sys.modules['profiling'] = sys.modules[__name__]
+    from markov_chain_second import build_second_order_markov_chain, random_walk
+    import random
+
+    with open(args.corpus, 'r', encoding='utf-8') as file:
+        cleaned_tokens = json.load(file)
+    if args.collapsed:
+        with StackRecorder() as recorder:
+            markov_chain = build_second_order_markov_chain(cleaned_tokens)
+        with open(args.collapsed, 'w') as file:
+            file.write(recorder.collapsed())
+    else:
+        with profile(args.pstats) as profiler:
+            markov_chain = build_second_order_markov_chain(cleaned_tokens)
+        print(format_stats(profiler, limit=15))
+    rng = random.Random(0)
+    for _ in range(1000):
+        random_walk(markov_chain, markov_chain.sample_start(rng), 30, rng)
+    print(report())
@@ -0,0 +1,94 @@
+#!python
+
+import profiling
+from profiling import ProfilerMiddleware, StackRecorder, counters, profile, format_stats, profiled, report, reset
+import threading
+import unittest
+
+
+def countdown(n):
+    return n if n == 0 else countdown(n - 1)
+
+
+class ProfilingTest(unittest.TestCase):
+
+    def test_disabled(self):
+        # A function decorated while profiling is off is the function itself
+        assert profiled('countdown', enabled=False)(countdown) is countdown
+
+    def test_counters(self):
+        counted = profiled('test.countdown', enabled=True)(countdown)
+        assert counted.__name__ == 'countdown'
+        assert counted.__wrapped__ is countdown
+        reset()
+        assert counted(3) == 0
+        assert counted(5) == 0
+        calls, seconds = counters()['test.countdown']
+        # The recursive calls go to the undecorated function, so only the outer calls count
+        assert calls == 2
+        assert seconds > 0
+        assert 'test.countdown' in report()
+        reset()
+        assert counters()['test.countdown'] == (0, 0.0)
+
+    def test_recursive_time_counted_once(self):
+        def recurse(n):
+            return n if n == 0 else counted(n - 1)
+        counted = profiled('test.recurse', enabled=True)(recurse)
+        reset()
+        counted(10)
+        calls, seconds = counters()['test.recurse']
+        assert calls == 11
+        assert seconds < 1  # Counting every level would add up the same time 11 times
+
+    def test_counters_of_ended_threads(self):
+        counted = profiled('test.countdown', enabled=True)(countdown)
+        reset()
+        # One thread per request, like the Flask development server
+        for _ in range(50):
+            thread = threading.Thread(target=counted, args=(2,))
+            thread.start()
+            thread.join()
+        assert counters()['test.countdown'][0] == 50
+        # The ended threads' counters are added up instead of kept apart
+        assert all(thread.is_alive() for thread, _ in profiling._thread_counters)
+        assert profiling._retired['test.countdown'][0] == 50
+        reset()
+        assert counters()['test.countdown'] == (0, 0.0)
+
+    def test_profile(self):
+        with profile() as profiler:
+            countdown(5)
+        assert 'countdown' in format_stats(profiler)
+
+    def test_collapsed_stacks(self):
+        def outer():
+            for _ in range(10):
+                countdown(2)
+        with StackRecorder() as recorder:
+            outer()
+        stacks = dict(line.rsplit(' ', 1) for line in recorder.collapsed().splitlines())
+        assert 'profiling_test.py:outer;profiling_test.py:countdown;profiling_test.py:countdown' in stacks
+        assert all(int(microseconds) >= 1 for microseconds in stacks.values())
+
+    def test_middleware(self):
+        def wsgi_app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/html')])
+            return [str(countdown(3)).encode()]
+        app = ProfilerMiddleware(wsgi_app)
+        statuses = []
+
+        def start_response(status, headers, exc_info=None):
+            statuses.append(status)
+
+        # Without ?profile= the request is passed through
+        assert app({'QUERY_STRING': 'seed=1'}, start_response) == [b'0']
+        body = b''.join(app({'QUERY_STRING': 'seed=1&profile=pstats'}, start_response)).decode()
+        assert 'countdown' in body
+        body = b''.join(app({'QUERY_STRING': 'profile=collapsed'}, start_response)).decode()
+        assert 'wsgi_app;profiling_test.py:countdown' in body
+        assert statuses == ['200 OK'] * 3
+
+
+if __name__ == '__main__':
+    unittest.main()
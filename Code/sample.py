@@ -1,14 +1,15 @@
 from histogram import histogram
+from sampling import WeightedChoice
 import sys
-import random
 
 
-def sample(hist: histogram) -> str:
+def sample(hist: histogram, rng=None) -> str:
     """
     Takes a histogram and returns a single word at random, weighted by the frequency of the word.
 
     Args:
         hist (histogram): A histogram where keys are words and values are the number of times each word appears.
+        rng (optional): A random.Random or numpy.random.Generator to sample with. Defaults to the random module.
 
     Returns:
         str: Single random word.
@@ -19,19 +20,21 @@ def sample(hist: histogram) -> str:
     # Get all the weights (values/frequencies)
     weights = list(hist.values())
 
-    # Use random.choices(), which allows weights
-    random_word = random.choices(words, weights=weights, k=1)[0]
+    # Draw one word by weight, with the given rng so a seeded one replays the same word
+    random_word = WeightedChoice(words, weights).sample(rng)
 
     return random_word
 
 
-def tally_samples(hist: dict, num_samples: int) -> dict:
+def tally_samples(hist: dict, num_samples: int, rng=None) -> dict:
     """
     Takes a histogram and samples words a specified number of times, tallying the frequency of each word.
 
     Args:
         hist (dict): A histogram where keys are words and values are the number of times each word appears.
         num_samples (int): The number of times to run the sample function.
+        rng (optional): A random.Random or numpy.random.Generator to sample with.
+            Defaults to a shared NumPy generator, or the random module without NumPy.
 
     Returns:
         dict: A dictionary where keys are words and values are the number of times each word was sampled.
@@ -39,9 +42,10 @@ def tally_samples(hist: dict, num_samples: int) -> dict:
     # Initialize a dictionary with all words/keys, set all counts/values to 0
     tally = {word: 0 for word in hist.keys()}
 
-    # Sample the histogram num_samples times and tally the results
-    for _ in range(num_samples):
-        word = sample(hist)
+    # Sample the histogram num_samples times in one batch and tally the results
+    words = list(hist.keys())
+    weights = list(hist.values())
+    for word in WeightedChoice(words, weights).sample_many(num_samples, rng):
         tally[word] += 1
 
     return tally
@@ -0,0 +1,125 @@
+"""Helpers for drawing weighted random samples from word frequency counts."""
+from bisect import bisect_right
+from itertools import accumulate
+import random
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional, the random module is the fallback
+    numpy = None
+
+# Shared NumPy generator used when no rng is given, created on first use
+_default_generator = None
+
+
+def build_alias_table(weights: list) -> tuple:
+    """
+    Build a Walker/Vose alias table so a weighted random index can be drawn in O(1) time.
+
+    Args:
+        weights (list): Positive integer weights (frequency counts), one per outcome.
+
+    Returns:
+        tuple: (probabilities, aliases) where probabilities[i] is the chance of keeping outcome i
+            once column i is picked, and aliases[i] is the outcome to return otherwise.
+    """
+    n = len(weights)
+    total = sum(weights)
+    # Scale each weight so the average column holds exactly 1.0
+    scaled = [weight * n / total for weight in weights]
+    probabilities = [1.0] * n
+    aliases = list(range(n))
+
+    # Split the columns into those under and over the average height
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+    # Fill every small column up to 1.0 with probability taken from a large column
+    while small and large:
+        less = small.pop()
+        more = large.pop()
+        probabilities[less] = scaled[less]
+        aliases[less] = more
+        scaled[more] = (scaled[more] + scaled[less]) - 1.0
+        if scaled[more] < 1.0:
+            small.append(more)
+        else:
+            large.append(more)
+
+    # Anything left over is 1.0 up to floating point error, so it keeps itself
+    return probabilities, aliases
+
+
+def make_rng(seed=None, counter_based=False):
+    """
+    Create a random number generator to pass as the rng argument of the sampling functions.
+
+    Args:
+        seed (optional): Seed for a reproducible sequence. Defaults to fresh operating system entropy.
+        counter_based (bool, optional): Return a NumPy Generator on a Philox counter-based bit generator,
+            which is cheap to create and can be split into independent streams with spawn.
+            Needs NumPy. Defaults to False, a random.Random instance.
+
+    Returns:
+        random.Random or numpy.random.Generator: The new generator.
+    """
+    if counter_based:
+        if numpy is None:
+            raise ImportError('counter-based generators need NumPy')
+        return numpy.random.Generator(numpy.random.Philox(seed))
+    return random.Random(seed)
+
+
+def default_generator():
+    """Return the NumPy generator shared by every batch draw that is not given its own rng."""
+    global _default_generator
+    if _default_generator is None:
+        _default_generator = numpy.random.default_rng()
+    return _default_generator
+
+
+class WeightedChoice(object):
+    """Words with the running totals of their weights, to draw words by weight one at a time or in batches."""
+
+    def __init__(self, words: list, weights: list):
+        """Initialize this choice from the given words and their positive integer weights."""
+        self.words = words
+        self.cumulative = list(accumulate(weights))  # Sum of the weights up to and including each word
+        self._cumulative_array = None  # NumPy copy of cumulative, made on the first batch draw
+
+    def sample(self, rng=None):
+        """Return one word, chosen with probability proportional to its weight, using a binary search."""
+        random_value = (random if rng is None else rng).random()
+        return self.words[bisect_right(self.cumulative, random_value * self.cumulative[-1])]
+
+    def sample_many(self, k: int, rng=None, as_indices=False):
+        """
+        Draw k words at once, each chosen with probability proportional to its weight.
+
+        Args:
+            k (int): Number of words to draw.
+            rng (optional): A numpy.random.Generator or random.Random to draw with.
+                Defaults to a shared NumPy generator, or the random module without NumPy.
+            as_indices (bool, optional): Return indices into words instead of the words.
+
+        Returns:
+            list or numpy.ndarray: The k drawn words, or their indices.
+        """
+        total = self.cumulative[-1]
+        if numpy is not None and not isinstance(rng, random.Random):
+            if rng is None:
+                rng = default_generator()
+            if self._cumulative_array is None:
+                self._cumulative_array = numpy.array(self.cumulative, dtype=numpy.int64)
+            # One vectorized binary search for all k draws
+            indices = numpy.searchsorted(self._cumulative_array, rng.random(k) * total, side='right')
+            if as_indices:
+                return indices
+            return [self.words[index] for index in indices.tolist()]
+
+        if rng is None:
+            rng = random
+        indices = [bisect_right(self.cumulative, rng.random() * total) for _ in range(k)]
+        if as_indices:
+            return indices
+        return [self.words[index] for index in indices]
@@ -0,0 +1,167 @@
+"""Scores how likely a sentence is under a Markov chain, to rank generated sentences against each other."""
+import json
+import math
+import random
+import timeit
+
+from markov_array import ArrayMarkovChain, build_markov_chain
+from sampling import numpy
+
+# Log-probability charged for each transition the chain has never seen, that is a word that never
+# followed its state or a state that is not in the chain. A fixed charge keeps scores finite, so a
+# sentence with one unseen step still ranks above one with two.
+UNSEEN_LOG_PROBABILITY = math.log(1e-6)
+
+
+def score(markov_chain, tokens: list, unseen=UNSEEN_LOG_PROBABILITY) -> float:
+    """
+    Return the log-probability of a sentence under a Markov chain, given its first `order` words.
+
+    Args:
+        markov_chain: Any chain engine: a MarkovChain, a compacted one, a TrieMarkovChain or an ArrayMarkovChain.
+        tokens (list): The words of the sentence as they appear in the corpus, like the result of walk.
+        unseen (float, optional): Log-probability of each transition the chain has never seen.
+            Defaults to UNSEEN_LOG_PROBABILITY.
+
+    Returns:
+        float: The sum of the natural log of the probability of each word after the first `order`.
+    """
+    if isinstance(markov_chain, ArrayMarkovChain):
+        return _score_array(markov_chain, tokens, unseen)
+
+    order = markov_chain.order
+    log_probability = 0.0
+    state = tuple(tokens[:order])
+    for next_word in tokens[order:]:
+        histogram = markov_chain.get(state)
+        count = 0 if histogram is None else histogram.frequency(next_word)
+        if count:
+            # Dictogram keeps the total count of each state, so no sum is needed
+            log_probability += math.log(count) - math.log(histogram.tokens)
+        else:
+            log_probability += unseen
+        state = state[1:] + (next_word,)
+    return log_probability
+
+
+def _score_array(markov_chain: ArrayMarkovChain, tokens: list, unseen: float) -> float:
+    """Return the score of one sentence under an array-backed chain, following edges from state to state."""
+    order = markov_chain.order
+    word_ids = markov_chain.word_ids
+    log_probabilities = markov_chain.log_probabilities()
+    next_states = markov_chain.next_states
+
+    log_probability = 0.0
+    state = markov_chain.state_index(tokens[:order])
+    for position in range(order, len(tokens)):
+        word_id = word_ids.get(tokens[position], -1)
+        edge = -1 if state == -1 or word_id == -1 else markov_chain.find_edge(state, word_id)
+        if edge != -1:
+            log_probability += log_probabilities[edge]
+            state = next_states[edge]
+        else:
+            log_probability += unseen
+            # The walk fell off the chain, so look the next state up from its words
+            state = markov_chain.state_index(tokens[position - order + 1:position + 1])
+    return log_probability
+
+
+def score_many(markov_chain, sentences: list, unseen=UNSEEN_LOG_PROBABILITY) -> list:
+    """
+    Return the score of each sentence, see score. With NumPy, all the sentences of an array-backed chain
+    are scored at once with vectorized lookups.
+
+    Args:
+        markov_chain: Any chain engine.
+        sentences (list): Lists of words, one per sentence.
+        unseen (float, optional): Log-probability of each transition the chain has never seen.
+
+    Returns:
+        list: The log-probability of each sentence, in order.
+    """
+    if isinstance(markov_chain, ArrayMarkovChain) and numpy is not None and len(markov_chain):
+        return _score_many_numpy(markov_chain, sentences, unseen)
+    return [score(markov_chain, tokens, unseen) for tokens in sentences]
+
+
+def _score_many_numpy(markov_chain: ArrayMarkovChain, sentences: list, unseen: float) -> list:
+    """Return the scores of many sentences under an array-backed chain, with every transition looked up at once."""
+    arrays = markov_chain.numpy_arrays()
+    order = markov_chain.order
+    size = len(markov_chain.vocab)
+    if 'edge_keys' not in arrays:
+        # Key each edge by its state index and successor. Edges are sorted by state and then by
+        # successor, so the keys are sorted and one binary search finds any edge.
+        degrees = numpy.diff(arrays['offsets'])
+        arrays['edge_keys'] = (numpy.repeat(numpy.arange(len(degrees), dtype=numpy.int64), degrees) * size
+                               + arrays['successors'])
+        arrays['log_probabilities'] = numpy.frombuffer(markov_chain.log_probabilities(), dtype=numpy.float64)
+
+    # Lay every word of every sentence end to end, with -1 for words not in the chain
+    word_ids = markov_chain.word_ids
+    ids = numpy.array([word_ids.get(word, -1) for tokens in sentences for word in tokens], dtype=numpy.int64)
+    lengths = numpy.array([len(tokens) for tokens in sentences], dtype=numpy.int64)
+    sentence_of_word = numpy.repeat(numpy.arange(len(sentences)), lengths)
+    first_words = numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+
+    # Every word after the first `order` of its sentence is one transition
+    positions = numpy.nonzero(numpy.arange(len(ids)) - first_words >= order)[0]
+    next_ids = ids[positions]
+    known = next_ids >= 0
+    state_keys = numpy.zeros(len(positions), dtype=numpy.int64)
+    for offset in range(order, 0, -1):
+        previous_ids = ids[positions - offset]
+        known &= previous_ids >= 0
+        state_keys = state_keys * size + previous_ids
+
+    # Find each state, then each edge, keeping only exact matches
+    states = numpy.minimum(numpy.searchsorted(arrays['state_keys'], state_keys),
+                           len(arrays['state_keys']) - 1)
+    known &= arrays['state_keys'][states] == state_keys
+    edge_keys = states * size + next_ids
+    edges = numpy.minimum(numpy.searchsorted(arrays['edge_keys'], edge_keys), len(arrays['edge_keys']) - 1)
+    known &= arrays['edge_keys'][edges] == edge_keys
+
+    log_probabilities = numpy.where(known, arrays['log_probabilities'][edges], unseen)
+    return numpy.bincount(sentence_of_word[positions], weights=log_probabilities,
+                          minlength=len(sentences)).tolist()
+
+
+def best_of(markov_chain, sentences: list, unseen=UNSEEN_LOG_PROBABILITY) -> list:
+    """
+    Return the most likely of several sentences, comparing the average log-probability of their
+    transitions so longer sentences are not penalized for their length.
+
+    Args:
+        markov_chain: Any chain engine.
+        sentences (list): Lists of words, one per sentence.
+        unseen (float, optional): Log-probability of each transition the chain has never seen.
+
+    Returns:
+        list: The words of the best sentence.
+    """
+    order = markov_chain.order
+    scores = score_many(markov_chain, sentences, unseen)
+    best = max(range(len(sentences)),
+               key=lambda index: scores[index] / max(len(sentences[index]) - order, 1))
+    return sentences[best]
+
+
+def benchmark_scoring(markov_chain, sentences: list):
+    """Prints how many sentences per second score_many and score scores."""
+    batch_time = min(timeit.repeat(lambda: score_many(markov_chain, sentences), number=1, repeat=3))
+    single_time = min(timeit.repeat(lambda: [score(markov_chain, tokens) for tokens in sentences],
+                                    number=1, repeat=3))
+    print(f'score_many: {len(sentences) / batch_time:,.0f} sentences/s   '
+          f'score: {len(sentences) / single_time:,.0f} sentences/s')
+
+
+if __name__ == '__main__':
+    with open('cleaned_tokens.json', 'r', encoding='utf-8') as file:
+        cleaned_tokens = json.load(file)
+
+    markov_chain = build_markov_chain(cleaned_tokens)
+    rng = random.Random(0)
+    sentences = [markov_chain.walk(markov_chain.sample_start(rng), 30, rng) for _ in range(50000)]
+    print(' '.join(best_of(markov_chain, sentences[:10])))
+    benchmark_scoring(markov_chain, sentences)
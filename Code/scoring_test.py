@@ -0,0 +1,64 @@
+#!python
+
+from scoring import UNSEEN_LOG_PROBABILITY, _score_many_numpy, best_of, score, score_many
+from compaction import compact_chain
+from markov_chain_second import build_markov_chain
+from markov_trie import build_trie_markov_chain
+import markov_array
+import math
+import sampling
+import unittest
+
+
+class ScoringTest(unittest.TestCase):
+
+    # Test fixtures: a tiny corpus with a few repeated word pairs
+    words = ('one fish two fish red fish blue fish one fish two fish '
+             'red fish. blue fish? one fish').split()
+
+    sentences = [
+        'one fish two fish'.split(),  # ('fish', 'two') is followed by 'fish' every time
+        'two fish red fish blue'.split(),  # ('fish', 'red') is followed by 'fish' half the time
+        'one fish red fish'.split(),  # ('one', 'fish') is never followed by 'red'
+        'croissant fish two'.split(),  # Unknown word in the first state
+        'one fish'.split(),  # No transitions at all
+    ]
+
+    def chains(self):
+        markov_chain = build_markov_chain(self.words)
+        return [markov_chain, compact_chain(markov_chain), build_trie_markov_chain(self.words, 2),
+                markov_array.build_markov_chain(self.words)]
+
+    def test_score(self):
+        for markov_chain in self.chains():
+            # Each known transition adds the log of its probability
+            assert score(markov_chain, self.sentences[0]) == 0.0
+            assert math.isclose(score(markov_chain, self.sentences[1]), math.log(1 / 2))
+            # Unseen transitions cost the penalty, and the walk picks up again after them
+            assert math.isclose(score(markov_chain, self.sentences[2]),
+                                UNSEEN_LOG_PROBABILITY + math.log(1 / 2))
+            assert score(markov_chain, self.sentences[3]) == UNSEEN_LOG_PROBABILITY
+            assert score(markov_chain, self.sentences[3], unseen=-1.0) == -1.0
+            assert score(markov_chain, self.sentences[4]) == 0.0
+
+    def test_score_many(self):
+        for markov_chain in self.chains():
+            scores = score_many(markov_chain, self.sentences)
+            expected = [score(markov_chain, tokens) for tokens in self.sentences]
+            assert all(math.isclose(a, b) for a, b in zip(scores, expected))
+
+    @unittest.skipIf(sampling.numpy is None, 'NumPy is not installed')
+    def test_score_many_numpy(self):
+        markov_chain = markov_array.build_markov_chain(self.words)
+        scores = _score_many_numpy(markov_chain, self.sentences, UNSEEN_LOG_PROBABILITY)
+        expected = [score(markov_chain, tokens) for tokens in self.sentences]
+        assert all(math.isclose(a, b) for a, b in zip(scores, expected))
+        assert _score_many_numpy(markov_chain, [], UNSEEN_LOG_PROBABILITY) == []
+
+    def test_best_of(self):
+        markov_chain = build_markov_chain(self.words)
+        assert best_of(markov_chain, self.sentences[1:3]) == self.sentences[1]
+
+
+if __name__ == '__main__':
+    unittest.main()
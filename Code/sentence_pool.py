@@ -0,0 +1,107 @@
+"""Bounded pool of sentences generated ahead of time by a background thread."""
+from collections import deque
+import os
+import threading
+import time
+
+
+class SentencePool(object):
+    """
+    Keeps up to `depth` sentences ready, so a request can take one in O(1) instead of generating it.
+
+    A daemon thread refills the pool whenever it drops below depth, at most `rate` sentences a second.
+    The thread starts on the first get, in the process that calls it, so a pool created before
+    gunicorn forks its workers gets its own thread and its own sentences in every worker.
+    """
+
+    def __init__(self, generate, depth=64, rate=None):
+        """
+        Initialize an empty pool.
+
+        Args:
+            generate (func): Called with no arguments to make one sentence.
+            depth (int, optional): Most sentences kept ready. 0 turns the pool off, so every get
+                generates inline. Defaults to 64.
+            rate (float, optional): Most sentences the background thread makes per second, to bound
+                the CPU it takes from requests. Defaults to no limit.
+        """
+        self.generate = generate
+        self.depth = depth
+        self.rate = rate
+        self._reset()
+        # Threads and locks do not survive a fork, so a child starts over with an empty pool
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        """Forget the sentences, counters and thread, as in a new pool."""
+        self.sentences = deque()
+        self.hits = 0  # Sentences taken from the pool
+        self.misses = 0  # Sentences generated inline because the pool was empty
+        self.generated = 0  # Sentences made by the background thread
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def __len__(self):
+        """Return the number of sentences ready."""
+        return len(self.sentences)
+
+    def start(self):
+        """Start the background thread if it is not running yet."""
+        with self._condition:
+            if self.depth <= 0 or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._refill, name='sentence-pool', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the background thread, waiting up to timeout seconds for it to finish its sentence."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _refill(self):
+        """Generate sentences whenever the pool is below depth, until stop is called."""
+        while True:
+            with self._condition:
+                while len(self.sentences) >= self.depth and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+            # Generate outside the lock, so requests can take sentences meanwhile
+            sentence = self.generate()
+            with self._condition:
+                self.sentences.append(sentence)
+                self.generated += 1
+            if self.rate:
+                time.sleep(1 / self.rate)
+
+    def get(self):
+        """Return a sentence from the pool, or generate one inline if the pool is empty."""
+        self.start()
+        with self._condition:
+            if self.sentences:
+                self.hits += 1
+                self._condition.notify()  # Wake the refill thread for the free slot
+                return self.sentences.popleft()
+            self.misses += 1
+        return self.generate()
+
+    def stats(self) -> dict:
+        """Return the pool's settings, how full it is, and its hit and miss counts."""
+        requests = self.hits + self.misses
+        return {
+            'depth': self.depth,
+            'rate': self.rate,
+            'size': len(self.sentences),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'generated': self.generated,
+            'running': self._thread is not None and self._thread.is_alive(),
+        }
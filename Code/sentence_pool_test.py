@@ -0,0 +1,85 @@
+#!python
+
+from sentence_pool import SentencePool
+from itertools import count
+import threading
+import time
+import unittest
+
+
+class SentencePoolTest(unittest.TestCase):
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            assert time.monotonic() < deadline, 'timed out'
+            time.sleep(0.001)
+
+    def test_fills_to_depth(self):
+        numbers = count()
+        pool = SentencePool(lambda: 'sentence {}'.format(next(numbers)), depth=5)
+        try:
+            # The first get starts the thread, and generates inline while the pool is empty
+            assert pool.get().startswith('sentence')
+            self.wait_for(lambda: len(pool) == 5)
+            time.sleep(0.01)
+            assert len(pool) == 5  # Never more than depth
+            # Sentences come out in the order they were made, and are topped up again
+            first = pool.get()
+            second = pool.get()
+            assert int(first.split()[1]) < int(second.split()[1])
+            self.wait_for(lambda: len(pool) == 5)
+            stats = pool.stats()
+            # The first get is a hit only if the thread beat it to the lock
+            assert stats['hits'] >= 2
+            assert stats['misses'] + stats['hits'] == 3
+            assert stats['running']
+        finally:
+            pool.stop(timeout=5)
+        assert not pool.stats()['running']
+
+    def test_disabled(self):
+        pool = SentencePool(lambda: 'inline', depth=0)
+        assert pool.get() == 'inline'
+        assert pool.stats() == {'depth': 0, 'rate': None, 'size': 0, 'hits': 0, 'misses': 1,
+                                'hit_rate': 0.0, 'generated': 0, 'running': False}
+
+    def test_rate_limit(self):
+        pool = SentencePool(lambda: 'slow', depth=100, rate=50)
+        try:
+            pool.start()
+            time.sleep(0.2)
+            # About 10 sentences in 0.2 seconds at 50 a second, far from the depth
+            assert 1 <= pool.stats()['generated'] <= 20
+        finally:
+            pool.stop(timeout=5)
+
+    def test_concurrent_gets(self):
+        numbers = count()
+        lock = threading.Lock()
+
+        def generate():
+            with lock:
+                return next(numbers)
+
+        pool = SentencePool(generate, depth=20)
+        taken = []
+        try:
+            def take():
+                for _ in range(200):
+                    taken.append(pool.get())
+            threads = [threading.Thread(target=take) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            pool.stop(timeout=5)
+        # Every sentence is handed out once
+        assert len(taken) == len(set(taken)) == 800
+        stats = pool.stats()
+        assert stats['hits'] + stats['misses'] == 800
+
+
+if __name__ == '__main__':
+    unittest.main()
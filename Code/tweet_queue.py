@@ -0,0 +1,229 @@
+"""Queue of statuses to publish, sent by a background thread that retries failures with backoff."""
+import http.client
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+class PublishError(Exception):
+    """Raised by a publisher when a status could not be published."""
+
+    def __init__(self, message, status_code=None):
+        super(PublishError, self).__init__(message)
+        self.status_code = status_code  # HTTP status of the response, or None if there was none
+
+    @property
+    def retryable(self) -> bool:
+        """Return True if trying again later could work: no response at all, rate limiting, or a server error."""
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+
+class HTTPPublisher(object):
+    """
+    Publisher that POSTs each status as JSON to a URL over one persistent connection, which it opens
+    again after an error. It is only called from the queue's thread, so the connection is never shared.
+    """
+
+    def __init__(self, url, timeout=10.0, headers=None):
+        """Initialize a publisher for the given URL, waiting at most timeout seconds for each response."""
+        parts = urlsplit(url)
+        self.connection_class = (http.client.HTTPSConnection if parts.scheme == 'https'
+                                 else http.client.HTTPConnection)
+        self.host = parts.netloc
+        self.path = parts.path or '/'
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/json'}
+        self.headers.update(headers or {})
+        self.connection = None
+
+    def __call__(self, status):
+        """Publish one status and return the response body, or raise PublishError."""
+        if self.connection is None:
+            self.connection = self.connection_class(self.host, timeout=self.timeout)
+        try:
+            self.connection.request('POST', self.path, json.dumps({'text': status}), self.headers)
+            response = self.connection.getresponse()
+            body = response.read().decode('utf-8', 'replace')
+        except (OSError, http.client.HTTPException) as error:
+            self.close()
+            raise PublishError(str(error)) from error
+        if response.status >= 400:
+            raise PublishError('HTTP {}: {}'.format(response.status, body), response.status)
+        return body
+
+    def close(self):
+        """Close the connection, a new one is opened by the next call."""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class TweetQueue(object):
+    """
+    Bounded queue of statuses that a daemon thread publishes in order.
+
+    The thread takes up to batch_size statuses at a time and sends them back to back on the publisher's
+    connection. A status can also be a function that makes it, called on the thread right before it is
+    sent, so slow work such as generating the status never holds up the caller of submit. A status that fails with a retryable PublishError is tried again after a backoff that
+    doubles each time, up to max_retries times, before the next one is sent. Like SentencePool, the
+    thread starts on first use in the process that uses it.
+    """
+
+    def __init__(self, publish, max_size=1000, batch_size=10, max_retries=5, backoff=1.0, max_backoff=60.0):
+        """
+        Initialize an empty queue.
+
+        Args:
+            publish (func): Called with each status; raises PublishError if it fails.
+            max_size (int, optional): Most statuses waiting at once; submit drops the rest. Defaults to 1000.
+            batch_size (int, optional): Most statuses taken from the queue at a time. Defaults to 10.
+            max_retries (int, optional): Retries of each status before giving up on it. Defaults to 5.
+            backoff (float, optional): Seconds to wait before the first retry. Defaults to 1.
+            max_backoff (float, optional): Longest wait between retries, in seconds. Defaults to 60.
+        """
+        self.publish = publish
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._reset()
+        # Threads and locks do not survive a fork, so a child starts over with an empty queue
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        """Forget the statuses, counters and thread, as in a new queue."""
+        self.statuses = queue.Queue(self.max_size)  # (status, time submitted) pairs
+        self.submitted = 0  # Statuses accepted by submit
+        self.dropped = 0  # Statuses refused by submit because the queue was full
+        self.published = 0  # Statuses published
+        self.failed = 0  # Statuses given up on
+        self.skipped = 0  # Status functions that returned None, so there was nothing to publish
+        self.retries = 0  # Failed attempts that were tried again
+        self.total_latency = 0.0  # Seconds from submit to publish, summed over published statuses
+        self.max_latency = 0.0  # Longest of those
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        """Return the number of statuses waiting to be published."""
+        return self.statuses.qsize()
+
+    def start(self):
+        """Start the background thread if it is not running yet."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='tweet-queue', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the background thread once it has sent the batch it took, leaving the rest queued.
+        A status waiting for a retry is given up on."""
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def submit(self, status) -> bool:
+        """Queue a status to be published and return True, or return False if the queue is full.
+        The status can be a function that returns it, or None to skip it, called on the queue's thread."""
+        self.start()
+        try:
+            self.statuses.put_nowait((status, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def join(self):
+        """Wait until every queued status has been published or given up on."""
+        self.statuses.join()
+
+    def _run(self):
+        """Publish batches of statuses until stop is called."""
+        while not self._stopping.is_set():
+            try:
+                batch = [self.statuses.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.statuses.get_nowait())
+                except queue.Empty:
+                    break
+            for status, submitted in batch:
+                try:
+                    self._publish(status, submitted)
+                finally:
+                    self.statuses.task_done()
+
+    def _publish(self, status, submitted):
+        """Make the status if it is a function, then publish it, retrying with exponential backoff and jitter while the error is retryable.
+        Any other exception gives up on the status, so a faulty publisher never stops the thread."""
+        if callable(status):
+            try:
+                status = status()
+            except Exception:
+                logger.exception('Giving up on a status the status function failed on: %r', status)
+                with self._lock:
+                    self.failed += 1
+                return
+            if status is None:
+                with self._lock:
+                    self.skipped += 1
+                return
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.publish(status)
+            except PublishError as error:
+                if not error.retryable or attempt == self.max_retries:
+                    break
+                with self._lock:
+                    self.retries += 1
+                delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+                # Wait between half and all of the delay, so workers don't retry in lockstep
+                if self._stopping.wait(delay * random.uniform(0.5, 1.0)):
+                    break
+            except Exception:
+                logger.exception('Giving up on a status the publisher failed on: %r', status)
+                break
+            else:
+                latency = time.monotonic() - submitted
+                with self._lock:
+                    self.published += 1
+                    self.total_latency += latency
+                    self.max_latency = max(self.max_latency, latency)
+                return
+        with self._lock:
+            self.failed += 1
+
+    def stats(self) -> dict:
+        """Return the queue depth, status counts and publish latency in seconds."""
+        with self._lock:
+            return {
+                'depth': len(self),
+                'max_size': self.max_size,
+                'submitted': self.submitted,
+                'dropped': self.dropped,
+                'published': self.published,
+                'failed': self.failed,
+                'skipped': self.skipped,
+                'retries': self.retries,
+                'average_latency': self.total_latency / self.published if self.published else 0.0,
+                'max_latency': self.max_latency,
+                'running': self._thread is not None and self._thread.is_alive(),
+            }
@@ -0,0 +1,242 @@
+#!python
+
+from tweet_queue import HTTPPublisher, PublishError, TweetQueue
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import importlib.util
+import json
+import os
+import threading
+import time
+import unittest
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Stand-in for the tweets endpoint, which records each status and can fail on purpose."""
+
+    protocol_version = 'HTTP/1.1'  # Keep connections open, like the real API
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with server.lock:
+            server.connections.add(self.client_address)
+            server.authorization = self.headers.get('Authorization')
+            if server.failures:
+                code = server.failures.pop(0)
+            else:
+                code = 201
+                server.statuses.append(body['text'])
+        response = json.dumps({'data': {'text': body['text']}}).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass  # Keep the test output quiet
+
+
+class TweetQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.lock = threading.Lock()
+        self.server.statuses = []  # Statuses published, in order
+        self.server.failures = []  # HTTP status codes to answer the next requests with
+        self.server.connections = set()  # Client addresses that posted
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        self.url = 'http://127.0.0.1:{}/2/tweets'.format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_publisher(self):
+        publish = HTTPPublisher(self.url)
+        assert json.loads(publish('one fish'))['data']['text'] == 'one fish'
+        self.server.failures = [403]
+        with self.assertRaises(PublishError) as context:
+            publish('two fish')
+        assert context.exception.status_code == 403
+        assert not context.exception.retryable
+        publish('red fish')
+        assert self.server.statuses == ['one fish', 'red fish']
+        # Every status went over the same connection
+        assert len(self.server.connections) == 1
+        publish.close()
+
+    def test_unreachable_server_is_retryable(self):
+        self.tearDown()
+        with self.assertRaises(PublishError) as context:
+            HTTPPublisher(self.url, timeout=1)('one fish')
+        assert context.exception.retryable
+        self.setUp()
+
+    def test_publishes_in_order(self):
+        publish = HTTPPublisher(self.url)
+        tweet_queue = TweetQueue(publish, batch_size=3)
+        try:
+            started = time.monotonic()
+            for number in range(10):
+                assert tweet_queue.submit('fish {}'.format(number))
+            # Submitting never waits for the server
+            assert time.monotonic() - started < 0.5
+            tweet_queue.join()
+        finally:
+            tweet_queue.stop(timeout=5)
+            publish.close()
+        assert self.server.statuses == ['fish {}'.format(number) for number in range(10)]
+        stats = tweet_queue.stats()
+        assert stats['submitted'] == stats['published'] == 10
+        assert stats['depth'] == stats['failed'] == stats['dropped'] == 0
+        assert 0 < stats['average_latency'] <= stats['max_latency']
+
+    def test_retries_with_backoff(self):
+        self.server.failures = [503, 429]
+        publish = HTTPPublisher(self.url)
+        tweet_queue = TweetQueue(publish, backoff=0.01)
+        try:
+            tweet_queue.submit('one fish')  # Fails twice, then is published
+            tweet_queue.submit('two fish')
+            tweet_queue.join()
+        finally:
+            tweet_queue.stop(timeout=5)
+            publish.close()
+        assert self.server.statuses == ['one fish', 'two fish']
+        stats = tweet_queue.stats()
+        assert stats['retries'] == 2
+        assert stats['published'] == 2
+        assert stats['failed'] == 0
+
+    def test_does_not_retry_client_errors(self):
+        self.server.failures = [400]
+        publish = HTTPPublisher(self.url)
+        tweet_queue = TweetQueue(publish, backoff=0.01)
+        try:
+            tweet_queue.submit('one fish')  # Rejected for good
+            tweet_queue.submit('two fish')
+            tweet_queue.join()
+        finally:
+            tweet_queue.stop(timeout=5)
+            publish.close()
+        assert self.server.statuses == ['two fish']
+        assert tweet_queue.stats()['retries'] == 0
+        assert tweet_queue.stats()['failed'] == 1
+
+    def test_gives_up_after_max_retries(self):
+        self.server.failures = [500] * 3
+        publish = HTTPPublisher(self.url)
+        tweet_queue = TweetQueue(publish, max_retries=2, backoff=0.01)
+        try:
+            tweet_queue.submit('one fish')
+            tweet_queue.join()
+        finally:
+            tweet_queue.stop(timeout=5)
+            publish.close()
+        assert self.server.statuses == []
+        assert tweet_queue.stats()['failed'] == 1
+        assert tweet_queue.stats()['retries'] == 2
+
+    def test_publisher_exception_does_not_stop_queue(self):
+        published = []
+
+        def faulty_publish(status):
+            if status == 'bad fish':
+                raise ValueError('not a status')
+            published.append(status)
+
+        tweet_queue = TweetQueue(faulty_publish, batch_size=3)
+        try:
+            with self.assertLogs('tweet_queue', 'ERROR'):
+                for status in ('one fish', 'bad fish', 'two fish'):
+                    tweet_queue.submit(status)
+                tweet_queue.join()  # Returns even though a status failed
+            # The rest of the batch, and later statuses, are still published
+            tweet_queue.submit('red fish')
+            tweet_queue.join()
+        finally:
+            tweet_queue.stop(timeout=5)
+        assert published == ['one fish', 'two fish', 'red fish']
+        stats = tweet_queue.stats()
+        assert stats['failed'] == 1
+        assert stats['published'] == 3
+        assert stats['running'] is False
+
+    @unittest.skipIf(importlib.util.find_spec('requests_oauthlib') is None, 'requests-oauthlib is not installed')
+    def test_twitter_publish(self):
+        import twitter
+        environment = {'TWITTER_API_URL': self.url, 'TWITTER_CONSUMER_KEY': 'key',
+                       'TWITTER_CONSUMER_SECRET': 'secret', 'TWITTER_ACCESS_TOKEN': 'token',
+                       'TWITTER_ACCESS_TOKEN_SECRET': 'token secret'}
+        # Start from a fresh session, so it picks up the stand-in server's URL
+        with mock.patch.dict(os.environ, environment), mock.patch.object(twitter, 'session', None), \
+                mock.patch.object(twitter, 'url', twitter.url):
+            tweet_queue = TweetQueue(twitter.publish, backoff=0.01)
+            try:
+                self.server.failures = [503]
+                tweet_queue.submit('one fish')  # Retried once, then published
+                tweet_queue.join()
+                self.server.failures = [403]
+                with self.assertRaises(PublishError) as context:
+                    twitter.publish('two fish')
+                assert context.exception.status_code == 403
+                assert not context.exception.retryable
+            finally:
+                tweet_queue.stop(timeout=5)
+                twitter.session.close()
+        assert self.server.statuses == ['one fish']
+        assert tweet_queue.stats()['retries'] == 1
+        assert tweet_queue.stats()['published'] == 1
+        # Each request was signed with the credentials
+        assert self.server.authorization.startswith('OAuth ')
+        assert 'oauth_consumer_key="key"' in self.server.authorization
+
+    def test_status_functions(self):
+        published = []
+        caller = threading.current_thread()
+        threads = []
+
+        def make_status():
+            # Made on the queue's thread, not the caller's
+            threads.append(threading.current_thread())
+            return 'one fish'
+
+        def fail():
+            raise ValueError('no fish')
+
+        tweet_queue = TweetQueue(published.append)
+        try:
+            with self.assertLogs('tweet_queue', 'ERROR'):
+                for status in (make_status, lambda: None, fail, 'two fish'):
+                    assert tweet_queue.submit(status)
+                tweet_queue.join()
+        finally:
+            tweet_queue.stop(timeout=5)
+        assert published == ['one fish', 'two fish']
+        assert threads and caller not in threads
+        stats = tweet_queue.stats()
+        assert (stats['published'], stats['skipped'], stats['failed']) == (2, 1, 1)
+
+    def test_drops_when_full(self):
+        release = threading.Event()
+
+        def slow_publish(status):
+            release.wait(5)
+
+        tweet_queue = TweetQueue(slow_publish, max_size=2, batch_size=1)
+        try:
+            results = [tweet_queue.submit('fish {}'.format(number)) for number in range(6)]
+            # One status is being sent, two wait, and the rest are dropped
+            assert results.count(False) >= 3
+            assert tweet_queue.stats()['dropped'] == results.count(False)
+            release.set()
+            tweet_queue.join()
+        finally:
+            tweet_queue.stop(timeout=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
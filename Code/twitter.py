@@ -1,22 +1,17 @@
-from requests_oauthlib import OAuth1Session
+from tweet_queue import PublishError
 import os
-import dotenv               # Always near the top!
-dotenv.load_dotenv('.env')  # Load environment variables ASAP.
+import threading
 
 
-consumer_key = os.environ.get('TWITTER_CONSUMER_KEY')
-consumer_secret = os.environ.get('TWITTER_CONSUMER_SECRET')
-access_token = os.environ.get('TWITTER_ACCESS_TOKEN')
-access_token_secret = os.environ.get('TWITTER_ACCESS_TOKEN_SECRET')
-
+# The URL endpoint to update a status (i.e. tweet), unless TWITTER_API_URL points at a stand-in server
+url = 'https://api.x.com/2/tweets'
 
-session = OAuth1Session(consumer_key,
-                        client_secret=consumer_secret,
-                        resource_owner_key=access_token,
-                        resource_owner_secret=access_token_secret)
+# Seconds to wait for the API to respond
+TIMEOUT = 10
 
-# The URL endpoint to update a status (i.e. tweet)
-url = 'https://api.x.com/2/tweets'
+# OAuth session, created by the first tweet so importing this module stays cheap
+session = None
+_session_lock = threading.Lock()
 
 # The contents of status (i.e. tweet text)
 # status = 'If you are reading this on Twitter, the API request worked!'
@@ -28,6 +23,47 @@ url = 'https://api.x.com/2/tweets'
 # print(resp.text)
 
 
+def get_session():
+    """Return the OAuth session, loading the credentials from .env and creating it on first use."""
+    global session, url
+    if session is None:
+        with _session_lock:
+            if session is None:
+                # Import the HTTP and OAuth libraries only once a tweet is actually sent
+                import dotenv
+                from requests.adapters import HTTPAdapter
+                from requests_oauthlib import OAuth1Session
+                dotenv.load_dotenv('.env')  # Load environment variables before reading them.
+
+                consumer_key = os.environ.get('TWITTER_CONSUMER_KEY')
+                consumer_secret = os.environ.get('TWITTER_CONSUMER_SECRET')
+                access_token = os.environ.get('TWITTER_ACCESS_TOKEN')
+                access_token_secret = os.environ.get('TWITTER_ACCESS_TOKEN_SECRET')
+                url = os.environ.get('TWITTER_API_URL', url)
+
+                new_session = OAuth1Session(consumer_key,
+                                            client_secret=consumer_secret,
+                                            resource_owner_key=access_token,
+                                            resource_owner_secret=access_token_secret)
+                # Keep a few connections open for reuse, retrying is left to the tweet queue
+                new_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0))
+                new_session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0))
+                session = new_session
+    return session
+
+
 def tweet(status):
-    resp = session.post(url, json={'text': status})
+    resp = get_session().post(url, json={'text': status}, timeout=TIMEOUT)
+    return resp.text
+
+
+def publish(status):
+    """Post a status like tweet, raising PublishError if the request fails, for use with TweetQueue."""
+    from requests.exceptions import RequestException
+    try:
+        resp = get_session().post(url, json={'text': status}, timeout=TIMEOUT)
+    except RequestException as error:
+        raise PublishError(str(error)) from error
+    if resp.status_code >= 400:
+        raise PublishError('HTTP {}: {}'.format(resp.status_code, resp.text), resp.status_code)
     return resp.text
@@ -0,0 +1,129 @@
+"""Measures how much memory each forked worker holds for the Markov chain (Linux only)."""
+import gc
+import json
+import os
+import random
+import signal
+import sys
+
+import markov_array
+import markov_chain_second
+
+# Fields of /proc/<pid>/smaps_rollup to report, all in kilobytes
+MEMORY_FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+
+
+def resident_memory(pid=None) -> dict:
+    """
+    Reads the resident memory of a process from /proc.
+
+    Args:
+        pid (int, optional): The process to measure. Defaults to the current process.
+
+    Returns:
+        dict: Kilobytes per field, keyed by lowercase name ('rss', 'pss', 'private_dirty', ...).
+            Only 'rss' is available on kernels without smaps_rollup.
+    """
+    pid = os.getpid() if pid is None else pid
+    memory = {}
+    try:
+        with open('/proc/{}/smaps_rollup'.format(pid)) as file:
+            for line in file:
+                fields = line.split()
+                if fields[0].rstrip(':') in MEMORY_FIELDS:
+                    memory[fields[0].rstrip(':').lower()] = int(fields[1])
+    except FileNotFoundError:
+        # Older kernels only have the total resident set size
+        with open('/proc/{}/status'.format(pid)) as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    memory['rss'] = int(line.split()[1])
+    return memory
+
+
+def measure_workers(load_chain, walk, start_states, workers=4, preload=False) -> list:
+    """
+    Forks worker processes that each generate sentences, like gunicorn workers, and measures them.
+
+    Args:
+        load_chain (func): Returns the chain to generate from.
+        walk (func): random_walk function of the chain's engine.
+        start_states (list): States to start the sentences from.
+        workers (int, optional): Number of workers to fork. Defaults to 4.
+        preload (bool, optional): Load the chain once in this process and freeze it before forking,
+            like gunicorn's preload_app, instead of loading it in every worker. Defaults to False.
+
+    Returns:
+        list: resident_memory() of each worker, measured while all workers are alive.
+    """
+    markov_chain = None
+    if preload:
+        markov_chain = load_chain()
+        gc.freeze()
+
+    children = []
+    for _ in range(workers):
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            if markov_chain is None:
+                markov_chain = load_chain()
+            # Serve some requests so the worker touches the chain like a real one
+            for _ in range(2000):
+                walk(markov_chain, random.choice(start_states), 30)
+            gc.collect()
+            os.write(write_end, json.dumps(resident_memory()).encode('utf-8'))
+            os.close(write_end)
+            signal.pause()  # Stay alive until every worker has been measured
+            os._exit(0)
+        os.close(write_end)
+        children.append((pid, read_end))
+
+    reports = []
+    for pid, read_end in children:
+        with os.fdopen(read_end, 'rb') as pipe:
+            reports.append(json.loads(pipe.read().decode('utf-8')))
+    for pid, _ in children:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+    if preload:
+        gc.unfreeze()
+    return reports
+
+
+def print_report(name: str, reports: list):
+    """Prints the average resident memory per worker in megabytes."""
+    def average(field):
+        return sum(report.get(field, 0) for report in reports) / len(reports) / 1024
+    print(f'{name:<28} RSS {average("rss"):6.1f} MB   PSS {average("pss"):6.1f} MB   '
+          f'private {average("private_clean") + average("private_dirty"):6.1f} MB')
+
+
+if __name__ == '__main__':
+    corpus_path = sys.argv[1] if len(sys.argv) > 1 else 'cleaned_tokens.json'
+    snapshot_path = corpus_path.rsplit('.', 1)[0] + '.chain'
+    with open(corpus_path, 'r', encoding='utf-8') as file:
+        start_states = list(zip(*[iter(json.load(file)[:400])] * 2))
+
+    def load_tokens():
+        with open(corpus_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    # Make sure an up to date snapshot exists before any worker maps it
+    fingerprint = markov_array.corpus_fingerprint(corpus_path)
+    markov_array.save_markov_chain(markov_array.build_markov_chain(load_tokens()),
+                                   snapshot_path, fingerprint)
+
+    engines = [
+        ('dict chain', lambda: markov_chain_second.build_second_order_markov_chain(load_tokens()),
+         markov_chain_second.random_walk),
+        ('array chain', lambda: markov_array.build_markov_chain(load_tokens()),
+         markov_array.random_walk),
+        ('mmap snapshot', lambda: markov_array.load_markov_chain(snapshot_path, fingerprint),
+         markov_array.random_walk),
+    ]
+    for name, load_chain, walk in engines:
+        for preload in (False, True):
+            reports = measure_workers(load_chain, walk, start_states, preload=preload)
+            print_report(name + (', preloaded' if preload else ''), reports)